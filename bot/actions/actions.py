@@ -2,46 +2,49 @@ from bot.replies import replies
 from common import log, utils
 from common.enums import ContentType
 from database import mongo
-from database.dbutils import dbutils
+from database.dbutils import adbutils
 from cron_descriptor import get_description
 from teleapi import endpoints as teleapi
 from telegram import Update
 from bot.actions import permissions
 from bot.actions.readonly import *
 from bot.actions.removals import *
-from typing import Dict, Tuple, Optional, Any
+from typing import Dict, List, Tuple, Optional, Any
+
+
+JOBNAME_ATTEMPTS = 3
 
 
 async def add_new_job(
     update: Update, context: ContextTypes.DEFAULT_TYPE
 ) -> Optional[Exception]:
-    db_service = mongo.MongoService(update)
+    db_service = await adbutils.connect(update)
     rights = await permissions.check_rights(update, context, db_service)
     if not rights:
         return Exception()
 
     # timezone must be defined in order to create new job
-    chat_entry = dbutils.find_chat_by_chatid(db_service, update.message.chat.id)
+    chat_entry = await adbutils.find_chat_by_chatid(db_service, update.message.chat.id)
     if chat_entry is None:
         await replies.send_start_message(update)
         return Exception()
 
     # person limit
     user_id = update.message.from_user.id
-    job_count, user_limit = dbutils.get_user_limit(db_service, user_id)
+    job_count, user_limit = await adbutils.get_user_limit(db_service, user_id)
     if job_count >= user_limit:
         await replies.send_exceed_limit_error_message(update, user_limit)
         return Exception()
 
     # check name does not already exist
     chat_id = update.message.chat.id
-    if dbutils.entry_exists(db_service, chat_id, update.message.text):
+    if await adbutils.entry_exists(db_service, chat_id, update.message.text):
         await replies.send_invalid_new_job_message(update)
         return Exception()
 
     # add job to db
     msg = update.message
-    dbutils.add_new_entry(
+    added = await adbutils.add_new_entry(
         db_service,
         chat_id=msg.chat.id,
         jobname=msg.text,
@@ -49,6 +52,9 @@ async def add_new_job(
         user_bot_token=chat_entry.get("user_bot_token"),
         message_thread_id=msg.message_thread_id if msg.is_topic_message else None,
     )
+    if not added:  # same name added by a concurrent update
+        await replies.send_invalid_new_job_message(update)
+        return Exception()
     await replies.send_request_text_message(update)
     log.log_new_job_added(update)
 
@@ -68,18 +74,18 @@ async def add_new_channel_job(
         await replies.send_channels_only_error_message(update, forwarded_chat_info.type)
         return Exception()
 
-    db_service = mongo.MongoService(update)
+    db_service = await adbutils.connect(update)
     # timezone must be defined in order to create new job
-    chat_entry = dbutils.find_chat_by_chatid(db_service, chat_id)
+    chat_entry = await adbutils.find_chat_by_chatid(db_service, chat_id)
     if chat_entry is None:
         await replies.send_start_message(update)
         return Exception()
 
     # add chat to db
-    chat_exists = dbutils.chat_exists(db_service, forwarded_chat_info.id)
+    chat_exists = await adbutils.chat_exists(db_service, forwarded_chat_info.id)
     user_id = update.message.from_user.id
     if not chat_exists:
-        dbutils.add_chat_data(
+        await adbutils.add_chat_data(
             db_service,
             chat_id=forwarded_chat_info.id,
             chat_title=forwarded_chat_info.title,
@@ -91,7 +97,7 @@ async def add_new_channel_job(
         )
 
     # add job to db
-    entry = dbutils.find_latest_entry(db_service, chat_id)
+    entry = await adbutils.find_latest_entry(db_service, chat_id)
     photo_group_id = update.message.media_group_id
     photo_group_id = "" if photo_group_id is None else str(photo_group_id)
 
@@ -103,11 +109,11 @@ async def add_new_channel_job(
         photo_id = update.message.photo[-1].file_id
         photo_ids = "{};{}".format(entry.get("photo_id", ""), photo_id)
         payload = {"last_updated_by": user_id, "photo_id": photo_ids}
-        dbutils.update_entry_by_jobname(db_service, entry, payload)
+        await adbutils.update_entry_by_jobname(db_service, entry, payload)
         return
 
     # new job to be created, assert job limit
-    job_count, user_limit = dbutils.get_user_limit(db_service, user_id)
+    job_count, user_limit = await adbutils.get_user_limit(db_service, user_id)
     if job_count >= user_limit:
         await replies.send_exceed_limit_error_message(update, user_limit)
         return Exception()
@@ -129,22 +135,32 @@ async def add_new_channel_job(
 
     photo_id = "" if len(update.message.photo) < 1 else update.message.photo[-1].file_id
 
-    # populate jobname for channels
-    jobname = generate_jobname(db_service, forwarded_chat_info.title[:6], chat_id)
-    dbutils.add_new_entry(
-        db_service,
-        chat_id=chat_id,
-        channel_id=forwarded_chat_info.id,
-        jobname=jobname,
-        user_id=update.message.from_user.id,
-        crontab="",
-        content=content,
-        content_type=content_type,
-        photo_id=photo_id,
-        photo_group_id=photo_group_id,
-        user_bot_token=chat_entry.get("user_bot_token"),
-        message_thread_id=None,
-    )
+    # populate jobname for channels, a name taken by hand since it was allocated
+    # just means allocating the next one
+    added = False
+    for _ in range(JOBNAME_ATTEMPTS):
+        jobname = await generate_jobname(
+            db_service, forwarded_chat_info.title[:6], chat_id
+        )
+        added = await adbutils.add_new_entry(
+            db_service,
+            chat_id=chat_id,
+            channel_id=forwarded_chat_info.id,
+            jobname=jobname,
+            user_id=update.message.from_user.id,
+            crontab="",
+            content=content,
+            content_type=content_type,
+            photo_id=photo_id,
+            photo_group_id=photo_group_id,
+            user_bot_token=chat_entry.get("user_bot_token"),
+            message_thread_id=None,
+        )
+        if added:
+            break
+    if not added:
+        await replies.send_invalid_new_job_message(update)
+        return Exception()
 
     log.log_new_channel_job_added(update)
     await replies.send_request_crontab_message(update)
@@ -153,14 +169,14 @@ async def add_new_channel_job(
 async def add_new_jobs(
     update: Update, context: ContextTypes.DEFAULT_TYPE
 ) -> Optional[Exception]:
-    db_service = mongo.MongoService(update)
+    db_service = await adbutils.connect(update)
     rights = await permissions.check_rights(update, context, db_service)
     if not rights:
         return Exception()
 
     # timezone must be defined in order to create new job
     chat_id = update.message.chat.id
-    if dbutils.find_chat_by_chatid(db_service, chat_id) is None:
+    if await adbutils.find_chat_by_chatid(db_service, chat_id) is None:
         await replies.send_start_message(update)
         return Exception()
 
@@ -170,44 +186,57 @@ async def add_new_jobs(
 
     # person limit
     user_id = update.message.from_user.id
-    current_job_count, user_limit = dbutils.get_user_limit(db_service, user_id)
+    current_job_count, user_limit = await adbutils.get_user_limit(db_service, user_id)
     if current_job_count + new_job_count > user_limit:
         await replies.send_exceed_limit_error_message(update, user_limit)
         return Exception()
 
-    successful_creation = []
-
-    chat_entry = dbutils.find_chat_by_chatid(db_service, chat_id)
+    chat_entry = await adbutils.find_chat_by_chatid(db_service, chat_id)
     user_tz_offset = chat_entry.get("tz_offset")
-    for crontab, text_content in res:
-        # arrange next run date and time
-        try:
-            user_nextrun, db_nextrun = utils.calc_next_run(crontab, user_tz_offset)
-        except Exception:
-            continue
-
-        jobname = generate_jobname(db_service, update.message.chat.type, chat_id)
-        msg = update.message
-        dbutils.add_new_entry(
-            db_service,
-            chat_id=chat_id,
-            jobname=jobname,
-            user_id=user_id,
-            crontab=crontab,
-            content=text_content,
-            content_type=ContentType.TEXT.value,
-            nextrun_ts=db_nextrun,
-            user_nextrun_ts=user_nextrun,
-            user_bot_token=chat_entry.get("user_bot_token"),
-            message_thread_id=msg.message_thread_id if msg.is_topic_message else None,
+
+    # arrange next run date and time for every line before writing any of them
+    next_runs = utils.calc_next_runs([crontab for crontab, _ in res], user_tz_offset)
+    valid = [line for line in res if next_runs[line[0]] is not None]
+    failed_creation = ["(%s) %s" % line for line in res if next_runs[line[0]] is None]
+
+    msg = update.message
+    jobnames = await generate_jobnames(db_service, msg.chat.type, chat_id, len(valid))
+    entries = []
+    for jobname, (crontab, text_content) in zip(jobnames, valid):
+        user_nextrun, db_nextrun = next_runs[crontab]
+        entries.append(
+            {
+                "chat_id": chat_id,
+                "jobname": jobname,
+                "user_id": user_id,
+                "crontab": crontab,
+                "content": text_content,
+                "content_type": ContentType.TEXT.value,
+                "nextrun_ts": db_nextrun,
+                "user_nextrun_ts": user_nextrun,
+                "user_bot_token": chat_entry.get("user_bot_token"),
+                "message_thread_id": (
+                    msg.message_thread_id if msg.is_topic_message else None
+                ),
+            }
         )
+    failed = await adbutils.add_new_entries(db_service, entries)
 
-        successful_creation.append("%s: (%s) %s" % (jobname, crontab, text_content))
+    successful_creation = []
+    for i, entry in enumerate(entries):
+        line = (entry["jobname"], entry["crontab"], entry["content"])
+        if i in failed:
+            failed_creation.append("(%s) %s" % line[1:])
+        else:
+            successful_creation.append("%s: (%s) %s" % line)
 
     if len(successful_creation) > 0:
         log.log_new_jobs_added(update, " // ".join(successful_creation))
         postfix = "\n".join("• %s" % x for x in successful_creation)
-        await replies.send_jobs_creation_success_message(update, postfix)
+        failed_postfix = "\n".join("• %s" % x for x in failed_creation)
+        await replies.send_jobs_creation_success_message(
+            update, postfix, failed_postfix
+        )
     else:
         await replies.send_error_message(update)
 
@@ -226,11 +255,11 @@ async def add_timezone(
         await replies.send_error_message(update)
         return Exception()
 
-    db_service = mongo.MongoService(update)
+    db_service = await adbutils.connect(update)
 
-    chat_exists = dbutils.chat_exists(db_service, update.message.chat.id)
+    chat_exists = await adbutils.chat_exists(db_service, update.message.chat.id)
     if not chat_exists:
-        dbutils.add_chat_data(
+        await adbutils.add_chat_data(
             db_service,
             chat_id=update.message.chat.id,
             chat_title=update.message.chat.title,
@@ -250,13 +279,13 @@ async def add_message(
     photo: bool = False,
     poll: bool = False,
 ) -> Optional[Exception]:
-    db_service = mongo.MongoService(update)
+    db_service = await adbutils.connect(update)
     rights = await permissions.check_rights(update, context, db_service)
     if not rights:
         return Exception()
 
     chat_id = update.message.chat.id
-    entry = dbutils.find_latest_entry(db_service, chat_id)
+    entry = await adbutils.find_latest_entry(db_service, chat_id)
     if entry is None:
         await replies.send_simple_prompt_message(update)
         return Exception()
@@ -298,7 +327,7 @@ async def add_message(
         payload["content"] = update.message.text_html
         payload["content_type"] = ContentType.TEXT.value
 
-    dbutils.update_entry_by_jobname(db_service, entry, payload)
+    await adbutils.update_entry_by_jobname(db_service, entry, payload)
     log.log_new_content_added(last_updated_by, entry.get("jobname"), chat_id)
 
     # reply
@@ -316,7 +345,7 @@ async def prepare_crontab_update(
         return None, None, Exception()
 
     # arrange next run date and time
-    chat_entry = dbutils.find_chat_by_chatid(db_service, update.message.chat.id)
+    chat_entry = await adbutils.find_chat_by_chatid(db_service, update.message.chat.id)
     user_tz_offset = chat_entry.get("tz_offset")
     try:
         user_nextrun_ts, db_nextrun_ts = utils.calc_next_run(crontab, user_tz_offset)
@@ -337,11 +366,11 @@ async def prepare_crontab_update(
 async def update_crontab(
     update: Update, context: ContextTypes.DEFAULT_TYPE
 ) -> Optional[Exception]:
-    db_service = mongo.MongoService(update)
+    db_service = await adbutils.connect(update)
     rights = await permissions.check_rights(update, context, db_service)
     if not rights:
         return Exception()
-    entry = dbutils.find_latest_entry(db_service, update.message.chat.id)
+    entry = await adbutils.find_latest_entry(db_service, update.message.chat.id)
     if entry is None:
         await replies.send_simple_prompt_message(update)
         return Exception()
@@ -358,15 +387,20 @@ async def update_crontab(
 
     user_id = update.message.from_user.id
     jobname, chat_id = entry.get("jobname"), entry.get("chat_id")
-    dbutils.update_entry_by_jobname(db_service, entry, payload)
+    await adbutils.update_entry_by_jobname(db_service, entry, payload)
     log.log_crontab_updated(user_id, jobname, chat_id)
 
     # special case — transfer photo ownership to new sender
     is_single_photo = entry["content_type"] == ContentType.PHOTO.value
     bot_token = entry.get("user_bot_token")
     if is_single_photo and bot_token is not None:
-        resp, new_photo_id = teleapi.transfer_photo_between_bots(
-            db_service, bot_token, None, chat_id, entry
+        resp, new_photo_id = await adbutils.run(
+            teleapi.transfer_photo_between_bots,
+            db_service,
+            bot_token,
+            None,
+            chat_id,
+            entry,
         )
         log.log_photo_transferred(user_id, new_photo_id, chat_id, resp.status_code)
 
@@ -376,7 +410,7 @@ async def update_crontab(
 async def update_timezone(
     update: Update, context: ContextTypes.DEFAULT_TYPE
 ) -> Optional[Exception]:
-    db_service = mongo.MongoService(update)
+    db_service = await adbutils.connect(update)
     rights = await permissions.check_rights(update, context, db_service)
     if not rights:
         return Exception()
@@ -393,7 +427,7 @@ async def update_timezone(
 
     # retrieve current chat data
     chat_id = update.message.chat.id
-    chat_entry = dbutils.find_chat_by_chatid(db_service, chat_id)
+    chat_entry = await adbutils.find_chat_by_chatid(db_service, chat_id)
     if chat_entry is None:
         await replies.send_start_message(update)
         return Exception()
@@ -404,31 +438,27 @@ async def update_timezone(
 
     # update chat entry
     payload = {"tz_offset": tz_offset, "utc_tz": utc_tz}
-    dbutils.update_chat_entry(db_service, chat_id, payload, "utc_tz")
+    await adbutils.update_chat_entry(db_service, chat_id, payload, "utc_tz")
 
     if chat_entry.get("chat_type", "") == "private":
         user_id = update.message.from_user.id
-        dbutils.update_chats_tz_by_type(db_service, user_id, tz_offset, "channel")
-
-    # update job entries
-    job_entries = dbutils.find_entries_by_chatid(db_service, update.message.chat.id)
-    for job_entry in job_entries:
-        if job_entry.get("nextrun_ts", "") == "":
-            continue
-        crontab = job_entry.get("crontab", "")
-        user_nextrun_ts, db_nextrun_ts = utils.calc_next_run(crontab, tz_offset)
-        payload = {"nextrun_ts": db_nextrun_ts, "user_nextrun_ts": user_nextrun_ts}
-        dbutils.update_entry_by_jobname(db_service, job_entry, payload)
+        await adbutils.update_chats_tz_by_type(
+            db_service, user_id, tz_offset, "channel"
+        )
+
+    # update job entries, channel jobs are stored under the private chat too
+    await adbutils.recompute_nextruns(db_service, [chat_id], tz_offset)
 
     await replies.send_timezone_change_success_message(update, utc_tz)
 
 
-def generate_jobname(
+async def generate_jobname(
     db_service: mongo.MongoService, job_prefix: str, chat_id: int
 ) -> str:
-    number = 1
-    jobname = "%s (%d)" % (job_prefix, number)
-    while dbutils.entry_exists(db_service, chat_id, jobname):
-        number = number + 1
-        jobname = "%s (%d)" % (job_prefix, number)
-    return jobname
+    return await adbutils.allocate_jobname(db_service, chat_id, job_prefix)
+
+
+async def generate_jobnames(
+    db_service: mongo.MongoService, job_prefix: str, chat_id: int, count: int
+) -> List[str]:
+    return await adbutils.allocate_jobnames(db_service, chat_id, job_prefix, count)
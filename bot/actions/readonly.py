@@ -5,24 +5,27 @@ from telegram import Update
 
 import config
 from bot.replies import replies
-from database import mongo
-from database.dbutils import dbutils
+from database.dbutils import adbutils
 
 
 async def show_job_details(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    db_service = mongo.MongoService(update)
+    db_service = await adbutils.connect(update)
     rights = await permissions.check_rights(update, context, db_service)
     if not rights:
         return
 
     chat_id = update.message.chat.id
-    entry = dbutils.find_entry_by_jobname(db_service, chat_id, update.message.text)
+    entry = await adbutils.find_entry_by_jobname(
+        db_service, chat_id, update.message.text
+    )
     if entry is None:
         await replies.send_error_message(update)
 
     bot_name = config.BOT_NAME
     if entry.get("user_bot_token") is not None:
-        bot_data = dbutils.find_bot_by_token(db_service, entry.get("user_bot_token"))
+        bot_data = await adbutils.find_bot_by_token(
+            db_service, entry.get("user_bot_token")
+        )
         bot_name = "@%s" % bot_data["username"]
 
     await replies.send_job_details(update, entry, bot_name)
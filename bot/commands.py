@@ -2,8 +2,7 @@ from telegram import Update
 from telegram.ext._contexttypes import ContextTypes
 from bot.convos import config_chat, edit
 from bot.replies import replies
-from database import mongo
-from database.dbutils import dbutils
+from database.dbutils import adbutils
 from bot.actions import permissions
 from typing import Optional
 
@@ -12,10 +11,10 @@ from typing import Optional
 # context. Error handlers also receive the raised TelegramError object in error.
 async def start(update: Update, _: ContextTypes.DEFAULT_TYPE) -> None:
     """Send a message when the command /start is issued."""
-    db_service = mongo.MongoService(update)
+    db_service = await adbutils.connect(update)
 
     # timezone must be defined in order to create new job
-    if dbutils.find_chat_by_chatid(db_service, update.message.chat.id) is None:
+    if await adbutils.find_chat_by_chatid(db_service, update.message.chat.id) is None:
         return await replies.send_start_message(update)
 
     await replies.send_simple_prompt_message(update)
@@ -33,10 +32,10 @@ async def checkcron(update: Update, _: ContextTypes.DEFAULT_TYPE) -> None:
 
 async def add(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send a message when the command /add is issued."""
-    db_service = mongo.MongoService(update)
+    db_service = await adbutils.connect(update)
 
     # timezone must be defined in order to create new job
-    if dbutils.find_chat_by_chatid(db_service, update.message.chat.id) is None:
+    if await adbutils.find_chat_by_chatid(db_service, update.message.chat.id) is None:
         return await replies.send_start_message(update)
 
     rights = await permissions.check_rights(update, context, db_service)
@@ -45,7 +44,7 @@ async def add(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
     # person limit
     user_id = update.message.from_user.id
-    job_count, user_limit = dbutils.get_user_limit(db_service, user_id)
+    job_count, user_limit = await adbutils.get_user_limit(db_service, user_id)
     if job_count >= user_limit:
         return await replies.send_exceed_limit_error_message(update, user_limit)
 
@@ -54,10 +53,10 @@ async def add(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 async def add_multiple(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send a message when the command /addmultiple is issued."""
-    db_service = mongo.MongoService(update)
+    db_service = await adbutils.connect(update)
 
     # timezone must be defined in order to create new job
-    if dbutils.find_chat_by_chatid(db_service, update.message.chat.id) is None:
+    if await adbutils.find_chat_by_chatid(db_service, update.message.chat.id) is None:
         return await replies.send_start_message(update)
 
     rights = await permissions.check_rights(update, context, db_service)
@@ -66,7 +65,7 @@ async def add_multiple(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
 
     # person limit
     user_id = update.message.from_user.id
-    job_count, user_limit = dbutils.get_user_limit(db_service, user_id)
+    job_count, user_limit = await adbutils.get_user_limit(db_service, user_id)
     if job_count >= user_limit:
         return await replies.send_exceed_limit_error_message(update, user_limit)
 
@@ -75,12 +74,12 @@ async def add_multiple(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
 
 async def delete(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send a message when the command /delete is issued."""
-    db_service = mongo.MongoService(update)
+    db_service = await adbutils.connect(update)
     rights = await permissions.check_rights(update, context, db_service)
     if not rights:
         return
 
-    entries = dbutils.find_entries_by_chatid(db_service, update.message.chat.id)
+    entries = await adbutils.find_entries_by_chatid(db_service, update.message.chat.id)
     if len(entries) <= 0:
         return await replies.send_simple_prompt_message(update)
 
@@ -89,12 +88,12 @@ async def delete(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 async def list_jobs(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send a message when the command /list is issued."""
-    db_service = mongo.MongoService(update)
+    db_service = await adbutils.connect(update)
     rights = await permissions.check_rights(update, context, db_service)
     if not rights:
         return
 
-    entries = dbutils.find_entries_by_chatid(db_service, update.message.chat.id)
+    entries = await adbutils.find_entries_by_chatid(db_service, update.message.chat.id)
     if len(entries) <= 0:
         return await replies.send_simple_prompt_message(update)
 
@@ -115,7 +114,7 @@ async def option_restrict_to_admins(
     if update.message.chat.type not in ["group", "supergroup"]:
         return
 
-    db_service = mongo.MongoService(update)
+    db_service = await adbutils.connect(update)
     if not await permissions.check_rights(update, context, db_service, True):
         return
 
@@ -130,7 +129,7 @@ async def option_restrict_to_user(
     if update.message.chat.type not in ["group", "supergroup"]:
         return
 
-    db_service = mongo.MongoService(update)
+    db_service = await adbutils.connect(update)
     rights = await permissions.check_rights(update, context, db_service)
     if not rights:
         return
@@ -140,10 +139,10 @@ async def option_restrict_to_user(
 
 async def change_tz(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send a message when the command /changetz is issued."""
-    db_service = mongo.MongoService(update)
+    db_service = await adbutils.connect(update)
 
     # timezone must be defined in order to change tz
-    if dbutils.find_chat_by_chatid(db_service, update.message.chat.id) is None:
+    if await adbutils.find_chat_by_chatid(db_service, update.message.chat.id) is None:
         return await replies.send_start_message(update)
 
     rights = await permissions.check_rights(update, context, db_service)
@@ -155,7 +154,7 @@ async def change_tz(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 async def change_sender(update: Update, _: ContextTypes.DEFAULT_TYPE) -> Optional[int]:
     """Send a message when the command /changesender is issued."""
-    db_service = mongo.MongoService(update)
+    db_service = await adbutils.connect(update)
 
     # find groups/private/channel created by user
     user_id = update.message.from_user.id
@@ -164,7 +163,7 @@ async def change_sender(update: Update, _: ContextTypes.DEFAULT_TYPE) -> Optiona
     if chat_type != "private":
         return await replies.send_private_only_error_message(update)
 
-    chat_entries = dbutils.find_groups_created_by(db_service, user_id)
+    chat_entries = await adbutils.find_groups_created_by(db_service, user_id)
     if len(chat_entries) <= 0:
         return await replies.send_missing_chats_error_message(update)
 
@@ -174,12 +173,12 @@ async def change_sender(update: Update, _: ContextTypes.DEFAULT_TYPE) -> Optiona
 
 async def reset(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send a message when the command /reset is issued."""
-    db_service = mongo.MongoService(update)
+    db_service = await adbutils.connect(update)
     rights = await permissions.check_rights(update, context, db_service)
     if not rights:
         return
 
-    entries = dbutils.find_entries_by_chatid(db_service, update.message.chat.id)
+    entries = await adbutils.find_entries_by_chatid(db_service, update.message.chat.id)
     if len(entries) <= 0:  # there must be at least one job available
         return await replies.send_simple_prompt_message(update)
 
@@ -189,14 +188,14 @@ async def reset(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 async def edit_job(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Optional[int]:
     """Send a message when the command /edit is issued."""
 
-    db_service = mongo.MongoService(update)
+    db_service = await adbutils.connect(update)
     rights = await permissions.check_rights(update, context, db_service)
     if not rights:
         return
 
     context.user_data["user_id"] = update.message.from_user.id
 
-    entries = dbutils.find_entries_by_chatid(db_service, update.message.chat.id)
+    entries = await adbutils.find_entries_by_chatid(db_service, update.message.chat.id)
     if len(entries) <= 0:
         return await replies.send_simple_prompt_message(update)
 
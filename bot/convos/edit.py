@@ -3,9 +3,8 @@ from telegram.ext import ConversationHandler
 from telegram.ext._contexttypes import ContextTypes
 from bot.actions import actions
 from bot.replies import replies
-from common.enums import ContentType
-from database import mongo
-from database.dbutils import dbutils
+from common.enums import ContentType, JobState
+from database.dbutils import adbutils
 from common import log, utils
 import jsons
 from typing import Optional
@@ -32,10 +31,10 @@ attrs = [
 
 
 async def choose_job(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    db_service = mongo.MongoService(update)
+    db_service = await adbutils.connect(update)
     jobname = str(update.message.text)
 
-    if not dbutils.entry_exists(db_service, update.message.chat.id, jobname):
+    if not await adbutils.entry_exists(db_service, update.message.chat.id, jobname):
         await replies.send_error_message(update)
         return state0
 
@@ -77,25 +76,27 @@ async def toggle_delete_previous(
     update: Update, context: ContextTypes.DEFAULT_TYPE
 ) -> None:
     jobname, chat_id = context.user_data["jobname"], update.message.chat.id
-    db_service = mongo.MongoService(update)
-    entry = dbutils.find_entry_by_jobname(db_service, chat_id, jobname)
+    db_service = await adbutils.connect(update)
+    entry = await adbutils.find_entry_by_jobname(db_service, chat_id, jobname)
     new_option_value = "" if entry.get("option_delete_previous", "") != "" else True
     payload = {
         "option_delete_previous": new_option_value,
         "last_updated_by": update.message.from_user.id,
     }
-    dbutils.update_entry_by_jobid(db_service, entry["_id"], payload)
+    await adbutils.update_entry_by_jobid(db_service, entry["_id"], payload)
     log.log_option_updated(payload, "option_delete_previous", jobname, chat_id)
     await replies.send_attribute_change_success_message(update)
 
 
 async def toggle_pause_job(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     jobname, chat_id = context.user_data["jobname"], update.message.chat.id
-    db_service = mongo.MongoService(update)
-    entry = dbutils.find_entry_by_jobname(db_service, chat_id, jobname)
+    db_service = await adbutils.connect(update)
+    entry = await adbutils.find_entry_by_jobname(db_service, chat_id, jobname)
     new_option_value = "" if entry.get("paused_ts", "") != "" else utils.now()
+    new_state = JobState.ACTIVE if new_option_value == "" else JobState.PAUSED
     payload = {
         "paused_ts": new_option_value,
+        "state": new_state.value,
         "last_updated_by": update.message.from_user.id,
     }
     if new_option_value == "":  # calculate next run
@@ -110,7 +111,7 @@ async def toggle_pause_job(update: Update, context: ContextTypes.DEFAULT_TYPE) -
             "user_nextrun_ts": crontab_payload["user_nextrun_ts"],
             **payload,
         }
-    dbutils.update_entry_by_jobid(db_service, entry["_id"], payload)
+    await adbutils.update_entry_by_jobid(db_service, entry["_id"], payload)
     log.log_option_updated(payload, "paused_ts", jobname, chat_id)
     await replies.send_attribute_change_success_message(update)
 
@@ -121,7 +122,7 @@ async def handle_edit_content(
 ) -> int:
     jobname, attr = context.user_data["jobname"], context.user_data["attribute"]
     chat_id = update.message.chat.id
-    db_service = mongo.MongoService(update)
+    db_service = await adbutils.connect(update)
 
     if attr == attr_cron:
         crontab = update.message.text
@@ -132,7 +133,7 @@ async def handle_edit_content(
             return state2
         mongo_key = "crontab"
 
-    entry = dbutils.find_entry_by_jobname(db_service, chat_id, jobname)
+    entry = await adbutils.find_entry_by_jobname(db_service, chat_id, jobname)
 
     if attr == attr_content:
         old_content_type = entry.get("content_type", "")
@@ -147,7 +148,7 @@ async def handle_edit_content(
             "content_type": content_type,
         }
 
-    dbutils.update_entry_by_jobid(db_service, entry["_id"], payload)
+    await adbutils.update_entry_by_jobid(db_service, entry["_id"], payload)
     log.log_option_updated(payload, mongo_key, jobname, chat_id)
     await replies.send_attribute_change_success_message(update)
     return ConversationHandler.END
@@ -156,8 +157,8 @@ async def handle_edit_content(
 async def handle_edit_poll(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     jobname, chat_id = context.user_data["jobname"], update.message.chat.id
 
-    db_service = mongo.MongoService(update)
-    entry = dbutils.find_entry_by_jobname(db_service, chat_id, jobname)
+    db_service = await adbutils.connect(update)
+    entry = await adbutils.find_entry_by_jobname(db_service, chat_id, jobname)
 
     poll_json = update.message.poll
     payload = {
@@ -165,7 +166,7 @@ async def handle_edit_poll(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         "content": jsons.dumps(poll_json),
         "content_type": ContentType.POLL.value,
     }
-    dbutils.update_entry_by_jobid(db_service, entry["_id"], payload)
+    await adbutils.update_entry_by_jobid(db_service, entry["_id"], payload)
 
     log.log_option_updated(payload, "content", jobname, chat_id)
     await replies.send_attribute_change_success_message(update)
@@ -176,8 +177,8 @@ async def handle_edit_poll(update: Update, context: ContextTypes.DEFAULT_TYPE) -
 async def handle_add_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     jobname, chat_id = context.user_data["jobname"], update.message.chat.id
 
-    db_service = mongo.MongoService(update)
-    entry = dbutils.find_entry_by_jobname(db_service, chat_id, jobname)
+    db_service = await adbutils.connect(update)
+    entry = await adbutils.find_entry_by_jobname(db_service, chat_id, jobname)
 
     payload = {"last_updated_by": update.message.from_user.id}
     if entry.get("photo_id", "") == "":
@@ -189,7 +190,7 @@ async def handle_add_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         photo_id = update.message.photo[-1].file_id
         photo_ids = "{};{}".format(entry.get("photo_id", ""), photo_id)
         payload["photo_id"] = photo_ids
-    dbutils.update_entry_by_jobid(db_service, entry["_id"], payload)
+    await adbutils.update_entry_by_jobid(db_service, entry["_id"], payload)
 
     log.log_option_updated(payload, "photo_id", jobname, chat_id)
     await replies.send_attribute_change_success_message(update)
@@ -207,8 +208,8 @@ async def handle_clear_photos(
         return end_convo(update, context)
 
     if res == "yes":
-        db_service = mongo.MongoService(update)
-        entry = dbutils.find_entry_by_jobname(db_service, chat_id, jobname)
+        db_service = await adbutils.connect(update)
+        entry = await adbutils.find_entry_by_jobname(db_service, chat_id, jobname)
 
         if entry.get("photo_id", "") == "":
             await replies.send_no_photos_to_delete_error_message(update)
@@ -220,7 +221,7 @@ async def handle_clear_photos(
             "photo_id": "",
             "photo_group_id": "",
         }
-        dbutils.update_entry_by_jobid(db_service, entry["_id"], payload)
+        await adbutils.update_entry_by_jobid(db_service, entry["_id"], payload)
 
         log.log_option_updated(payload, "photo_id", jobname, chat_id)
         await replies.send_attribute_change_success_message(update)
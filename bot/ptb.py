@@ -1,7 +1,12 @@
+import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 import config
 from telegram.ext import Application
+from database import indexes, mongo
+from database.dbutils.dbutils_user import flush_user_touches
+from dispatch.leader import scheduler_lock
+from teleapi import async_endpoints
 from typing import AsyncGenerator
 
 # https://github.com/python-telegram-bot/python-telegram-bot/wiki/Handling-network-errors
@@ -18,9 +23,16 @@ ptb = ptb.build()
 
 @asynccontextmanager
 async def lifespan(_: FastAPI) -> AsyncGenerator:
+    await asyncio.to_thread(indexes.setup)
     if config.BOTHOST:
         await ptb.bot.setWebhook(config.BOTHOST)
     async with ptb:
         await ptb.start()
         yield
         await ptb.stop()
+    # hand the scheduler over now instead of waiting for the lease to expire
+    await asyncio.to_thread(scheduler_lock.release)
+    await async_endpoints.close_session()
+    # last_used_at noted since the last periodic flush
+    await asyncio.to_thread(flush_user_touches, mongo.MongoService())
+    await asyncio.to_thread(mongo.close_clients)
@@ -9,6 +9,9 @@ timezone_change_success_message = (
 )
 reset_success_messge = "Yeet! No more recurring messages in this chat."
 jobs_creation_success_message = "The following recurring messages are created, /list to view all messages and their details:\n"
+jobs_creation_failed_message = (
+    "\n\nThe following lines could not be added, check the crontab and try again:\n"
+)
 attribute_change_success_message = "Yipee! Your recurring message is updated successfully.\n\n/list to view all messages and their details."
 sender_change_success_message = "Sender for %s is now %s. \n\nRemember to add %s into the group/channel as an admin and enable:\n1. <i>Change Group/Channel Info</i> and\n2. <i>Post Messages</i>."
 sender_reset_success_message = (
@@ -38,9 +41,12 @@ async def send_timezone_change_success_message(update: Update, utc_tz: str) -> N
 
 
 async def send_jobs_creation_success_message(
-    update: Update, additional_text: str
+    update: Update, additional_text: str, failed_text: str = ""
 ) -> None:
-    await update.message.reply_text(jobs_creation_success_message + additional_text)
+    reply = jobs_creation_success_message + additional_text
+    if failed_text != "":
+        reply += jobs_creation_failed_message + failed_text
+    await update.message.reply_text(reply)
 
 
 async def send_attribute_change_success_message(update: Update) -> None:
@@ -0,0 +1,61 @@
+import threading
+import time
+from collections import OrderedDict
+from common import metrics
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+"""
+Bounded in-process LRU cache whose entries also expire after a fixed ttl, for
+documents that are read far more often than they change
+"""
+
+
+class TTLCache:
+    def __init__(self, name: str, maxsize: int, ttl: float) -> None:
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.lock = threading.Lock()  # shared by the bot pool and dispatch threads
+        self.entries: OrderedDict[Hashable, Tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self.entries[key]
+                self.evicted("expired")
+                entry = None
+            if entry is None:
+                metrics.cache_lookups.labels(self.name, "miss").inc()
+                return None
+            self.entries.move_to_end(key)
+            metrics.cache_lookups.labels(self.name, "hit").inc()
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.maxsize < 1:
+            return
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evicted("size")
+
+    def invalidate(self, key: Hashable) -> None:
+        with self.lock:
+            if self.entries.pop(key, None) is not None:
+                self.evicted("invalidated")
+
+    def invalidate_where(self, match: Callable[[Any], bool]) -> None:
+        with self.lock:
+            for key in [k for k, (_, v) in self.entries.items() if match(v)]:
+                del self.entries[key]
+                self.evicted("invalidated")
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+    def evicted(self, reason: str) -> None:
+        metrics.cache_evictions.labels(self.name, reason).inc()
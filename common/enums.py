@@ -11,3 +11,20 @@ class ContentType(Enum):
 class Restriction(Enum):
     OWNER = "creator"
     ADMIN = "administrator"
+
+
+class DispatchMode(Enum):
+    ASYNC = "async"
+    THREAD = "thread"
+
+
+class SchedulerMode(Enum):
+    POLL = "poll"
+    TIMER = "timer"
+
+
+class JobState(Enum):
+    ACTIVE = "active"
+    PAUSED = "paused"
+    REMOVED = "removed"
+    PENDING = "pending"  # claimed by a dispatcher, see lease_owner
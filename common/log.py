@@ -112,6 +112,15 @@ def log_new_entry(jobname: str, chat_id: int) -> None:
     logger.info(msg, jobname, str(chat_id))
 
 
+def log_new_entries(count: int, failed: int) -> None:
+    logger.info("[DB] Created %d new job(s), %d failed", count, failed)
+
+
+def log_new_entry_failed(jobname: str, chat_id: int, err: str) -> None:
+    msg = '[DB] Failed to create job, jobname="%s", chat_id=%s, error="%s"'
+    logger.warning(msg, jobname, str(chat_id), err)
+
+
 def log_new_chat(chat_id: int, chat_title: str) -> None:
     msg = "[DB] Created new chat entry, chat_id=%s, chat_title=%s"
     logger.info(msg, str(chat_id), chat_title)
@@ -141,6 +150,11 @@ def log_chats_tz_updated_by_type(
     logger.info(msg, count, chat_type, user_id, tz_offset)
 
 
+def log_nextruns_recomputed(count: int, chat_count: int, tz_offset: float) -> None:
+    msg = "[DB] Recomputed next run for %d job(s) in %d chat(s), new tz_offset=%s"
+    logger.info(msg, count, chat_count, tz_offset)
+
+
 def log_user_updated(entry: Optional[Any]) -> None:
     msg = '[DB] Superseded user, user_id=%s, field_changed="%s"'
     logger.info(msg, entry.get("user_id"), entry.get("field_changed"))
@@ -160,12 +174,67 @@ def log_firstname_updated(update: Update) -> None:
     )
 
 
+def log_user_touches_failed(count: int, err: Exception) -> None:
+    msg = '[DB] Failed to write last_used_at for %d user(s), error="%r"'
+    logger.warning(msg, count, err)
+
+
+def log_job_error_history_failed(job_id: Any, err: Exception) -> None:
+    msg = '[DB] Failed to record send error in history, job_id="%s", error="%r"'
+    logger.warning(msg, job_id, err)
+
+
+def log_entries_archived(count: int, cutoff_ts: str) -> None:
+    logger.info("[DB] Archived %d job(s) removed before %s", count, cutoff_ts)
+
+
 def log_update_details(result: Optional[Any]) -> None:
     logger.info(
         f"[DB] Updated mongo, matched={result.matched_count}, modified={result.modified_count}",
     )
 
 
+def log_indexes_ensured(collection: str, names: list) -> None:
+    logger.info("[DB] Ensured indexes %s on %s", names, collection)
+
+
+def log_indexes_failed(collection: str, err: Exception) -> None:
+    logger.error('[DB] Failed to ensure indexes on %s, error="%r"', collection, err)
+
+
+def log_unique_index_failed(collection: str, name: str, err: Exception) -> None:
+    msg = '[DB] Failed to build unique index %s on %s, run scripts/dedupe_jobnames.py if it reports duplicates, error="%r"'
+    logger.error(msg, name, collection, err)
+
+
+def log_capped_collection_created(collection: str, size: int) -> None:
+    logger.info("[DB] Created capped collection %s, size=%d bytes", collection, size)
+
+
+def log_capped_collection_converted(collection: str, size: int) -> None:
+    msg = "[DB] Converted %s to a capped collection, size=%d bytes"
+    logger.warning(msg, collection, size)
+
+
+def log_capped_collection_failed(collection: str, err: Exception) -> None:
+    msg = '[DB] Failed to ensure capped collection %s, error="%r"'
+    logger.error(msg, collection, err)
+
+
+def log_query_plan_collscan(name: str, collection: str) -> None:
+    msg = '[DB] Query "%s" on %s falls back to a collection scan, add an index'
+    logger.error(msg, name, collection)
+
+
+def log_query_plan_failed(name: str, err: Exception) -> None:
+    logger.warning('[DB] Could not explain query "%s", error="%r"', name, err)
+
+
+def log_writeback_failed(job_id: int, err: str) -> None:
+    msg = '[DB] Bulk job update failed, job_id="%s", error="%s"'
+    logger.warning(msg, job_id, err)
+
+
 # api
 def log_api_previous_message_deletion(
     chat_id: int, message_id: str, status_code: int
@@ -187,6 +256,69 @@ def log_completion(total_count: int) -> None:
     logger.info("[TELEGRAM API] Finished processing %d messages", total_count)
 
 
+def log_dispatch_job_failed(job_id: int, err: Exception) -> None:
+    msg = '[DISPATCH] Job failed unexpectedly, job_id="%s", error="%r"'
+    logger.warning(msg, job_id, err)
+
+
+def log_dispatch_rate_limited(job_id: int, chat_id: int, retry_after: int) -> None:
+    msg = (
+        '[DISPATCH] Rate limited by Telegram, job_id="%s", chat_id=%s, retry_after=%ss'
+    )
+    logger.warning(msg, job_id, chat_id, retry_after)
+
+
+def log_dispatch_stats(
+    count: int,
+    workers: int,
+    max_depth: int,
+    utilisation: float,
+    quantiles: Dict[float, float],
+) -> None:
+    logger.info(
+        "[DISPATCH] Processed %d job(s) with %d worker(s), max_queue_depth=%d, utilisation=%.2f, p50=%.2fs, p95=%.2fs, p99=%.2fs",
+        count,
+        workers,
+        max_depth,
+        utilisation,
+        quantiles[0.5],
+        quantiles[0.95],
+        quantiles[0.99],
+    )
+
+
+def log_dispatch_run_skipped() -> None:
+    logger.warning("[DISPATCH] Previous run still in progress, skipping this one")
+
+
+def log_dispatch_run_overrun(duration: float) -> None:
+    msg = "[DISPATCH] Run overran its minute, duration=%.2fs"
+    logger.warning(msg, duration)
+
+
+def log_scheduler_loaded(count: int) -> None:
+    logger.info("[SCHEDULER] Loaded %d scheduled job(s) into the timer heap", count)
+
+
+def log_scheduler_fired(count: int) -> None:
+    logger.info("[SCHEDULER] Timer fired for %d due job(s)", count)
+
+
+def log_scheduler_failed(err: Exception) -> None:
+    msg = '[SCHEDULER] Timer loop failed, reloading, error="%r"'
+    logger.error(msg, err)
+
+
+def log_leader_changed(name: str, owner: str, is_leader: bool) -> None:
+    state = "acquired" if is_leader else "lost"
+    logger.info('[SCHEDULER] Leader lock "%s" %s, owner=%s', name, state, owner)
+
+
+def log_leader_heartbeat_failed(name: str, err: Exception) -> None:
+    msg = '[SCHEDULER] Leader heartbeat failed, lock="%s", error="%r"'
+    logger.warning(msg, name, err)
+
+
 # prometheus
 def log_update_prometheus(metric: int, value: float) -> None:
     logger.info(
@@ -204,3 +336,25 @@ def log_influx_resp(measurement: str, field: str, value: int) -> None:
 # script
 def log_update_count(count: int) -> None:
     logger.info("[SCRIPT] Processing %d message(s) to revive...", count)
+
+
+def log_entries_restored(count: int) -> None:
+    logger.info("[SCRIPT] Restored %d job(s) from the archive", count)
+
+
+def log_jobname_renamed(job_id: Any, jobname: str, new_jobname: str) -> None:
+    msg = '[SCRIPT] Renamed job "%s" to "%s" as its name is taken, job_id="%s"'
+    logger.info(msg, jobname, new_jobname, job_id)
+
+
+def log_revive_skipped(job_id: Any, jobname: str) -> None:
+    msg = '[SCRIPT] Skipped reviving job "%s" as its name was taken meanwhile, job_id="%s"'
+    logger.warning(msg, jobname, job_id)
+
+
+def log_quota_reconciled(checked: int, repaired: int) -> None:
+    logger.info("[SCRIPT] Checked %d user quota(s), repaired %d", checked, repaired)
+
+
+def log_migration_progress(migrated: int, failed: int) -> None:
+    logger.info("[SCRIPT] Migrated %d job(s), %d failed", migrated, failed)
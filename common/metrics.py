@@ -0,0 +1,126 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+# dispatch
+dispatch_queue_depth = Gauge(
+    "dispatch_queue_depth", "Due jobs waiting for a free dispatch worker"
+)
+dispatch_worker_utilisation = Gauge(
+    "dispatch_worker_utilisation",
+    "Share of worker time spent processing jobs during the last run",
+)
+dispatch_job_latency = Histogram(
+    "dispatch_job_latency_seconds",
+    "Time taken to process a single due job",
+    buckets=LATENCY_BUCKETS,
+)
+dispatch_job_latency_quantile = Gauge(
+    "dispatch_job_latency_quantile_seconds",
+    "Job processing time quantiles of the last run",
+    ["quantile"],
+)
+dispatch_rate_limit_wait = Histogram(
+    "dispatch_rate_limit_wait_seconds",
+    "Time a send was paced by the Telegram rate limiter",
+    buckets=LATENCY_BUCKETS,
+)
+dispatch_rate_limited = Counter(
+    "dispatch_rate_limited_total",
+    "Sends rejected by Telegram with 429, by what happened to the job next",
+    ["outcome"],
+)
+dispatch_retry_after = Histogram(
+    "dispatch_retry_after_seconds",
+    "retry_after values returned with Telegram 429 responses",
+    buckets=LATENCY_BUCKETS,
+)
+dispatch_claims = Counter(
+    "dispatch_claims_total",
+    "Due jobs this dispatcher tried to claim, by whether it won the lease",
+    ["result"],
+)
+dispatch_run_duration = Histogram(
+    "dispatch_run_duration_seconds",
+    "Wall time of a whole dispatch run, from reading due jobs to the last send",
+    buckets=(1, 5, 10, 20, 30, 45, 60, 90, 120, 300),
+)
+dispatch_runs_skipped = Counter(
+    "dispatch_runs_skipped_total",
+    "Dispatch runs skipped because the previous run was still in progress",
+)
+dispatch_run_overruns = Counter(
+    "dispatch_run_overruns_total",
+    "Dispatch runs that did not finish within the minute they started in",
+)
+dispatch_writeback_batch_size = Histogram(
+    "dispatch_writeback_batch_size",
+    "Job updates written per bulk_write flush",
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500),
+)
+dispatch_writeback_errors = Counter(
+    "dispatch_writeback_errors_total",
+    "Buffered job updates that failed to apply",
+)
+dispatch_chat_queries = Counter(
+    "dispatch_chat_queries_total",
+    "chat_data queries made by dispatch runs, at most one per claimed chunk",
+)
+dispatch_chat_lookups = Counter(
+    "dispatch_chat_lookups_total",
+    "Chat settings looked up by dispatch workers, by whether the prefetch had them",
+    ["result"],
+)
+
+# scheduler
+scheduler_leader = Gauge(
+    "scheduler_leader",
+    "1 when the process identified by owner holds the scheduler leader lock",
+    ["owner"],
+)
+
+# mongo
+mongo_query_collscan = Gauge(
+    "mongo_query_collscan",
+    "1 when the winning plan of a hot query shape is a collection scan",
+    ["query"],
+)
+mongo_pool_connections = Gauge(
+    "mongo_pool_connections", "Open connections in the mongo pool", ["address"]
+)
+mongo_pool_checked_out = Gauge(
+    "mongo_pool_checked_out",
+    "Pooled mongo connections currently checked out by an operation",
+    ["address"],
+)
+mongo_pool_checkout_failures = Counter(
+    "mongo_pool_checkout_failures_total",
+    "Failed attempts to check a connection out of the mongo pool",
+    ["address", "reason"],
+)
+mongo_pool_cleared = Counter(
+    "mongo_pool_cleared_total",
+    "Times the mongo pool was cleared after a network error",
+    ["address"],
+)
+mongo_identity_map_lookups = Counter(
+    "mongo_identity_map_lookups_total",
+    "Chat, job and bot lookups within one update, by whether they reached mongo",
+    ["kind", "result"],
+)
+jobs_archived = Counter(
+    "jobs_archived_total",
+    "Removed jobs moved from job_data to the archive collection",
+)
+
+# cache
+cache_lookups = Counter(
+    "cache_lookups_total",
+    "In-process cache lookups by hit or miss",
+    ["cache", "result"],
+)
+cache_evictions = Counter(
+    "cache_evictions_total",
+    "Entries dropped from an in-process cache, by size, expired or invalidated",
+    ["cache", "reason"],
+)
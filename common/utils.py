@@ -2,7 +2,7 @@ import re
 import config
 from croniter import croniter
 from datetime import datetime, timezone, timedelta
-from typing import Optional, Tuple, List
+from typing import Dict, Iterable, Optional, Tuple, List
 
 
 def calc_next_run(crontab: str, user_tz_offset: float) -> Tuple[str, str]:
@@ -19,6 +19,21 @@ def calc_next_run(crontab: str, user_tz_offset: float) -> Tuple[str, str]:
     return (user_nextrun_ts, db_nextrun_ts)
 
 
+def calc_next_runs(
+    crontabs: Iterable[str], user_tz_offset: float
+) -> Dict[str, Optional[Tuple[str, str]]]:
+    # once per distinct crontab, None for the ones croniter rejects
+    next_runs: Dict[str, Optional[Tuple[str, str]]] = {}
+    for crontab in crontabs:
+        if crontab in next_runs:
+            continue
+        try:
+            next_runs[crontab] = calc_next_run(crontab, user_tz_offset)
+        except Exception:
+            next_runs[crontab] = None
+    return next_runs
+
+
 def extract_tz_values(text: str) -> Optional[re.Match[str]]:
     return re.match("^(?:UTC)?(([+-])(1[0-4]|0[0-9]|[0-9])(?::([0-5][0-9]))?)$", text)
 
@@ -55,6 +70,12 @@ def parse_time_millis(datetime_obj: datetime) -> str:
     return datetime_obj.strftime("%Y-%m-%d %H:%M:%S.%f")
 
 
+def parse_db_time(ts: str) -> datetime:
+    # inverse of parse_time_mins for timestamps stored in the db timezone
+    db_tz = timezone(timedelta(hours=config.TZ_OFFSET))
+    return datetime.strptime(ts[:16], "%Y-%m-%d %H:%M").replace(tzinfo=db_tz)
+
+
 def now(offset: int = 0) -> str:
     now_ts = datetime.now(timezone(timedelta(hours=config.TZ_OFFSET)))
     return parse_time_millis(now_ts + timedelta(minutes=offset))
@@ -8,10 +8,31 @@ load_dotenv()
 ENV = getenv("ENV")
 TZ_OFFSET = 8.0  # (UTC+08:00)
 JOB_LIMIT_PER_PERSON = 10
-BATCH_SIZE = 100  # Max number of messages to send at any given time
+BATCH_SIZE = 100  # Max number of messages to send at any given time (dispatch workers)
 RETRIES = 1  # Number of retries if message fails to send
 BOT_NAME = "@cron_telebot"
 
+""" Dispatch config """
+# "async" sends on the event loop through a pooled HTTP client, "thread" falls back to blocking worker threads
+DISPATCH_MODE = getenv("DISPATCH_MODE", "async")
+# max in-flight requests
+DISPATCH_CONCURRENCY = int(getenv("DISPATCH_CONCURRENCY", 100))
+DISPATCH_HTTP_TIMEOUT = 60  # seconds, per Telegram API request
+# "poll" queries mongo every 60 seconds, "timer" sleeps until the next due job
+SCHEDULER_MODE = getenv("SCHEDULER_MODE", "poll")
+SCHEDULER_RESYNC_INTERVAL = 60  # seconds, timer mode re-reads the earliest next run
+SCHEDULER_RETRY_SECS = 5  # backoff before timer mode reloads after an error
+RATE_LIMIT_PER_BOT = 30  # messages per second per bot token
+RATE_LIMIT_PER_CHAT = 1  # messages per second per chat
+RATE_LIMIT_PER_GROUP = 20  # messages per minute per group or channel
+DISPATCH_LEASE_MINS = 5  # a claimed job goes back up for grabs once its lease expires
+DISPATCH_CURSOR_BATCH_SIZE = 500  # due jobs streamed, claimed and queued per chunk
+WRITEBACK_BATCH_SIZE = 100  # buffered job updates flushed in one bulk_write
+WRITEBACK_FLUSH_SECS = 1  # max seconds an update waits in the buffer
+# one process per deployment runs the scheduler, the others only serve webhooks
+LEADER_LEASE_SECS = 15  # a dead leader is replaced within this many seconds
+LEADER_HEARTBEAT_SECS = 5  # how often the leader renews, and followers try to take over
+
 """ Telegram config """
 TELEGRAM_BOT_TOKEN = getenv("TELEGRAM_BOT_TOKEN")
 BOTHOST = getenv("BOTHOST")  # only required in prod environment, used to set webhook
@@ -19,12 +40,50 @@ BOTHOST = getenv("BOTHOST")  # only required in prod environment, used to set we
 
 """ DB config """
 MONGODB_CONNECTION_STRING = getenv("MONGODB_CONNECTION_STRING")
+# connections per process
+MONGODB_MAX_POOL_SIZE = int(getenv("MONGODB_MAX_POOL_SIZE", 50))
+MONGODB_MIN_POOL_SIZE = int(getenv("MONGODB_MIN_POOL_SIZE", 0))
+MONGODB_MAX_IDLE_TIME_MS = 60000  # idle pooled connections are closed after this
+MONGODB_CONNECT_TIMEOUT_MS = 5000
+MONGODB_SERVER_SELECTION_TIMEOUT_MS = 10000
 MONGODB_DB = "rm_bot"
 MONGODB_JOB_DATA_COLLECTION = "job_data"
 MONGODB_CHAT_DATA_COLLECTION = "chat_data"
 MONGODB_USER_DATA_COLLECTION = "user_data"
 MONGODB_BOT_DATA_COLLECTION = "bot_data"
 MONGODB_USER_WHITELIST_COLLECTION = "whitelist"
+MONGODB_LOCK_COLLECTION = "locks"
+MONGODB_CACHE_SIGNAL_COLLECTION = "cache_signals"
+MONGODB_COUNTER_COLLECTION = "counters"
+MONGODB_USER_QUOTA_COLLECTION = "user_quota"
+MONGODB_JOB_ARCHIVE_COLLECTION = "job_data_archive"
+MONGODB_CHECKPOINT_COLLECTION = "checkpoints"
+MONGODB_JOB_ERRORS_COLLECTION = "job_errors"
+# latest send errors kept on the job itself, the rest only in MONGODB_JOB_ERRORS_COLLECTION
+JOB_ERRORS_KEPT = 5
+# size of the capped MONGODB_JOB_ERRORS_COLLECTION
+JOB_ERRORS_CAP_BYTES = 64 * 1024 * 1024
+# chat documents kept in memory per process, 0 turns the cache off
+CHAT_CACHE_SIZE = 10000
+# max seconds a process can serve a chat changed by another process
+CHAT_CACHE_TTL_SECS = 60
+# with several processes, also evict chats the others changed, through MONGODB_CACHE_SIGNAL_COLLECTION
+CHAT_CACHE_SIGNAL = bool(getenv("CHAT_CACHE_SIGNAL"))
+CHAT_CACHE_SIGNAL_SECS = 5  # how often each process polls for signals
+# user snapshots kept in memory per process, 0 turns the cache off
+USER_CACHE_SIZE = 10000
+USER_CACHE_TTL_SECS = 600  # seconds before a user snapshot is read from mongo again
+USER_TOUCH_FLUSH_SECS = 30  # last_used_at updates are coalesced and written this often
+# removed jobs move to MONGODB_JOB_ARCHIVE_COLLECTION after this many days, 0 turns archiving off
+JOB_ARCHIVE_AFTER_DAYS = int(getenv("JOB_ARCHIVE_AFTER_DAYS", 30))
+JOB_ARCHIVE_RETENTION_DAYS = 365  # archived jobs are dropped by a ttl index after this
+JOB_ARCHIVE_BATCH_SIZE = 500
+JOB_ARCHIVE_INTERVAL_SECS = 3600  # how often the leader archives
+# refuse to start when a hot query has no index, otherwise only log and export a metric
+INDEX_CHECK_STRICT = bool(getenv("INDEX_CHECK_STRICT"))
+# also match jobs by their legacy nextrun_ts string or without a state, turn off once
+# scripts/migrate_job_datetimes.py and scripts/backfill_job_state.py have finished
+JOB_SCHEMA_DUAL_READ = getenv("JOB_SCHEMA_DUAL_READ", "1") == "1"
 
 INFLUXDB_TOKEN = getenv("INFLUXDB_TOKEN")
 INFLUXDB_ORG = "main"
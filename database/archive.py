@@ -0,0 +1,83 @@
+import config
+from common import log, metrics, utils
+from database.mongo import MongoService
+from pymongo import ASCENDING
+from typing import Any, Dict, List, Optional
+
+"""
+Moves jobs removed more than config.JOB_ARCHIVE_AFTER_DAYS ago from job_data
+to job_data_archive in batches, so the hot collection and its indexes only
+hold jobs that can still run
+"""
+
+CHECKPOINT = "job_archive"
+ARCHIVE_SORT = [("removed_ts", ASCENDING), ("_id", ASCENDING)]
+
+
+def archivable_q(cutoff_ts: str, checkpoint: Optional[Any] = None) -> Dict[str, Any]:
+    # removed before the cutoff and after the last job the previous batch moved
+    q: Dict[str, Any] = {"removed_ts": {"$gt": "", "$lt": cutoff_ts}}
+    if checkpoint is not None:
+        last_ts, last_id = checkpoint["removed_ts"], checkpoint["job_id"]
+        q["$or"] = [
+            {"removed_ts": {"$gt": last_ts}},
+            {"removed_ts": last_ts, "_id": {"$gt": last_id}},
+        ]
+    return q
+
+
+def archive_batch(db_service: MongoService, cutoff_ts: str, batch_size: int) -> int:
+    checkpoint = db_service.find_checkpoint(CHECKPOINT)
+    q = archivable_q(cutoff_ts, checkpoint)
+    docs = db_service.find_entries(q, ARCHIVE_SORT, limit=batch_size)
+    if len(docs) < 1:
+        return 0
+
+    # copied before deleted, a crash in between only means copying again
+    db_service.archive_entries(docs)
+    res = db_service.delete_archived_entries(docs)
+    if res.deleted_count < len(docs):
+        db_service.delete_stale_archived_entries(docs)  # revived while copying
+    last = docs[-1]
+    db_service.save_checkpoint(
+        CHECKPOINT, {"removed_ts": last["removed_ts"], "job_id": last["_id"]}
+    )
+    metrics.jobs_archived.inc(res.deleted_count)
+    return len(docs)
+
+
+def archive_removed_entries(
+    db_service: MongoService,
+    after_days: int = config.JOB_ARCHIVE_AFTER_DAYS,
+    batch_size: int = config.JOB_ARCHIVE_BATCH_SIZE,
+) -> int:
+    # returns how many jobs were moved, resumes from the saved checkpoint
+    if after_days < 1:
+        return 0
+    cutoff_ts = utils.now(-after_days * 24 * 60)
+    total = 0
+    while True:
+        count = archive_batch(db_service, cutoff_ts, batch_size)
+        total += count
+        if count < batch_size:
+            break
+    if total > 0:
+        log.log_entries_archived(total, cutoff_ts)
+    return total
+
+
+def restore_entries_removed_between(
+    db_service: MongoService,
+    start_ts: str,
+    end_ts: str,
+    err_status: Optional[int] = None,
+) -> List[Optional[Any]]:
+    # moves matching archived jobs back to job_data, still removed
+    q: Dict[str, Any] = {"removed_ts": {"$gte": start_ts, "$lte": end_ts}}
+    if err_status is not None:
+        q["errors.error"] = {"$regex": f"^Error {err_status}"}
+    docs = db_service.find_archived_entries(q)
+    if len(docs) > 0:
+        db_service.restore_entries(docs)
+        log.log_entries_restored(len(docs))
+    return docs
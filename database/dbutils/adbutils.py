@@ -0,0 +1,48 @@
+import asyncio
+import config
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from database import mongo
+from database.dbutils import dbutils
+from typing import Any, Awaitable, Callable, Optional
+from telegram import Update
+
+"""
+Async mirror of dbutils for the bot handlers, adbutils.find_chat_by_chatid(...)
+awaits dbutils.find_chat_by_chatid(...) on a thread pool sized to the mongo
+connection pool, so a round trip never blocks the event loop serving webhooks.
+Scripts and the dispatcher keep using the sync API.
+"""
+
+executor = ThreadPoolExecutor(
+    max_workers=config.MONGODB_MAX_POOL_SIZE, thread_name_prefix="mongo"
+)
+
+
+async def run(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    # for MongoService methods and helpers that mix mongo with other blocking io
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        executor, functools.partial(func, *args, **kwargs)
+    )
+
+
+async def connect(
+    update: Optional[Update] = None,
+    conn_str: Optional[str] = config.MONGODB_CONNECTION_STRING,
+) -> mongo.MongoService:
+    # MongoService(update) writes the user's latest details, so it blocks too
+    return await run(mongo.MongoService, update, conn_str)
+
+
+def __getattr__(name: str) -> Callable[..., Awaitable[Any]]:
+    func = getattr(dbutils, name)  # AttributeError for names dbutils doesn't have
+    if not callable(func):
+        raise AttributeError(name)
+
+    @functools.wraps(func)
+    async def call(*args: Any, **kwargs: Any) -> Any:
+        # looked up again per call so tests can patch the sync function
+        return await run(getattr(dbutils, name), *args, **kwargs)
+
+    return call
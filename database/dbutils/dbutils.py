@@ -3,3 +3,5 @@ from database.dbutils.dbutils_job import *
 from database.dbutils.dbutils_bot import *
 from database.dbutils.dbutils_whitelist import *
 from database.dbutils.dbutils_influx import *
+from database.dbutils.dbutils_lock import *
+from database.dbutils.dbutils_quota import *
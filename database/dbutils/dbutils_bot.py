@@ -9,7 +9,7 @@ Getters
 
 def find_bot_by_token(db_service: MongoService, bot_token: str) -> Optional[Any]:
     q = {"token": bot_token}
-    return db_service.find_one_bot(q)
+    return db_service.remember(("bot", bot_token), lambda: db_service.find_one_bot(q))
 
 
 """
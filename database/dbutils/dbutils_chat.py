@@ -1,17 +1,90 @@
+import config
+import threading
+import time
 from common import log, utils
+from common.cache import TTLCache
 from database.mongo import MongoService
-from typing import Any, Optional
-from datetime import datetime
+from typing import Any, Dict, Iterable, Optional
+from datetime import datetime, timedelta, timezone
 from telegram import Update
 
+# chat documents by float chat_id, read by every command and dispatched job
+# but only written through the setters below, which invalidate them
+chat_cache = TTLCache("chat_data", config.CHAT_CACHE_SIZE, config.CHAT_CACHE_TTL_SECS)
+signals_lock = threading.Lock()
+signals_polled = {"at": 0.0, "since": datetime.now(timezone.utc)}
+
+
+"""
+Cache
+"""
+
+
+def poll_cache_signals(db_service: MongoService) -> None:
+    # evicts chats that other processes changed since the last poll
+    if not config.CHAT_CACHE_SIGNAL:
+        return
+    with signals_lock:
+        if time.monotonic() < signals_polled["at"] + config.CHAT_CACHE_SIGNAL_SECS:
+            return
+        since = signals_polled["since"]
+        signals_polled["at"] = time.monotonic()
+        # overlap the next poll, so signals written late or with clock skew are seen
+        overlap = timedelta(seconds=config.CHAT_CACHE_SIGNAL_SECS)
+        signals_polled["since"] = datetime.now(timezone.utc) - overlap
+    for signal in db_service.find_cache_signals({"at": {"$gt": since}}):
+        if signal["chat_id"] is None:
+            chat_cache.clear()
+        else:
+            chat_cache.invalidate(signal["chat_id"])
+
+
+def invalidate_chat(db_service: MongoService, chat_id: Optional[Any]) -> None:
+    # chat_id None drops every cached chat
+    chat_id = None if chat_id is None else float(chat_id)
+    if chat_id is None:
+        chat_cache.clear()
+    else:
+        chat_cache.invalidate(chat_id)
+    if config.CHAT_CACHE_SIGNAL:
+        signal = {"chat_id": chat_id, "at": datetime.now(timezone.utc)}
+        db_service.insert_cache_signal(signal)
+
+
 """
 Getters
 """
 
 
+def load_chat(db_service: MongoService, chat_id: float) -> Optional[Any]:
+    poll_cache_signals(db_service)
+    chat = chat_cache.get(chat_id)
+    if chat is None:
+        # misses aren't cached, /start in another process must show up at once
+        chat = db_service.find_one_chat_entry({"chat_id": chat_id})
+        if chat is not None:
+            chat_cache.put(chat_id, chat)
+    return None if chat is None else dict(chat)
+
+
 def find_chat_by_chatid(db_service: MongoService, chat_id: int) -> Optional[Any]:
-    q = {"chat_id": float(chat_id)}
-    return db_service.find_one_chat_entry(q)
+    key = float(chat_id)
+    return db_service.remember(("chat", key), lambda: load_chat(db_service, key))
+
+
+def find_chats_by_chatids(
+    db_service: MongoService, chat_ids: Iterable[Any]
+) -> Dict[float, Any]:
+    poll_cache_signals(db_service)
+    chats = {}
+    for chat_id in {float(chat_id) for chat_id in chat_ids}:
+        chats[chat_id] = chat_cache.get(chat_id)
+    missing = [chat_id for chat_id, chat in chats.items() if chat is None]
+    if len(missing) > 0:
+        for chat in db_service.find_chat_entries({"chat_id": {"$in": missing}}):
+            chat_cache.put(chat["chat_id"], chat)
+            chats[chat["chat_id"]] = chat
+    return {chat_id: dict(chat) for chat_id, chat in chats.items() if chat is not None}
 
 
 def find_chat_by_title(
@@ -60,6 +133,7 @@ def add_chat_data(
         "user_bot_token": None,
     }
     db_service.insert_new_chat(new_doc)
+    invalidate_chat(db_service, chat_id)
     log.log_new_chat(chat_id, chat_title)
 
 
@@ -73,6 +147,7 @@ def update_chats_tz_by_type(
     payload = {"tz_offset": tz_offset, "utc_tz": utc_tz, "updated_ts": utils.now()}
     q = {"created_by": user_id, "chat_type": chat_type}
     mongo_response = db_service.update_chat_entries(q, payload)
+    invalidate_chat(db_service, None)  # rare, not worth finding out which chats
     modified_count = mongo_response.modified_count
     log.log_chats_tz_updated_by_type(modified_count, user_id, chat_type, tz_offset)
 
@@ -85,4 +160,5 @@ def update_chat_entry(
 ) -> None:
     q = {"chat_id": chat_id}
     db_service.update_one_chat_entry(q, update)
+    invalidate_chat(db_service, chat_id)
     log.log_chat_entry_updated(chat_id, updated_field, update[updated_field])
@@ -1,9 +1,48 @@
+import config
+import re
+from collections import Counter
 from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from common import utils
-from common.enums import ContentType
+from common.enums import ContentType, JobState
+from datetime import datetime, timezone
+from database import schema, writeback
+from database.dbutils import dbutils_quota
 from database.mongo import MongoService
 from common import log, utils
-from typing import List, Optional, Dict, Any
+from typing import Callable, Iterator, List, Optional, Dict, Any
+
+# called with (job_id, nextrun_ts) whenever a write may move a job's next run,
+# nextrun_ts is None when the job no longer runs (paused or removed)
+nextrun_listeners: List[Callable[[Any, Optional[str]], None]] = []
+
+# what a dispatch worker reads from a claimed job
+DISPATCH_PROJECTION = {
+    field: 1
+    for field in [
+        "chat_id",
+        "channel_id",
+        "created_by",
+        "crontab",
+        "content",
+        "content_type",
+        "photo_id",
+        "photo_group_id",
+        "previous_message_id",
+        "option_delete_previous",
+        "user_bot_token",
+        "message_thread_id",
+        "error_count",
+        "errors",  # counted for jobs that have no error_count yet
+    ]
+}
+
+SCHEDULED_Q = {
+    "removed_ts": "",
+    "crontab": {"$ne": ""},
+    "nextrun_ts": {"$ne": ""},
+    "$or": [{"paused_ts": ""}, {"paused_ts": {"$exists": False}}],
+}
 
 
 """
@@ -13,10 +52,9 @@ Getters
 
 def find_latest_entry(db_service: MongoService, chat_id: int) -> Optional[Any]:
     q = {"chat_id": float(chat_id), "removed_ts": ""}
-    result = db_service.find_entries(q, [("created_ts", DESCENDING)])
-    if len(result) <= 0:
-        return None
-    return result[0]
+    sort = [("created_ts", DESCENDING)]
+    key = ("latest_job", float(chat_id))
+    return db_service.remember(key, lambda: db_service.find_one_entry(q, sort))
 
 
 def find_entry_by_jobname(
@@ -25,7 +63,8 @@ def find_entry_by_jobname(
     q = {"chat_id": float(chat_id), "jobname": jobname}
     if not include_removed:
         q["removed_ts"] = ""
-    return db_service.find_one_entry(q)
+    key = ("job", float(chat_id), jobname, include_removed)
+    return db_service.remember(key, lambda: db_service.find_one_entry(q))
 
 
 def find_entries_removed_between(
@@ -40,17 +79,77 @@ def find_entries_removed_between(
     return db_service.find_entries(q)
 
 
-def find_entries_by_nextrun(db_service: MongoService, ts: str) -> List[Optional[Any]]:
-    base_q = {"nextrun_ts": {"$lte": ts}, "removed_ts": "", "crontab": {"$ne": ""}}
-    # Only return messages that are not pending, or pending for more than 5 mins.
-    base_q["$or"] = [{"pending_ts": None}, {"pending_ts": {"$lte": utils.now(-5)}}]
-    q = {
-        "$or": [
-            {"paused_ts": "", **base_q},
-            {"paused_ts": {"$exists": False}, **base_q},
-        ]
+def unclaimed_q(lease_owner: Optional[str] = None) -> List[Dict[str, Any]]:
+    now = utils.now()
+    q = [
+        {"pending_ts": None},
+        {"lease_expires_ts": {"$lte": now}},
+        # claimed before leases existed, fall back to the old pending window
+        {
+            "lease_expires_ts": {"$exists": False},
+            "pending_ts": {"$lte": utils.now(-config.DISPATCH_LEASE_MINS)},
+        },
+    ]
+    if lease_owner is not None:
+        q.append({"lease_owner": lease_owner})  # our own claim, e.g. a 429 retry
+    return q
+
+
+def due_q(ts: str) -> Dict[str, Any]:
+    due = {"nextrun_at": {"$lte": schema.to_utc(ts)}}
+    if not config.JOB_SCHEMA_DUAL_READ:
+        return due
+    # v1 documents the datetime migration hasn't reached yet
+    legacy = {"nextrun_at": {"$exists": False}, "nextrun_ts": {"$lte": ts}}
+    return {"$or": [due, legacy]}
+
+
+def legacy_nextrun_q(ts: str) -> Dict[str, Any]:
+    # documents the state backfill hasn't reached yet
+    return {
+        "state": {"$exists": False},
+        "removed_ts": "",
+        "crontab": {"$ne": ""},
+        "paused_ts": {"$in": ["", None]},
+        "$and": [due_q(ts), {"$or": unclaimed_q()}],
     }
-    return db_service.find_entries(q, [("created_at", ASCENDING)])
+
+
+def nextrun_q(ts: str) -> Dict[str, Any]:
+    # Only active jobs, claimed ones are pending until released or their lease
+    # is swept by release_expired_leases. Jobs without a crontab have no nextrun.
+    q = {"state": JobState.ACTIVE.value, **due_q(ts)}
+    if not config.JOB_SCHEMA_DUAL_READ:
+        return q
+    return {"$or": [q, legacy_nextrun_q(ts)]}
+
+
+# longest overdue first, the order state_nextrun_at already returns, so the
+# cursor streams instead of sorting every due id in memory
+DUE_SORT = [("nextrun_at", ASCENDING)]
+
+
+def find_entries_by_nextrun(db_service: MongoService, ts: str) -> List[Optional[Any]]:
+    return db_service.find_entries(nextrun_q(ts), DUE_SORT)
+
+
+def iter_entries_by_nextrun(db_service: MongoService, ts: str) -> Iterator[Any]:
+    # ids only, the fields to send are read back once the claim is won
+    return db_service.iter_entries(
+        nextrun_q(ts),
+        DUE_SORT,
+        projection={"_id": 1},
+        batch_size=config.DISPATCH_CURSOR_BATCH_SIZE,
+    )
+
+
+def find_scheduled_nextruns(db_service: MongoService) -> List[Optional[Any]]:
+    return db_service.find_entries(SCHEDULED_Q, projection={"nextrun_ts": 1})
+
+
+def find_earliest_nextrun(db_service: MongoService) -> Optional[Any]:
+    sort = [("nextrun_ts", ASCENDING)]
+    return db_service.find_one_entry(SCHEDULED_Q, sort, projection={"nextrun_ts": 1})
 
 
 def find_entries_by_content_type(
@@ -85,8 +184,7 @@ Setters
 """
 
 
-def add_new_entry(
-    db_service: MongoService,
+def new_entry_doc(
     chat_id: int,
     jobname: str,  # must have jobname for /delete
     user_id: int,
@@ -102,33 +200,168 @@ def add_new_entry(
     user_bot_token: Optional[str] = None,
     message_thread_id: Optional[int] = None,
     errors: List[Exception] = [],
-) -> None:
-    db_service.insert_new_entry(
-        {
-            "created_by": user_id,
-            "last_updated_by": user_id,
-            "chat_id": chat_id,
-            "channel_id": channel_id,
-            "jobname": jobname,
-            "crontab": crontab,
-            "content": content,
-            "content_type": content_type,
-            "photo_id": photo_id,
-            "photo_group_id": photo_group_id,
-            "previous_message_id": "",
-            "option_delete_previous": "",
-            "nextrun_ts": nextrun_ts,
-            "user_nextrun_ts": user_nextrun_ts,
-            "pending_ts": pending_ts,
-            "removed_ts": "",
-            "remarks": "",
-            "user_bot_token": user_bot_token,
-            "message_thread_id": message_thread_id,
-            "errors": errors,
+) -> Dict[str, Any]:
+    return {
+        "created_by": user_id,
+        "last_updated_by": user_id,
+        "chat_id": chat_id,
+        "channel_id": channel_id,
+        "jobname": jobname,
+        "crontab": crontab,
+        "content": content,
+        "content_type": content_type,
+        "photo_id": photo_id,
+        "photo_group_id": photo_group_id,
+        "previous_message_id": "",
+        "option_delete_previous": "",
+        "nextrun_ts": nextrun_ts,
+        "user_nextrun_ts": user_nextrun_ts,
+        "pending_ts": pending_ts,
+        "removed_ts": "",
+        "state": JobState.ACTIVE.value,
+        "remarks": "",
+        "user_bot_token": user_bot_token,
+        "message_thread_id": message_thread_id,
+        "errors": list(errors),
+        "error_count": len(errors),
+        "last_error": errors[-1] if len(errors) > 0 else None,
+    }
+
+
+def add_new_entry(db_service: MongoService, **fields: Any) -> bool:
+    # fields as in new_entry_doc, False when an active job in the chat took the
+    # name since it was checked
+    new_doc = new_entry_doc(**fields)
+    try:
+        db_service.insert_new_entry(new_doc)
+    except DuplicateKeyError as err:
+        log.log_new_entry_failed(new_doc["jobname"], new_doc["chat_id"], repr(err))
+        return False
+    dbutils_quota.update_user_quotas(db_service, {new_doc["created_by"]: 1})
+
+    log.log_new_entry(new_doc["jobname"], new_doc["chat_id"])
+    notify_nextrun(new_doc)
+    return True
+
+
+def add_new_entries(
+    db_service: MongoService, entries: List[Dict[str, Any]]
+) -> Dict[int, str]:
+    # entries are new_entry_doc fields, returns {index: error} for the ones not added
+    docs = [new_entry_doc(**fields) for fields in entries]
+    if len(docs) < 1:
+        return {}
+
+    failed: Dict[int, str] = {}
+    try:
+        db_service.insert_new_entries(docs)
+    except BulkWriteError as err:
+        for write_error in err.details.get("writeErrors", []):
+            failed[write_error["index"]] = write_error.get("errmsg", "")
+    except Exception as err:  # nothing acknowledged, report every doc
+        failed = {i: repr(err) for i in range(len(docs))}
+
+    added = [doc for i, doc in enumerate(docs) if i not in failed]
+    if len(added) > 0:
+        dbutils_quota.update_user_quotas(
+            db_service, Counter(doc["created_by"] for doc in added)
+        )
+    for i, errmsg in failed.items():
+        log.log_new_entry_failed(docs[i]["jobname"], docs[i]["chat_id"], errmsg)
+    log.log_new_entries(len(added), len(failed))
+    for doc in added:
+        notify_nextrun(doc)
+    return failed
+
+
+def jobname_seed(db_service: MongoService, chat_id: int, prefix: str) -> int:
+    # highest "prefix (n)" the chat has used, one regex query per new counter
+    pattern = r"^%s \((\d+)\)$" % re.escape(prefix)
+    q = {"chat_id": float(chat_id), "jobname": {"$regex": pattern}}
+    numbers = [0]
+    for entry in db_service.find_entries(q, projection={"jobname": 1}):
+        match = re.match(pattern, entry["jobname"])
+        if match is not None:
+            numbers.append(int(match.group(1)))
+    return max(numbers)
+
+
+def allocate_jobname(db_service: MongoService, chat_id: int, prefix: str) -> str:
+    return allocate_jobnames(db_service, chat_id, prefix, 1)[0]
+
+
+def allocate_jobnames(
+    db_service: MongoService, chat_id: int, prefix: str, count: int
+) -> List[str]:
+    # one atomic $inc per batch of names, so concurrent updates never share one
+    counter_id = {"chat_id": float(chat_id), "jobname_prefix": prefix}
+    jobnames: List[str] = []
+    while len(jobnames) < count:
+        wanted = count - len(jobnames)
+        last = db_service.increment_counter(counter_id, wanted)
+        if last is None:
+            seed = jobname_seed(db_service, chat_id, prefix)
+            db_service.seed_counter(counter_id, seed)
+            continue
+        names = ["%s (%d)" % (prefix, n) for n in range(last - wanted + 1, last + 1)]
+        # names typed in by hand aren't counted, skip the ones that are taken
+        q = {"chat_id": float(chat_id), "jobname": {"$in": names}, "removed_ts": ""}
+        taken = {
+            entry["jobname"]
+            for entry in db_service.find_entries(q, projection={"jobname": 1})
         }
-    )
+        jobnames += [jobname for jobname in names if jobname not in taken]
+    return jobnames
+
 
-    log.log_new_entry(jobname, chat_id)
+def free_jobname(db_service: MongoService, chat_id: int, jobname: str) -> str:
+    # jobname itself if no active job in the chat uses it, else "jobname (n)"
+    candidate, n = jobname, 0
+    while entry_exists(db_service, chat_id, candidate):
+        n += 1
+        candidate = "%s (%d)" % (jobname, n)
+    return candidate
+
+
+def find_duplicate_jobnames(db_service: MongoService) -> List[Any]:
+    # ids of active jobs sharing a chat and jobname, oldest first
+    pipeline = [
+        {"$match": {"removed_ts": ""}},
+        {"$sort": {"created_ts": ASCENDING, "_id": ASCENDING}},
+        {
+            "$group": {
+                "_id": {"chat_id": "$chat_id", "jobname": "$jobname"},
+                "ids": {"$push": "$_id"},
+            }
+        },
+        {"$match": {"ids.1": {"$exists": True}}},
+    ]
+    return db_service.aggregate_entries(pipeline)
+
+
+def rename_duplicate_jobnames(db_service: MongoService) -> int:
+    # keeps the oldest job of each duplicate under its name, renames the rest
+    renamed = 0
+    for group in find_duplicate_jobnames(db_service):
+        chat_id, jobname = group["_id"]["chat_id"], group["_id"]["jobname"]
+        for job_id in group["ids"][1:]:
+            new_jobname = free_jobname(db_service, chat_id, jobname)
+            db_service.update_entry({"_id": job_id}, {"jobname": new_jobname})
+            log.log_jobname_renamed(job_id, jobname, new_jobname)
+            renamed += 1
+    return renamed
+
+
+def notify_nextrun(update: Optional[Any], job_id: Optional[Any] = None) -> None:
+    job_id = update.get("_id") if job_id is None else job_id
+    if job_id is None or len(nextrun_listeners) < 1:
+        return
+    inactive = update.get("removed_ts", "") != "" or update.get("paused_ts", "") != ""
+    if not inactive and "nextrun_ts" not in update:
+        return
+    nextrun_ts = None if inactive else (update["nextrun_ts"] or None)
+    for listener in nextrun_listeners:
+        listener(job_id, nextrun_ts)
 
 
 def update_entry_by_jobname(
@@ -140,7 +373,9 @@ def update_entry_by_jobname(
         "jobname": entry["jobname"],
         "removed_ts": "",
     }
-    return db_service.update_entry(q, update)
+    res = db_service.update_entry(q, update)
+    notify_nextrun(update, entry.get("_id"))
+    return res
 
 
 def update_entry_by_jobid(
@@ -152,10 +387,157 @@ def update_entry_by_jobid(
     q: Dict[str, Any] = {"_id": entry_id}
     if not include_removed:
         q["removed_ts"] = ""
-    return db_service.update_entry(q, update)
+    res = db_service.update_entry(q, update)
+    notify_nextrun(update, entry_id)
+    return res
+
+
+def insert_job_error(
+    db_service: MongoService, job_id: Any, error: Dict[str, Any]
+) -> None:
+    # full history, the job itself only keeps the latest config.JOB_ERRORS_KEPT
+    try:
+        db_service.insert_job_error({"job_id": job_id, **error})
+    except Exception as err:
+        log.log_job_error_history_failed(job_id, err)
+
+
+def find_job_errors(db_service: MongoService, job_id: Any) -> List[Optional[Any]]:
+    return db_service.find_job_errors({"job_id": job_id})
+
+
+def recompute_nextruns(
+    db_service: MongoService, chat_ids: List[int], tz_offset: float
+) -> int:
+    # one read and one bulk write for every scheduled job in the chats
+    q = {
+        "chat_id": {"$in": [float(chat_id) for chat_id in chat_ids]},
+        "removed_ts": "",
+        "nextrun_ts": {"$nin": ["", None]},
+    }
+    entries = db_service.find_entries(q, projection={"crontab": 1})
+    crontabs = [entry.get("crontab", "") for entry in entries]
+    next_runs = utils.calc_next_runs(crontabs, tz_offset)
+
+    updates = []
+    for entry, crontab in zip(entries, crontabs):
+        if next_runs[crontab] is None:
+            continue  # left as it was, same as the dispatcher would
+        user_nextrun_ts, nextrun_ts = next_runs[crontab]
+        payload = {"nextrun_ts": nextrun_ts, "user_nextrun_ts": user_nextrun_ts}
+        updates.append(({"_id": entry["_id"], "removed_ts": ""}, payload))
+    if len(updates) < 1:
+        return 0
+
+    failed = writeback.bulk_update(db_service, updates, only_matched=True)
+    for i, (q, update) in enumerate(updates):
+        if i not in failed:
+            notify_nextrun(update, q["_id"])
+    log.log_nextruns_recomputed(len(updates) - len(failed), len(chat_ids), tz_offset)
+    return len(updates) - len(failed)
+
+
+def revive_entry(
+    db_service: MongoService, entry: Dict[str, Any], payload: Dict[str, Any]
+) -> Optional[Any]:
+    # the name may have been reused since the job was removed, revive it under
+    # a free one; None when it was taken again before the write
+    jobname = free_jobname(db_service, entry["chat_id"], entry["jobname"])
+    if jobname != entry["jobname"]:
+        payload = {**payload, "jobname": jobname}
+        log.log_jobname_renamed(entry["_id"], entry["jobname"], jobname)
+    try:
+        res = update_entry_by_jobid(
+            db_service, entry["_id"], payload, include_removed=True
+        )
+    except DuplicateKeyError:
+        log.log_revive_skipped(entry["_id"], jobname)
+        return None
+    if res.modified_count > 0:
+        dbutils_quota.update_user_quotas(db_service, {entry.get("created_by"): 1})
+    return res
+
+
+def claim_q(entry_id: Any, ts: str, lease_owner: str) -> Dict[str, Any]:
+    # re-checks due and unclaimed in the same write, so a job read by several
+    # dispatchers is only sent by the one that wins the claim
+    claimable: List[Dict[str, Any]] = [
+        {"state": JobState.ACTIVE.value},
+        # our own claim, e.g. a 429 retry
+        {"state": JobState.PENDING.value, "lease_owner": lease_owner},
+        {
+            "state": JobState.PENDING.value,
+            "lease_expires_at": {"$lte": datetime.now(timezone.utc)},
+        },
+    ]
+    if config.JOB_SCHEMA_DUAL_READ:
+        claimable.append(
+            {
+                "state": {"$exists": False},
+                "removed_ts": "",
+                "$or": unclaimed_q(lease_owner),
+            }
+        )
+    return {"_id": entry_id, "$and": [due_q(ts), {"$or": claimable}]}
+
+
+def claim_payload(lease_owner: str) -> Dict[str, Any]:
+    return {
+        "state": JobState.PENDING.value,
+        "pending_ts": utils.now(),
+        "lease_owner": lease_owner,
+        "lease_expires_ts": utils.now(config.DISPATCH_LEASE_MINS),
+    }
+
+
+def claimed_q(entry_id: Any, lease_owner: str) -> Dict[str, Any]:
+    # matches nothing once the lease was lost, the new owner writes the outcome,
+    # or once the job was paused or removed while it was being sent
+    return {
+        "_id": entry_id,
+        "state": JobState.PENDING.value,
+        "lease_owner": lease_owner,
+    }
+
+
+def claim_entries(
+    db_service: MongoService, entries: List[Optional[Any]], ts: str, lease_owner: str
+) -> List[Optional[Any]]:
+    # one bulk write to claim, one read to see which claims we won
+    if len(entries) < 1:
+        return []
+    payload = claim_payload(lease_owner)
+    writeback.bulk_update(
+        db_service,
+        [(claim_q(entry["_id"], ts, lease_owner), payload) for entry in entries],
+    )
+    ids = [entry["_id"] for entry in entries]
+    q = {"_id": {"$in": ids}, "lease_owner": lease_owner}
+    claimed = db_service.find_entries(q, projection=DISPATCH_PROJECTION)
+    claimed = {entry["_id"]: entry for entry in claimed}
+    return [claimed[i] for i in ids if i in claimed]  # keep the due order
 
 
 def remove_entries_by_chat(db_service: MongoService, chat_id: int) -> None:
     q = {"chat_id": float(chat_id)}
-    payload = {"removed_ts": utils.now()}
+    active_q = {**q, "removed_ts": ""}
+    removed = db_service.find_entries(active_q, projection={"created_by": 1})
+    payload = {"removed_ts": utils.now(), "state": JobState.REMOVED.value}
     db_service.update_multiple_entries(q, payload)
+    removed_by = Counter(entry.get("created_by") for entry in removed)
+    dbutils_quota.update_user_quotas(db_service, {u: -n for u, n in removed_by.items()})
+
+
+def release_expired_leases(db_service: MongoService) -> Any:
+    # claims left behind by a dispatcher that died mid-run go back to active
+    q = {
+        "state": JobState.PENDING.value,
+        "lease_expires_at": {"$lte": datetime.now(timezone.utc)},
+    }
+    payload = {
+        "state": JobState.ACTIVE.value,
+        "pending_ts": None,
+        "lease_owner": None,
+        "lease_expires_ts": None,
+    }
+    return db_service.update_multiple_entries(q, payload)
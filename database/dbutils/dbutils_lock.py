@@ -0,0 +1,22 @@
+from database.mongo import MongoService
+from datetime import datetime, timedelta, timezone
+
+"""
+Setters
+"""
+
+
+def acquire_lock(db_service: MongoService, name: str, owner: str, ttl: int) -> bool:
+    # takes a free or expired lock, or renews our own
+    now = datetime.now(timezone.utc)
+    q = {"_id": name, "$or": [{"owner": owner}, {"expires_at": {"$lte": now}}]}
+    payload = {
+        "owner": owner,
+        "renewed_at": now,
+        "expires_at": now + timedelta(seconds=ttl),
+    }
+    return db_service.acquire_lock(q, payload)
+
+
+def release_lock(db_service: MongoService, name: str, owner: str) -> None:
+    db_service.delete_lock({"_id": name, "owner": owner})
@@ -0,0 +1,81 @@
+from database.mongo import MongoService
+from typing import Any, Dict, Optional
+
+"""
+user_quota keeps each user's active job count next to their whitelist limit,
+so the limit check is one read by _id. Job writers adjust job_count with $inc,
+scripts/reconcile_user_quota.py repairs drift and picks up whitelist edits
+"""
+
+
+"""
+Getters
+"""
+
+
+def count_user_quota(db_service: MongoService, user_id: int) -> Dict[str, Any]:
+    # new_limit is None for users without a whitelist entry
+    job_count = db_service.count_entries({"created_by": user_id, "removed_ts": ""})
+    q = {"user_id": float(user_id), "removed_ts": ""}
+    whitelist = db_service.find_one_whitelist(q)
+    new_limit = None if whitelist is None else whitelist.get("new_limit", 0)
+    return {"job_count": job_count, "new_limit": new_limit}
+
+
+def find_user_quota(db_service: MongoService, user_id: int) -> Dict[str, Any]:
+    q = {"_id": float(user_id)}
+    quota = db_service.find_one_user_quota(q)
+    if quota is None:
+        # first check since quotas were introduced, count once
+        quota = count_user_quota(db_service, user_id)
+        db_service.insert_user_quota(q, quota)
+    return quota
+
+
+def expected_user_quotas(db_service: MongoService) -> Dict[float, Dict[str, Any]]:
+    # what every quota should be, from one $group over active jobs
+    quotas: Dict[float, Dict[str, Any]] = {}
+    pipeline = [
+        {"$match": {"removed_ts": ""}},
+        {"$group": {"_id": "$created_by", "job_count": {"$sum": 1}}},
+    ]
+    for group in db_service.aggregate_entries(pipeline):
+        if group["_id"] is not None:
+            quotas[float(group["_id"])] = {"job_count": group["job_count"]}
+    for entry in db_service.find_whitelist_entries({"removed_ts": ""}):
+        quota = quotas.setdefault(float(entry["user_id"]), {"job_count": 0})
+        quota["new_limit"] = entry.get("new_limit", 0)
+    # users whose jobs are all gone still need their count back at 0
+    for entry in db_service.find_user_quotas({}):
+        quotas.setdefault(entry["_id"], {"job_count": 0})
+    for quota in quotas.values():
+        quota.setdefault("new_limit", None)
+    return quotas
+
+
+def find_user_quotas(db_service: MongoService) -> Dict[float, Dict[str, Any]]:
+    return {entry["_id"]: entry for entry in db_service.find_user_quotas({})}
+
+
+"""
+Setters
+"""
+
+
+def update_user_quotas(db_service: MongoService, job_counts: Dict[Any, int]) -> None:
+    # {user_id: change in active jobs}, users without a quota yet are counted
+    # on their first check instead
+    updates = [
+        ({"_id": float(user_id)}, {"job_count": change})
+        for user_id, change in job_counts.items()
+        if user_id is not None and change != 0
+    ]
+    if len(updates) > 0:
+        db_service.update_user_quotas(updates)
+
+
+def reset_user_quota(
+    db_service: MongoService, user_id: Any, job_count: int, new_limit: Optional[int]
+) -> None:
+    q = {"_id": float(user_id)}
+    db_service.replace_user_quota(q, {"job_count": job_count, "new_limit": new_limit})
@@ -1,14 +1,22 @@
 from telegram import Update
 
-from email import utils
+import config
+import threading
 from common import log, utils
-from typing import Any, Optional
+from common.cache import TTLCache
+from typing import Any, Dict, Optional
 
 
 MongoService = (
     Any  # Placeholder for the actual MongoService class due to cyclic imports
 )
 
+# current user document by float user_id, so an unchanged user costs no read
+user_cache = TTLCache("user_data", config.USER_CACHE_SIZE, config.USER_CACHE_TTL_SECS)
+# last_used_at by user document _id, written in one bulk_write per flush
+touches: Dict[Any, str] = {}
+touches_lock = threading.Lock()
+
 
 """
 Getters
@@ -16,8 +24,13 @@ Getters
 
 
 def retrieve_user_data(db_service: MongoService, user_id: int) -> Optional[Any]:
-    q = {"user_id": float(user_id), "superseded_at": ""}
-    return db_service.find_one_user(q)
+    user = user_cache.get(float(user_id))
+    if user is None:
+        q = {"user_id": float(user_id), "superseded_at": ""}
+        user = db_service.find_one_user(q)
+        if user is not None:
+            user_cache.put(float(user_id), user)
+    return user
 
 
 """
@@ -35,24 +48,43 @@ def add_user(
         "superseded_at": "",
         "field_changed": "",
     }
-    db_service.insert_new_user(new_doc)
+    db_service.insert_new_user(new_doc)  # sets new_doc["_id"]
+    user_cache.put(float(user_id), new_doc)
     log.log_new_user(user_id, username)
 
 
 def supersede_user(
     db_service: MongoService, entry: Optional[Any], field_changed: Any
-) -> None:
-    # update previous entry
-    q = {"_id": entry["_id"]}
+) -> bool:
+    # update previous entry, returns False if another process superseded it first
+    user_cache.invalidate(float(entry["user_id"]))
+    q = {"_id": entry["_id"], "superseded_at": ""}
     payload = {"superseded_at": utils.now(), "field_changed": field_changed}
-    db_service.update_one_user(q, payload)
+    if db_service.update_one_user(q, payload).matched_count < 1:
+        return False
     log.log_user_updated(entry)
+    return True
 
 
 def refresh_user(db_service: MongoService, entry: Optional[Any]) -> None:
-    q = {"_id": entry["_id"]}
-    payload = {"last_used_at": utils.now()}
-    db_service.update_one_user(q, payload)
+    # only noted here, flush_user_touches writes it
+    with touches_lock:
+        touches[entry["_id"]] = utils.now()
+
+
+def flush_user_touches(db_service: MongoService) -> int:
+    with touches_lock:
+        batch = list(touches.items())
+        touches.clear()
+    if len(batch) < 1:
+        return 0
+    updates = [({"_id": _id}, {"last_used_at": ts}) for _id, ts in batch]
+    try:
+        db_service.bulk_update_users(updates)
+    except Exception as err:  # last_used_at is informational, drop the batch
+        log.log_user_touches_failed(len(batch), err)
+        return 0
+    return len(batch)
 
 
 def sync_user_data(db_service: MongoService, update: Update) -> None:
@@ -73,14 +105,16 @@ def sync_user_data(db_service: MongoService, update: Update) -> None:
         None if user.get("username", "") == "" else user.get("username", "")
     )  # username could be None
     if update.message.from_user.username != previous_username:
-        supersede_user(db_service, user, "username")
+        if not supersede_user(db_service, user, "username"):
+            return sync_user_data(db_service, update)  # cached copy was stale
         add_user(db_service, user_id, username, user.get("first_name", ""))
         sync_user_data(db_service, update)
         return log.log_username_updated(update)
 
     # check that firstname hasn't changed
     if update.message.from_user.first_name != str(user.get("first_name", "")):
-        supersede_user(db_service, user, "first_name")
+        if not supersede_user(db_service, user, "first_name"):
+            return sync_user_data(db_service, update)
         add_user(db_service, user_id, username, first_name)
         return log.log_firstname_updated(update)
 
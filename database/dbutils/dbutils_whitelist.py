@@ -4,14 +4,11 @@ from typing import Tuple
 
 
 def get_user_limit(db_service, user_id) -> Tuple[int, int]:
-    current_job_count = dbutils.count_entries_by_userid(db_service, user_id)
+    quota = dbutils.find_user_quota(db_service, user_id)
+    current_job_count = quota["job_count"]
 
-    q = {"user_id": float(user_id), "removed_ts": ""}
-    result = db_service.find_one_whitelist(q)
-
-    if result is None:
+    if quota["new_limit"] is None:
         exceeded = current_job_count >= config.JOB_LIMIT_PER_PERSON
         return (exceeded, config.JOB_LIMIT_PER_PERSON)
 
-    new_limit = result.get("new_limit", 0)
-    return (current_job_count, new_limit)
+    return (current_job_count, quota["new_limit"])
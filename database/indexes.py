@@ -0,0 +1,249 @@
+import config
+from common import log, metrics, utils
+from common.enums import JobState
+from database import archive, schema
+from database.dbutils import dbutils_job
+from database.mongo import MongoService
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from typing import Any, Dict, List, Optional, Tuple
+
+"""
+Declarative index registry, ensured at startup, plus an explain() check that
+every hot query shape is served by an index instead of a collection scan
+"""
+
+ACTIVE_JOB = {"removed_ts": ""}
+
+INDEXES: Dict[str, List[IndexModel]] = {
+    config.MONGODB_JOB_DATA_COLLECTION: [
+        # the timer scheduler and the legacy due read, until nextrun_ts is gone
+        IndexModel(
+            [("nextrun_ts", ASCENDING)],
+            name="active_nextrun",
+            partialFilterExpression=ACTIVE_JOB,
+        ),
+        # the due query, one equality on state plus the nextrun range
+        IndexModel(
+            [("state", ASCENDING), ("nextrun_at", ASCENDING)],
+            name="state_nextrun_at",
+        ),
+        IndexModel(
+            [("state", ASCENDING), ("lease_expires_at", ASCENDING)],
+            name="state_lease_expires_at",
+        ),
+        IndexModel(
+            [("chat_id", ASCENDING), ("jobname", ASCENDING), ("removed_ts", ASCENDING)],
+            name="chat_jobname",
+        ),
+        IndexModel(
+            [("created_by", ASCENDING), ("removed_ts", ASCENDING)],
+            name="created_by",
+        ),
+        # only removed jobs, for the archiver walking them oldest first
+        IndexModel(
+            [("removed_ts", ASCENDING), ("_id", ASCENDING)],
+            name="removed",
+            partialFilterExpression={"removed_ts": {"$gt": ""}},
+        ),
+    ],
+    config.MONGODB_JOB_ARCHIVE_COLLECTION: [
+        IndexModel([("removed_ts", ASCENDING)], name="removed_ts"),
+        IndexModel(
+            [("archived_at", ASCENDING)],
+            name="archived_at_ttl",
+            expireAfterSeconds=config.JOB_ARCHIVE_RETENTION_DAYS * 24 * 3600,
+        ),
+    ],
+    config.MONGODB_JOB_ERRORS_COLLECTION: [
+        IndexModel([("job_id", ASCENDING)], name="job_id"),
+    ],
+    config.MONGODB_CHAT_DATA_COLLECTION: [
+        IndexModel([("chat_id", ASCENDING)], name="chat_id"),
+    ],
+    config.MONGODB_CACHE_SIGNAL_COLLECTION: [
+        # a signal only matters until every process has polled it
+        IndexModel([("at", ASCENDING)], name="at_ttl", expireAfterSeconds=3600),
+    ],
+    config.MONGODB_USER_DATA_COLLECTION: [
+        IndexModel(
+            [("user_id", ASCENDING), ("superseded_at", ASCENDING)],
+            name="user_current",
+        ),
+    ],
+    config.MONGODB_BOT_DATA_COLLECTION: [
+        IndexModel([("token", ASCENDING)], name="token"),
+        IndexModel([("id", ASCENDING)], name="bot_id"),
+    ],
+    config.MONGODB_USER_WHITELIST_COLLECTION: [
+        IndexModel(
+            [("user_id", ASCENDING), ("removed_ts", ASCENDING)],
+            name="user_active",
+        ),
+    ],
+}
+
+
+# built one at a time after INDEXES, existing duplicates fail only the index
+# they violate, see scripts/dedupe_jobnames.py
+UNIQUE_INDEXES: Dict[str, List[IndexModel]] = {
+    config.MONGODB_JOB_DATA_COLLECTION: [
+        # jobnames identify jobs in /delete and /edit, so active ones are unique
+        IndexModel(
+            [("chat_id", ASCENDING), ("jobname", ASCENDING)],
+            name="active_chat_jobname",
+            unique=True,
+            partialFilterExpression=ACTIVE_JOB,
+        ),
+    ],
+}
+
+
+def query_shapes() -> List[Tuple[str, str, Dict[str, Any], Optional[List]]]:
+    # (name, collection, filter, sort) of the queries on hot paths
+    return [
+        (
+            "due_jobs",
+            config.MONGODB_JOB_DATA_COLLECTION,
+            dbutils_job.nextrun_q(utils.now()),
+            dbutils_job.DUE_SORT,
+        ),
+        (
+            "expired_leases",
+            config.MONGODB_JOB_DATA_COLLECTION,
+            {
+                "state": JobState.PENDING.value,
+                "lease_expires_at": {"$lte": schema.to_utc(utils.now())},
+            },
+            None,
+        ),
+        (
+            "archivable_jobs",
+            config.MONGODB_JOB_DATA_COLLECTION,
+            archive.archivable_q(utils.now()),
+            archive.ARCHIVE_SORT,
+        ),
+        (
+            "scheduled_jobs",
+            config.MONGODB_JOB_DATA_COLLECTION,
+            dbutils_job.SCHEDULED_Q,
+            [("nextrun_ts", ASCENDING)],
+        ),
+        (
+            "job_by_name",
+            config.MONGODB_JOB_DATA_COLLECTION,
+            {"chat_id": 1.0, "jobname": "", "removed_ts": ""},
+            None,
+        ),
+        (
+            "latest_job",
+            config.MONGODB_JOB_DATA_COLLECTION,
+            {"chat_id": 1.0, "removed_ts": ""},
+            [("created_ts", DESCENDING)],
+        ),
+        (
+            "jobs_by_user",
+            config.MONGODB_JOB_DATA_COLLECTION,
+            {"created_by": 1, "removed_ts": ""},
+            None,
+        ),
+        ("chat_by_id", config.MONGODB_CHAT_DATA_COLLECTION, {"chat_id": 1.0}, None),
+        (
+            "user_by_id",
+            config.MONGODB_USER_DATA_COLLECTION,
+            {"user_id": 1.0, "superseded_at": ""},
+            None,
+        ),
+        ("bot_by_token", config.MONGODB_BOT_DATA_COLLECTION, {"token": ""}, None),
+        (
+            "whitelist_by_user",
+            config.MONGODB_USER_WHITELIST_COLLECTION,
+            {"user_id": 1.0, "removed_ts": ""},
+            None,
+        ),
+    ]
+
+
+# collection -> max size in bytes, created before their indexes
+CAPPED: Dict[str, int] = {
+    config.MONGODB_JOB_ERRORS_COLLECTION: config.JOB_ERRORS_CAP_BYTES,
+}
+
+
+def ensure_capped_collections(db_service: MongoService) -> None:
+    existing = set(db_service.db.list_collection_names())
+    for collection, size in CAPPED.items():
+        try:
+            if collection not in existing:
+                db_service.db.create_collection(collection, capped=True, size=size)
+                log.log_capped_collection_created(collection, size)
+            elif not db_service.db[collection].options().get("capped"):
+                # created by a plain insert before this ran, it would grow
+                # unbounded; the conversion drops its indexes, ensure_indexes
+                # builds them again
+                db_service.db.command("convertToCapped", collection, size=size)
+                log.log_capped_collection_converted(collection, size)
+        except Exception as err:
+            log.log_capped_collection_failed(collection, err)
+
+
+def ensure_indexes(db_service: MongoService) -> None:
+    # create_indexes is a no-op for indexes that already exist with the same spec
+    for collection, indexes in INDEXES.items():
+        try:
+            names = db_service.db[collection].create_indexes(indexes)
+            log.log_indexes_ensured(collection, names)
+        except Exception as err:
+            log.log_indexes_failed(collection, err)
+
+
+def ensure_unique_indexes(db_service: MongoService) -> None:
+    for collection, indexes in UNIQUE_INDEXES.items():
+        for index in indexes:
+            try:
+                names = db_service.db[collection].create_indexes([index])
+                log.log_indexes_ensured(collection, names)
+            except Exception as err:
+                log.log_unique_index_failed(collection, index.document["name"], err)
+
+
+def uses_collscan(plan: Any) -> bool:
+    if isinstance(plan, dict):
+        if plan.get("stage") == "COLLSCAN":
+            return True
+        return any(uses_collscan(value) for value in plan.values())
+    if isinstance(plan, list):
+        return any(uses_collscan(value) for value in plan)
+    return False
+
+
+def verify_query_plans(db_service: MongoService) -> List[str]:
+    # returns the names of query shapes that fell back to a collection scan
+    scans = []
+    for name, collection, q, sort in query_shapes():
+        cursor = db_service.db[collection].find(q)
+        if sort is not None:
+            cursor = cursor.sort(sort)
+        try:
+            plan = cursor.explain()["queryPlanner"]["winningPlan"]
+        except Exception as err:
+            log.log_query_plan_failed(name, err)
+            continue
+
+        collscan = uses_collscan(plan)
+        metrics.mongo_query_collscan.labels(name).set(1 if collscan else 0)
+        if collscan:
+            log.log_query_plan_collscan(name, collection)
+            scans.append(name)
+
+    if len(scans) > 0 and config.INDEX_CHECK_STRICT:
+        raise RuntimeError(f"Hot queries fall back to a collection scan: {scans}")
+    return scans
+
+
+def setup() -> None:
+    # runs once per process, from the FastAPI lifespan or before polling
+    db_service = MongoService()
+    ensure_capped_collections(db_service)
+    ensure_indexes(db_service)
+    ensure_unique_indexes(db_service)
+    verify_query_plans(db_service)
@@ -1,11 +1,90 @@
 import config
-from common import utils
-from pymongo import MongoClient
+import threading
+from common import metrics, utils
+from pymongo import (
+    DeleteOne,
+    MongoClient,
+    ReplaceOne,
+    ReturnDocument,
+    UpdateOne,
+    monitoring,
+)
+from pymongo.errors import DuplicateKeyError
+from database import schema
 from database.dbutils.dbutils_user import sync_user_data
-from typing import Any, List, Optional
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 from telegram import Update
 
 
+# one client per connection string for the whole process, each client owns a
+# connection pool and monitor threads, so MongoService only borrows it
+clients: Dict[Optional[str], MongoClient] = {}
+clients_lock = threading.Lock()
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    def pool_created(self, event: Any) -> None:
+        pass
+
+    def pool_ready(self, event: Any) -> None:
+        pass
+
+    def pool_cleared(self, event: Any) -> None:
+        metrics.mongo_pool_cleared.labels(address(event)).inc()
+
+    def pool_closed(self, event: Any) -> None:
+        pass
+
+    def connection_created(self, event: Any) -> None:
+        metrics.mongo_pool_connections.labels(address(event)).inc()
+
+    def connection_ready(self, event: Any) -> None:
+        pass
+
+    def connection_closed(self, event: Any) -> None:
+        metrics.mongo_pool_connections.labels(address(event)).dec()
+
+    def connection_check_out_started(self, event: Any) -> None:
+        pass
+
+    def connection_check_out_failed(self, event: Any) -> None:
+        metrics.mongo_pool_checkout_failures.labels(address(event), event.reason).inc()
+
+    def connection_checked_out(self, event: Any) -> None:
+        metrics.mongo_pool_checked_out.labels(address(event)).inc()
+
+    def connection_checked_in(self, event: Any) -> None:
+        metrics.mongo_pool_checked_out.labels(address(event)).dec()
+
+
+def address(event: Any) -> str:
+    host, port = event.address
+    return f"{host}:{port}"
+
+
+def get_client(conn_str: Optional[str]) -> MongoClient:
+    with clients_lock:
+        if conn_str not in clients:
+            clients[conn_str] = MongoClient(
+                conn_str,
+                maxPoolSize=config.MONGODB_MAX_POOL_SIZE,
+                minPoolSize=config.MONGODB_MIN_POOL_SIZE,
+                maxIdleTimeMS=config.MONGODB_MAX_IDLE_TIME_MS,
+                connectTimeoutMS=config.MONGODB_CONNECT_TIMEOUT_MS,
+                serverSelectionTimeoutMS=config.MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+                event_listeners=[PoolMetrics()],
+            )
+        return clients[conn_str]
+
+
+def close_clients() -> None:
+    # called from the FastAPI lifespan on shutdown
+    with clients_lock:
+        for client in clients.values():
+            client.close()
+        clients.clear()
+
+
 class MongoService:
     def __init__(
         self,
@@ -13,70 +92,241 @@ class MongoService:
         conn_str: Optional[str] = config.MONGODB_CONNECTION_STRING,
     ) -> None:
         # Provide the mongodb atlas url to connect python to mongodb using pymongo
-
-        # Create a connection using MongoClient. You can import MongoClient or use pymongo.MongoClient
-        client = MongoClient(conn_str)
+        client = get_client(conn_str)
         db = client[config.MONGODB_DB]
+        self.db = db
         self.main_collection = db[config.MONGODB_JOB_DATA_COLLECTION]
         self.chat_data_collection = db[config.MONGODB_CHAT_DATA_COLLECTION]
         self.user_data_collection = db[config.MONGODB_USER_DATA_COLLECTION]
         self.bot_data_collection = db[config.MONGODB_BOT_DATA_COLLECTION]
         self.user_whitelist_collection = db[config.MONGODB_USER_WHITELIST_COLLECTION]
+        self.lock_collection = db[config.MONGODB_LOCK_COLLECTION]
+        self.cache_signal_collection = db[config.MONGODB_CACHE_SIGNAL_COLLECTION]
+        self.counter_collection = db[config.MONGODB_COUNTER_COLLECTION]
+        self.user_quota_collection = db[config.MONGODB_USER_QUOTA_COLLECTION]
+        self.archive_collection = db[config.MONGODB_JOB_ARCHIVE_COLLECTION]
+        self.checkpoint_collection = db[config.MONGODB_CHECKPOINT_COLLECTION]
+        self.job_errors_collection = db[config.MONGODB_JOB_ERRORS_COLLECTION]
+        # documents already read by this service, which the bot builds once
+        # per update, so repeated lookups in one handler cost a single read
+        self.identity_map: Dict[Tuple[Any, ...], Any] = {}
 
         if update is not None:
             sync_user_data(self, update)
 
+    def remember(self, key: Tuple[Any, ...], load: Callable[[], Any]) -> Any:
+        # key starts with the kind of document, e.g. ("chat", chat_id)
+        if key in self.identity_map:
+            metrics.mongo_identity_map_lookups.labels(key[0], "hit").inc()
+            return self.identity_map[key]
+        metrics.mongo_identity_map_lookups.labels(key[0], "miss").inc()
+        self.identity_map[key] = load()
+        return self.identity_map[key]
+
+    def forget(self) -> None:
+        # any write may change a remembered document, writes in a handler are
+        # rare enough that dropping everything beats tracking what changed
+        self.identity_map.clear()
+
     def insert_new_entry(self, q: Optional[Any]) -> None:
+        self.forget()
         now = utils.now()
         q["created_ts"] = now
         q["last_update_ts"] = now
+        q.update(schema.datetime_mirrors(q))
+        q["schema_version"] = schema.JOB_SCHEMA_VERSION
         self.main_collection.insert_one(q)
 
+    def insert_new_entries(self, docs: List[Dict[str, Any]]) -> Any:
+        # unordered, one failed document doesn't stop the rest
+        self.forget()
+        now = utils.now()
+        for q in docs:
+            q["created_ts"] = now
+            q["last_update_ts"] = now
+            q.update(schema.datetime_mirrors(q))
+            q["schema_version"] = schema.JOB_SCHEMA_VERSION
+        return self.main_collection.insert_many(docs, ordered=False)
+
     def find_entries(
-        self, q: Optional[Any], sort: Optional[Any] = None
+        self,
+        q: Optional[Any],
+        sort: Optional[Any] = None,
+        projection: Optional[Any] = None,
+        limit: int = 0,
     ) -> List[Optional[Any]]:
-        res = self.main_collection.find(q)
+        res = self.main_collection.find(q, projection, limit=limit)
         if sort is not None:
             res = res.sort(sort)
         return list(res)
 
-    def find_one_entry(self, q: Optional[Any]) -> Optional[Any]:
-        return self.main_collection.find_one(q)
+    def iter_entries(
+        self,
+        q: Optional[Any],
+        sort: Optional[Any] = None,
+        projection: Optional[Any] = None,
+        batch_size: int = 0,
+    ) -> Iterator[Any]:
+        # streams documents as batches arrive instead of loading them all
+        res = self.main_collection.find(q, projection, batch_size=batch_size)
+        if sort is not None:
+            res = res.sort(sort)
+        return res
+
+    def find_one_entry(
+        self,
+        q: Optional[Any],
+        sort: Optional[Any] = None,
+        projection: Optional[Any] = None,
+    ) -> Optional[Any]:
+        return self.main_collection.find_one(q, projection, sort=sort)
 
     def update_multiple_entries(
         self, q: Optional[Any], update: Optional[Any]
     ) -> Optional[Any]:
+        self.forget()
         q["removed_ts"] = ""
         update["last_update_ts"] = utils.now()
+        update.update(schema.datetime_mirrors(update))
         return self.main_collection.update_many(q, {"$set": update})
 
     def update_entry(self, q: Optional[Any], update: Optional[Any]) -> Any:
+        self.forget()
         update["last_update_ts"] = utils.now()
+        update.update(schema.datetime_mirrors(update))
         return self.main_collection.update_one(q, {"$set": update})
 
+    def bulk_update_entries(
+        self,
+        updates: List[Tuple[Optional[Any], Optional[Any]]],
+        now_ts: Optional[str] = None,
+        touch: bool = True,
+    ) -> Any:
+        self.forget()
+        # unordered, so one failed update doesn't stop the rest of the batch;
+        # touch=False keeps last_update_ts, for backfills that don't edit the job
+        now = {"last_update_ts": now_ts or utils.now()} if touch else {}
+        now.update(schema.datetime_mirrors(now))
+        ops = []
+        for q, u in updates:
+            # "$push" and other operator keys are passed through, the rest is $set
+            fields = {k: v for k, v in u.items() if not k.startswith("$")}
+            operators = {k: v for k, v in u.items() if k.startswith("$")}
+            fields.update({**schema.datetime_mirrors(fields), **now})
+            ops.append(UpdateOne(q, {"$set": fields, **operators}))
+        return self.main_collection.bulk_write(ops, ordered=False)
+
     def count_entries(self, q: Optional[Any]) -> int:
         return self.main_collection.count_documents(q)
 
+    def aggregate_entries(self, pipeline: List[Any]) -> List[Any]:
+        return list(self.main_collection.aggregate(pipeline))
+
+    def archive_entries(self, docs: List[Dict[str, Any]]) -> Any:
+        # replaced by _id, so copying the same job twice is harmless
+        archived_at = {"archived_at": schema.to_utc(utils.now())}
+        ops = [
+            ReplaceOne({"_id": doc["_id"]}, {**doc, **archived_at}, upsert=True)
+            for doc in docs
+        ]
+        return self.archive_collection.bulk_write(ops, ordered=False)
+
+    def delete_archived_entries(self, docs: List[Dict[str, Any]]) -> Any:
+        # only while still removed as archived, a job revived meanwhile stays
+        self.forget()
+        ops = [
+            DeleteOne({"_id": doc["_id"], "removed_ts": doc["removed_ts"]})
+            for doc in docs
+        ]
+        return self.main_collection.bulk_write(ops, ordered=False)
+
+    def delete_stale_archived_entries(self, docs: List[Dict[str, Any]]) -> Any:
+        # copies of jobs the delete skipped, the live job is the only one that counts
+        ids = [doc["_id"] for doc in docs]
+        live = self.main_collection.distinct("_id", {"_id": {"$in": ids}})
+        return self.archive_collection.delete_many({"_id": {"$in": live}})
+
+    def find_archived_entries(self, q: Optional[Any]) -> List[Optional[Any]]:
+        return list(self.archive_collection.find(q, {"archived_at": 0}))
+
+    def restore_entries(self, docs: List[Dict[str, Any]]) -> None:
+        self.forget()
+        # insert only, a stale copy must never overwrite a job that is live again
+        ops = [
+            UpdateOne(
+                {"_id": doc["_id"]},
+                {"$setOnInsert": {k: v for k, v in doc.items() if k != "_id"}},
+                upsert=True,
+            )
+            for doc in docs
+        ]
+        self.main_collection.bulk_write(ops, ordered=False)
+        ids = [doc["_id"] for doc in docs]
+        self.archive_collection.delete_many({"_id": {"$in": ids}})
+
+    def find_checkpoint(self, name: str) -> Optional[Any]:
+        return self.checkpoint_collection.find_one({"_id": name})
+
+    def save_checkpoint(self, name: str, checkpoint: Optional[Any]) -> None:
+        self.checkpoint_collection.update_one(
+            {"_id": name}, {"$set": checkpoint}, upsert=True
+        )
+
+    def insert_job_error(self, q: Optional[Any]) -> None:
+        self.job_errors_collection.insert_one(q)
+
+    def find_job_errors(self, q: Optional[Any]) -> List[Optional[Any]]:
+        return list(self.job_errors_collection.find(q))  # capped, insertion order
+
     def insert_new_chat(self, q: Optional[Any]) -> None:
+        self.forget()
         q["updated_ts"] = utils.now()
         self.chat_data_collection.insert_one(q)
 
     def find_one_chat_entry(self, q: Optional[Any]) -> Optional[Any]:
         return self.chat_data_collection.find_one(q)
 
-    def find_chat_entries(self, q: Optional[Any]) -> Optional[Any]:
-        return list(self.chat_data_collection.find(q))
+    def find_chat_entries(
+        self, q: Optional[Any], projection: Optional[Any] = None
+    ) -> Optional[Any]:
+        return list(self.chat_data_collection.find(q, projection))
 
     def update_chat_entries(
         self, q: Optional[Any], update: Optional[Any]
     ) -> Optional[Any]:
+        self.forget()
         update["updated_ts"] = utils.now()
         return self.chat_data_collection.update_many(q, {"$set": update})
 
     def update_one_chat_entry(self, q: Optional[Any], update: Optional[Any]) -> None:
+        self.forget()
         update["updated_ts"] = utils.now()
         self.chat_data_collection.update_one(q, {"$set": update})
 
+    def insert_cache_signal(self, q: Optional[Any]) -> None:
+        self.cache_signal_collection.insert_one(q)
+
+    def find_cache_signals(self, q: Optional[Any]) -> List[Optional[Any]]:
+        return list(self.cache_signal_collection.find(q, {"chat_id": 1}))
+
+    def increment_counter(self, counter_id: Any, by: int = 1) -> Optional[int]:
+        # None when the counter doesn't exist yet, see seed_counter
+        res = self.counter_collection.find_one_and_update(
+            {"_id": counter_id},
+            {"$inc": {"value": by}},
+            return_document=ReturnDocument.AFTER,
+        )
+        return None if res is None else res["value"]
+
+    def seed_counter(self, counter_id: Any, value: int) -> None:
+        # $max, so a counter seeded concurrently never moves backwards
+        try:
+            self.counter_collection.update_one(
+                {"_id": counter_id}, {"$max": {"value": value}}, upsert=True
+            )
+        except DuplicateKeyError:
+            pass  # upserted by someone else in the meantime, $max on the next call
+
     def insert_new_user(self, q: Optional[Any]) -> Optional[Any]:
         now = utils.now()
         q["created_at"] = now
@@ -89,7 +339,14 @@ class MongoService:
     def update_one_user(self, q: Optional[Any], update: Optional[Any]) -> Optional[Any]:
         return self.user_data_collection.update_one(q, {"$set": update})
 
+    def bulk_update_users(
+        self, updates: List[Tuple[Optional[Any], Optional[Any]]]
+    ) -> Any:
+        ops = [UpdateOne(q, {"$set": u}) for q, u in updates]
+        return self.user_data_collection.bulk_write(ops, ordered=False)
+
     def update_one_bot(self, q: Optional[Any], update: Optional[Any]) -> Optional[Any]:
+        self.forget()
         update["updated_at"] = utils.now()
         return self.bot_data_collection.update_one(q, {"$set": update}, upsert=True)
 
@@ -98,3 +355,41 @@ class MongoService:
 
     def find_one_whitelist(self, q: Optional[Any]) -> Optional[Any]:
         return self.user_whitelist_collection.find_one(q)
+
+    def find_whitelist_entries(self, q: Optional[Any]) -> List[Optional[Any]]:
+        return list(self.user_whitelist_collection.find(q))
+
+    def find_one_user_quota(self, q: Optional[Any]) -> Optional[Any]:
+        return self.user_quota_collection.find_one(q)
+
+    def find_user_quotas(self, q: Optional[Any]) -> List[Optional[Any]]:
+        return list(self.user_quota_collection.find(q))
+
+    def insert_user_quota(self, q: Optional[Any], quota: Optional[Any]) -> None:
+        # $setOnInsert, a quota created concurrently is left as it is
+        try:
+            self.user_quota_collection.update_one(
+                q, {"$setOnInsert": quota}, upsert=True
+            )
+        except DuplicateKeyError:
+            pass
+
+    def update_user_quotas(
+        self, updates: List[Tuple[Optional[Any], Optional[Any]]]
+    ) -> Any:
+        ops = [UpdateOne(q, {"$inc": inc}) for q, inc in updates]
+        return self.user_quota_collection.bulk_write(ops, ordered=False)
+
+    def replace_user_quota(self, q: Optional[Any], quota: Optional[Any]) -> None:
+        self.user_quota_collection.update_one(q, {"$set": quota}, upsert=True)
+
+    def acquire_lock(self, q: Optional[Any], update: Optional[Any]) -> bool:
+        # upserts the lock, fails with a duplicate _id while someone else holds it
+        try:
+            self.lock_collection.update_one(q, {"$set": update}, upsert=True)
+        except DuplicateKeyError:
+            return False
+        return True
+
+    def delete_lock(self, q: Optional[Any]) -> Optional[Any]:
+        return self.lock_collection.delete_one(q)
@@ -0,0 +1,94 @@
+import config
+from common import utils
+from common.enums import JobState
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Tuple
+
+"""
+job_data schema v2 stores UTC datetimes, with None for "not set", next to the
+legacy strftime strings in config.TZ_OFFSET that v1 compared lexicographically
+"""
+
+JOB_SCHEMA_VERSION = 2
+
+# legacy string field -> v2 datetime field
+DATETIME_FIELDS = {
+    "nextrun_ts": "nextrun_at",
+    "pending_ts": "pending_at",
+    "removed_ts": "removed_at",
+    "paused_ts": "paused_at",
+    "created_ts": "created_at",
+    "last_update_ts": "last_update_at",
+    "lease_expires_ts": "lease_expires_at",
+}
+
+
+# legacy fields the job state is derived from
+STATE_FIELDS = ["removed_ts", "paused_ts", "pending_ts", "lease_expires_ts"]
+
+
+class InvalidTimestamp(ValueError):
+    pass
+
+
+def to_utc(ts: Any) -> Optional[datetime]:
+    # "" and None are the v1 sentinels for "not set"
+    if ts is None or ts == "":
+        return None
+    if isinstance(ts, datetime):
+        return ts.astimezone(timezone.utc)
+    try:
+        parsed = datetime.fromisoformat(ts)
+    except (TypeError, ValueError) as err:
+        raise InvalidTimestamp(ts) from err
+    db_tz = timezone(timedelta(hours=config.TZ_OFFSET))
+    return parsed.replace(tzinfo=db_tz).astimezone(timezone.utc)
+
+
+def datetime_mirrors(update: Dict[str, Any]) -> Dict[str, Any]:
+    # v2 fields for every legacy timestamp in a $set payload or a new document
+    mirrors = {}
+    for field, mirror in DATETIME_FIELDS.items():
+        if field not in update:
+            continue
+        try:
+            mirrors[mirror] = to_utc(update[field])
+        except InvalidTimestamp:
+            pass  # unparseable legacy values keep working through dual-read
+    return mirrors
+
+
+def migration_update(entry: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    # conditioned on the strings it was computed from, so a concurrent write
+    # wins and the document is simply picked up again on the next pass
+    q: Dict[str, Any] = {"_id": entry["_id"]}
+    for field in DATETIME_FIELDS:
+        q[field] = entry[field] if field in entry else {"$exists": False}
+    payload = {**datetime_mirrors(entry), "schema_version": JOB_SCHEMA_VERSION}
+    return q, payload
+
+
+def job_state(entry: Dict[str, Any]) -> str:
+    # the state a v1 document is in, derived from its legacy timestamps
+    if entry.get("removed_ts", "") != "":
+        return JobState.REMOVED.value
+    if entry.get("paused_ts", "") not in ["", None]:
+        return JobState.PAUSED.value
+    if entry.get("pending_ts") is None:
+        return JobState.ACTIVE.value
+    if "lease_expires_ts" in entry:
+        leased = (entry["lease_expires_ts"] or "") > utils.now()
+    else:  # claimed before leases existed
+        leased = entry["pending_ts"] > utils.now(-config.DISPATCH_LEASE_MINS)
+    return JobState.PENDING.value if leased else JobState.ACTIVE.value
+
+
+def state_backfill_update(
+    entry: Dict[str, Any]
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    # conditioned like migration_update, a write racing the backfill sets
+    # state itself and the conditioned update then matches nothing
+    q: Dict[str, Any] = {"_id": entry["_id"], "state": {"$exists": False}}
+    for field in STATE_FIELDS:
+        q[field] = entry[field] if field in entry else {"$exists": False}
+    return q, {"state": job_state(entry)}
@@ -0,0 +1,107 @@
+import config
+import threading
+import time
+from common import log, metrics, utils
+from database.mongo import MongoService
+from pymongo.errors import BulkWriteError
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+"""
+Buffers post-send job updates and flushes them as unordered bulk writes,
+bounded by batch size and by how long the oldest update has waited
+"""
+
+Update = Tuple[Dict[str, Any], Dict[str, Any]]  # (query by _id, $set payload)
+
+
+class BulkWriter:
+    def __init__(
+        self,
+        db_service: MongoService,
+        on_written: Optional[Callable[[Dict[str, Any], Any], None]] = None,
+        max_ops: int = config.WRITEBACK_BATCH_SIZE,
+        max_age: float = config.WRITEBACK_FLUSH_SECS,
+    ) -> None:
+        self.db_service = db_service
+        self.on_written = on_written  # called with (payload, job id) once applied
+        self.max_ops = max_ops
+        self.max_age = max_age
+        self.pending: List[Update] = []
+        self.oldest = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, q: Dict[str, Any], update: Dict[str, Any]) -> None:
+        with self.lock:
+            if len(self.pending) < 1:
+                self.oldest = time.monotonic()
+            self.pending.append((q, update))
+
+    def due(self) -> bool:
+        with self.lock:
+            if len(self.pending) < 1:
+                return False
+            if len(self.pending) >= self.max_ops:
+                return True
+            return time.monotonic() - self.oldest >= self.max_age
+
+    def flush(self) -> int:
+        # swap the buffer out so other workers keep adding while we write
+        with self.lock:
+            batch, self.pending = self.pending, []
+        if len(batch) < 1:
+            return 0
+
+        metrics.dispatch_writeback_batch_size.observe(len(batch))
+        # callbacks only for jobs the update reached, not ones paused or
+        # removed while sending or whose lease was lost
+        failed = bulk_update(self.db_service, batch, only_matched=True)
+        if self.on_written is not None:
+            for i, (q, update) in enumerate(batch):
+                if i not in failed:
+                    self.on_written(update, q["_id"])
+        return len(batch) - len(failed)
+
+
+def bulk_update(
+    db_service: MongoService,
+    updates: List[Update],
+    only_matched: bool = False,
+    touch: bool = True,
+) -> Dict[int, str]:
+    # returns {op index: error} for the updates that were not applied, with
+    # only_matched also the ones whose query matched no job (needs touch, the
+    # stamp is how the applied ones are told apart)
+    failed: Dict[int, str] = {}
+    now_ts = utils.now()
+    matched = len(updates)
+    try:
+        res = db_service.bulk_update_entries(updates, now_ts, touch)
+        matched = res.matched_count
+    except BulkWriteError as err:
+        for write_error in err.details.get("writeErrors", []):
+            failed[write_error["index"]] = write_error.get("errmsg", "")
+        matched = err.details.get("nMatched", len(updates) - len(failed))
+    except Exception as err:  # nothing acknowledged, report every op
+        failed = {i: repr(err) for i in range(len(updates))}
+
+    for i, errmsg in failed.items():
+        log.log_writeback_failed(updates[i][0]["_id"], errmsg)
+    metrics.dispatch_writeback_errors.inc(len(failed))
+
+    if only_matched and matched < len(updates) - len(failed):
+        failed.update(unmatched(db_service, updates, failed, now_ts))
+    return failed
+
+
+def unmatched(
+    db_service: MongoService, updates: List[Update], failed: Dict[int, str], now_ts: str
+) -> Dict[int, str]:
+    # the result only has a total, the jobs this write reached carry its stamp
+    ids = [q["_id"] for i, (q, _) in enumerate(updates) if i not in failed]
+    q = {"_id": {"$in": ids}, "last_update_ts": now_ts}
+    applied = {x["_id"] for x in db_service.find_entries(q, projection={"_id": 1})}
+    return {
+        i: "matched no job"
+        for i, (q, _) in enumerate(updates)
+        if i not in failed and q["_id"] not in applied
+    }
@@ -0,0 +1,180 @@
+import asyncio
+import config
+import time
+from common import log, metrics
+from common.enums import ContentType
+from database import mongo
+from database.writeback import BulkWriter
+from dispatch import jobs
+from dispatch.ratelimit import limiter
+from dispatch.stats import RunStats
+from teleapi import async_endpoints as teleapi
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+async def run(
+    db_service: mongo.MongoService, entries: Iterable, parsed_time: str
+) -> int:
+    # long-lived workers pull the next job as soon as they are free, so one slow
+    # send never holds back the rest of the run
+    ctx = jobs.RunContext(db_service, parsed_time)
+    queue: asyncio.Queue = asyncio.Queue()
+    # caps the documents held in memory, requeued jobs keep their slot
+    in_flight = asyncio.Semaphore(2 * config.DISPATCH_CURSOR_BATCH_SIZE)
+    workers: List[asyncio.Task] = []
+    flusher = asyncio.create_task(flush_periodically(ctx.writer))
+
+    try:
+        entries = iter(entries)
+        while True:
+            chunk = await asyncio.to_thread(jobs.next_chunk, entries)
+            if len(chunk) < 1:
+                break
+            claimed = await asyncio.to_thread(ctx.claim, chunk)
+            log.log_entry_count(len(claimed))
+            # start workers as jobs arrive, a quiet minute spawns none
+            while len(workers) < min(config.BATCH_SIZE, ctx.claimed):
+                workers.append(asyncio.create_task(worker(ctx, queue, in_flight)))
+            for entry in claimed:
+                await in_flight.acquire()
+                queue.put_nowait(entry)
+                ctx.stats.enqueue()
+
+        await queue.join()  # also waits for rate limited jobs due for a retry
+    finally:
+        # also when the cursor or a claim fails, so nothing outlives the run and
+        # the updates already buffered still get written
+        for task in [*workers, flusher]:
+            task.cancel()
+        await asyncio.gather(*workers, flusher, return_exceptions=True)
+        await asyncio.to_thread(ctx.writer.flush)
+    ctx.stats.workers = len(workers)
+    ctx.stats.finish()
+    return ctx.claimed
+
+
+async def flush_periodically(writer: BulkWriter) -> None:
+    # time bound for the buffer when sends are too slow to fill a batch
+    while True:
+        await asyncio.sleep(config.WRITEBACK_FLUSH_SECS)
+        if writer.due():
+            await asyncio.to_thread(writer.flush)
+
+
+async def write_back(
+    ctx: jobs.RunContext, entry: Optional[Any], payload: Dict[str, Any]
+) -> None:
+    if ctx.buffer_update(entry, payload):
+        await asyncio.to_thread(ctx.writer.flush)
+
+
+async def worker(
+    ctx: jobs.RunContext, queue: asyncio.Queue, in_flight: asyncio.Semaphore
+) -> None:
+    while True:
+        entry = await queue.get()
+        ctx.stats.dequeue()
+        started = time.monotonic()
+        retry_after = None
+        try:
+            delay = jobs.throttle(ctx, entry)
+            if delay > 0:
+                # over a limit: come back when the reserved slot is due instead
+                # of holding this worker while other chats could be sent
+                retry_after = delay
+                if not jobs.can_retry_within(ctx.deadline, delay):
+                    ctx.throttled.discard(entry["_id"])
+                    await write_back(ctx, entry, jobs.release_payload())
+                    retry_after = None
+            else:
+                retry_after = await process_job(ctx, entry)
+                if retry_after is not None and not jobs.can_retry_within(
+                    ctx.deadline, retry_after
+                ):
+                    metrics.dispatch_rate_limited.labels("released").inc()
+                    await write_back(ctx, entry, jobs.release_payload())
+                    retry_after = None
+                elif retry_after is not None:
+                    metrics.dispatch_rate_limited.labels("requeued").inc()
+        except Exception as err:
+            log.log_dispatch_job_failed(entry["_id"], err)
+            retry_after = None
+        ctx.stats.record(started)
+
+        if retry_after is None:
+            in_flight.release()
+            queue.task_done()
+            continue
+        # requeue without blocking this worker; task_done once it is back in the queue
+        loop = asyncio.get_running_loop()
+        loop.call_later(retry_after, requeue, queue, entry, ctx.stats)
+
+
+def requeue(queue: asyncio.Queue, entry: Optional[Any], stats: RunStats) -> None:
+    queue.put_nowait(entry)
+    stats.enqueue()
+    queue.task_done()
+
+
+async def process_job(ctx: jobs.RunContext, entry: Optional[Any]) -> Optional[int]:
+    job_id = entry["_id"]
+    chat_id = jobs.target_chat_id(entry)
+    previous_message_id = str(entry.get("previous_message_id", ""))
+    user_bot_token = jobs.sender_token(entry)
+
+    bot_message_id, _, err, retry_after = await send_message(
+        job_id,
+        chat_id,
+        entry.get("content", ""),
+        entry.get("content_type", ""),
+        entry.get("photo_id", ""),
+        str(entry.get("photo_group_id", "")),
+        user_bot_token,
+        entry.get("message_thread_id", None),
+    )
+
+    # throttled, not failed: retry later without touching the error budget
+    if retry_after is not None:
+        log.log_dispatch_rate_limited(job_id, chat_id, retry_after)
+        metrics.dispatch_retry_after.observe(retry_after)
+        limiter.penalise(chat_id, retry_after)
+        return retry_after
+
+    if entry.get("option_delete_previous", "") != "" and previous_message_id != "":
+        await teleapi.delete_message(chat_id, previous_message_id, user_bot_token)
+
+    chat_entry = ctx.lookup_chat(chat_id)
+    payload = jobs.completion_payload(
+        entry, chat_entry, bot_message_id, err, ctx.parsed_time
+    )
+    await write_back(ctx, entry, payload)
+
+
+async def send_message(
+    job_id: int,
+    chat_id: int,
+    content: str,
+    content_type: str,
+    photo_id: str,
+    photo_group_id: str,
+    user_bot_token: str,
+    message_thread_id: int,
+) -> Tuple[Any, int, Optional[str], Optional[int]]:
+    if photo_group_id != "":  # media group
+        status_code, body = await teleapi.send_media_group(
+            chat_id, photo_id, content, user_bot_token, message_thread_id
+        )
+    elif photo_id != "":  # single photo
+        status_code, body = await teleapi.send_single_photo(
+            chat_id, photo_id, content, user_bot_token, message_thread_id
+        )
+    elif content_type == ContentType.POLL.value:
+        status_code, body = await teleapi.send_poll(
+            chat_id, content, user_bot_token, message_thread_id
+        )
+    else:  # text message
+        status_code, body = await teleapi.send_text(
+            chat_id, content, user_bot_token, message_thread_id
+        )
+
+    return jobs.parse_send_response(job_id, chat_id, status_code, body, photo_group_id)
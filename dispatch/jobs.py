@@ -0,0 +1,215 @@
+import config
+import itertools
+import os
+import socket
+import time
+import uuid
+from common import log, metrics, utils
+from common.enums import JobState
+from database import mongo
+from database.dbutils import dbutils
+from database.writeback import BulkWriter
+from datetime import datetime
+from dispatch.ratelimit import limiter
+from dispatch.stats import RunStats
+from http import HTTPStatus
+from types import MappingProxyType
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+"""
+Shared by the thread and async dispatch paths
+"""
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def new_lease_owner() -> str:
+    # one token per dispatch run, so overlapping runs in a process don't share claims
+    return f"{WORKER_ID}:{uuid.uuid4().hex[:8]}"
+
+
+class RunContext:
+    """State shared by the workers of one dispatch run."""
+
+    def __init__(self, db_service: mongo.MongoService, parsed_time: str) -> None:
+        self.db_service = db_service
+        self.parsed_time = parsed_time
+        self.lease_owner = new_lease_owner()
+        self.deadline = minute_deadline()
+        self.stats = RunStats(0)
+        self.writer = BulkWriter(db_service, self.written)
+        self.removed_by: Dict[Any, Any] = {}  # job id -> created_by, for quotas
+        self.throttled: Set[Any] = set()  # job ids requeued for a rate limit slot
+        self.loaded_chats: Dict[float, Any] = {}
+        self.chats = MappingProxyType(self.loaded_chats)  # read-only for workers
+        self.claimed = 0
+
+    def claim(self, chunk: List[Optional[Any]]) -> List[Optional[Any]]:
+        entries = dbutils.claim_entries(
+            self.db_service, chunk, self.parsed_time, self.lease_owner
+        )
+        metrics.dispatch_claims.labels("claimed").inc(len(entries))
+        # another dispatcher holds the lease or already sent it
+        metrics.dispatch_claims.labels("lost").inc(len(chunk) - len(entries))
+        self.claimed += len(entries)
+        self.prefetch_chats(entries)
+        return entries
+
+    def prefetch_chats(self, entries: List[Optional[Any]]) -> None:
+        # one $in query per chunk instead of one chat read per job
+        chat_ids = {float(target_chat_id(entry)) for entry in entries}
+        chat_ids -= self.loaded_chats.keys()
+        if len(chat_ids) < 1:
+            return
+        metrics.dispatch_chat_queries.inc()
+        found = dbutils.find_chats_by_chatids(self.db_service, chat_ids)
+        # misses are kept too, so a chat without settings isn't queried again
+        self.loaded_chats.update({i: found.get(i) for i in chat_ids})
+
+    def lookup_chat(self, chat_id: Any) -> Optional[Any]:
+        chat_entry = self.chats.get(float(chat_id))
+        result = "miss" if chat_entry is None else "hit"
+        metrics.dispatch_chat_lookups.labels(result).inc()
+        return chat_entry
+
+    def written(self, update: Dict[str, Any], job_id: Any) -> None:
+        # called by the writer once a buffered update was applied
+        dbutils.notify_nextrun(update, job_id)
+        if "$push" in update:
+            dbutils.insert_job_error(self.db_service, job_id, update["last_error"])
+        if job_id in self.removed_by:
+            removed = {self.removed_by.pop(job_id): -1}
+            dbutils.update_user_quotas(self.db_service, removed)
+
+    def buffer_update(self, entry: Optional[Any], payload: Dict[str, Any]) -> bool:
+        # returns whether the buffer is due for a flush
+        if payload.get("state") == JobState.REMOVED.value:
+            self.removed_by[entry["_id"]] = entry.get("created_by")
+        self.writer.add(dbutils.claimed_q(entry["_id"], self.lease_owner), payload)
+        return self.writer.due()
+
+
+def next_chunk(entries: Iterator[Optional[Any]]) -> List[Optional[Any]]:
+    # pulls the next batch off the cursor, blocking on the network if needed
+    return list(itertools.islice(entries, config.DISPATCH_CURSOR_BATCH_SIZE))
+
+
+def target_chat_id(entry: Optional[Any]) -> int:
+    channel_id = entry.get("channel_id", "")
+    if channel_id != "":
+        return channel_id
+    return entry.get("chat_id", "")
+
+
+def sender_token(entry: Optional[Any]) -> str:
+    user_bot_token = entry.get("user_bot_token")
+    if user_bot_token is None:
+        return config.TELEGRAM_BOT_TOKEN
+    return user_bot_token
+
+
+def message_cost(entry: Optional[Any]) -> int:
+    # every photo of a media group counts against Telegram's limits
+    if str(entry.get("photo_group_id", "")) == "":
+        return 1
+    return len(str(entry.get("photo_id", "")).split(";"))
+
+
+def parse_send_response(
+    job_id: int,
+    chat_id: int,
+    status_code: int,
+    body: Dict[str, Any],
+    photo_group_id: str,
+) -> Tuple[Any, int, Optional[str], Optional[int]]:
+    log.log_api_send_message(job_id, chat_id, status_code)
+
+    if status_code == HTTPStatus.TOO_MANY_REQUESTS:
+        retry_after = body.get("parameters", {}).get("retry_after", 1)
+        return "", status_code, None, int(retry_after)
+
+    if status_code != 200:
+        err_msg = "Error {}: {}".format(status_code, body["description"])
+        return "", status_code, err_msg, None
+
+    if photo_group_id != "":
+        msg_ids = [str(message["message_id"]) for message in body["result"]]
+        return ";".join(msg_ids), status_code, None, None
+
+    return body["result"]["message_id"], status_code, None, None
+
+
+def minute_deadline() -> float:
+    # monotonic instant at which the current dispatch minute ends
+    now = datetime.now()
+    return time.monotonic() + 60 - now.second - now.microsecond / 1e6
+
+
+def throttle(ctx: RunContext, entry: Optional[Any]) -> float:
+    # seconds until the job may be sent, reserved once: a job requeued for its
+    # slot already holds it when it comes back
+    if entry["_id"] in ctx.throttled:
+        ctx.throttled.discard(entry["_id"])
+        return 0.0
+    delay = limiter.reserve(
+        sender_token(entry), target_chat_id(entry), message_cost(entry)
+    )
+    if delay > 0:
+        ctx.throttled.add(entry["_id"])
+    return delay
+
+
+def can_retry_within(deadline: float, retry_after: int) -> bool:
+    return time.monotonic() + retry_after < deadline
+
+
+def completion_payload(
+    entry: Optional[Any],
+    chat_entry: Optional[Any],
+    bot_message_id: Any,
+    err: Optional[str],
+    parsed_time: str,
+) -> Dict[str, Any]:
+    # calculate next run time
+    user_tz_offset = (chat_entry or {}).get("tz_offset", config.TZ_OFFSET)
+    crontab = entry.get("crontab", "")
+    user_nextrun_ts, db_nextrun_ts = utils.calc_next_run(crontab, user_tz_offset)
+
+    # jobs from before error_count only have their errors array
+    error_count = entry.get("error_count", len(entry.get("errors") or []))
+    error_fields: Dict[str, Any] = {}
+    if err is not None:
+        error_count += 1
+        error = {"error": err, "timestamp": parsed_time}
+        error_fields = {
+            "error_count": error_count,
+            "last_error": error,
+            # operator keys go to the update as they are, see bulk_update_entries
+            "$push": {"errors": {"$each": [error], "$slice": -config.JOB_ERRORS_KEPT}},
+        }
+    elif error_count > 0 or "error_count" not in entry:
+        # the streak is over, job_errors keeps the history; jobs from before
+        # error_count may still carry errors, so they are cleared once too
+        error_count = 0
+        error_fields = {"error_count": 0, "last_error": None, "errors": []}
+    removed = error_count > config.RETRIES
+
+    return {
+        **release_payload(),
+        "nextrun_ts": db_nextrun_ts,
+        "user_nextrun_ts": user_nextrun_ts,
+        "previous_message_id": str(bot_message_id),
+        "removed_ts": parsed_time if removed else "",
+        "state": JobState.REMOVED.value if removed else JobState.ACTIVE.value,
+        **error_fields,
+    }
+
+
+def release_payload() -> Dict[str, Any]:
+    # hand the job back untouched so the next tick picks it up again
+    return {
+        "state": JobState.ACTIVE.value,
+        "pending_ts": None,
+        "lease_owner": None,
+        "lease_expires_ts": None,
+    }
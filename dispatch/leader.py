@@ -0,0 +1,53 @@
+import config
+import time
+from common import log, metrics
+from database import mongo
+from database.dbutils import dbutils
+from dispatch import jobs
+
+"""
+Mongo-backed leader lock, so only one process per deployment runs the scheduler
+while every process keeps serving webhooks
+"""
+
+
+class LeaderLock:
+    def __init__(self, name: str, owner: str = jobs.WORKER_ID) -> None:
+        self.name = name
+        self.owner = owner
+        self.valid_until = 0.0  # monotonic, stop acting as leader after this
+
+    @property
+    def is_leader(self) -> bool:
+        return time.monotonic() < self.valid_until
+
+    def heartbeat(self) -> bool:
+        # renew before the lease runs out, take over once the leader stops renewing
+        was_leader = self.is_leader
+        started = time.monotonic()
+        try:
+            db_service = mongo.MongoService()
+            acquired = dbutils.acquire_lock(
+                db_service, self.name, self.owner, config.LEADER_LEASE_SECS
+            )
+        except Exception as err:
+            log.log_leader_heartbeat_failed(self.name, err)
+            acquired = False
+        # measured from before the write, so we never outlive the stored expiry
+        self.valid_until = started + config.LEADER_LEASE_SECS if acquired else 0.0
+
+        if acquired != was_leader:
+            log.log_leader_changed(self.name, self.owner, acquired)
+        metrics.scheduler_leader.labels(self.owner).set(1 if acquired else 0)
+        return acquired
+
+    def release(self) -> None:
+        if not self.is_leader:
+            return
+        self.valid_until = 0.0
+        metrics.scheduler_leader.labels(self.owner).set(0)
+        dbutils.release_lock(mongo.MongoService(), self.name, self.owner)
+        log.log_leader_changed(self.name, self.owner, False)
+
+
+scheduler_lock = LeaderLock("scheduler")
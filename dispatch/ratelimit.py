@@ -0,0 +1,91 @@
+import time
+import config
+from common import metrics
+from threading import Lock
+from typing import Any, Dict, List, Tuple
+
+# https://core.telegram.org/bots/faq#my-bot-is-hitting-limits-how-do-i-avoid-this
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate  # tokens per second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        elapsed = now - self.updated
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated = now
+
+    def reserve(self, now: float, cost: float = 1) -> float:
+        # tokens may go negative: later callers queue up behind earlier reservations
+        self.refill(now)
+        delay = max(0.0, (min(cost, self.capacity) - self.tokens) / self.rate)
+        self.tokens -= cost
+        return delay
+
+    def idle(self, now: float) -> bool:
+        self.refill(now)
+        return self.tokens >= self.capacity
+
+
+class RateLimiter:
+    """Token buckets keyed by bot token and by chat, shared by every dispatch worker."""
+
+    PRUNE_EVERY = 1000
+
+    def __init__(self) -> None:
+        self.buckets: Dict[Tuple[str, Any], TokenBucket] = {}
+        self.reservations = 0
+        self.lock = Lock()
+
+    def limits(
+        self, bot_token: str, chat_id: Any
+    ) -> List[Tuple[Tuple[str, Any], float, float]]:
+        res = [
+            (("bot", bot_token), config.RATE_LIMIT_PER_BOT, config.RATE_LIMIT_PER_BOT),
+            (("chat", chat_id), config.RATE_LIMIT_PER_CHAT, config.RATE_LIMIT_PER_CHAT),
+        ]
+        if float(chat_id) < 0:  # groups, supergroups and channels
+            per_group = config.RATE_LIMIT_PER_GROUP
+            res.append((("group", chat_id), per_group / 60, per_group))
+        return res
+
+    def reserve(self, bot_token: str, chat_id: Any, cost: int = 1) -> float:
+        now = time.monotonic()
+        delay = 0.0
+        with self.lock:
+            for key, rate, capacity in self.limits(bot_token, chat_id):
+                bucket = self.buckets.get(key)
+                if bucket is None:
+                    bucket = self.buckets[key] = TokenBucket(rate, capacity)
+                delay = max(delay, bucket.reserve(now, cost))
+            self.reservations += 1
+            if self.reservations % self.PRUNE_EVERY == 0:
+                self.prune(now)
+        if delay > 0:
+            metrics.dispatch_rate_limit_wait.observe(delay)
+        return delay
+
+    def penalise(self, chat_id: Any, retry_after: float) -> None:
+        # Telegram told us to back off: hold the chat's bucket for retry_after seconds
+        now = time.monotonic()
+        key = ("chat", chat_id)
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                rate = config.RATE_LIMIT_PER_CHAT
+                bucket = self.buckets[key] = TokenBucket(rate, rate)
+            bucket.refill(now)
+            debt = bucket.capacity - retry_after * bucket.rate
+            bucket.tokens = min(bucket.tokens, debt)
+
+    def prune(self, now: float) -> None:
+        idle = [key for key, bucket in self.buckets.items() if bucket.idle(now)]
+        for key in idle:
+            del self.buckets[key]
+
+
+limiter = RateLimiter()
@@ -0,0 +1,110 @@
+import asyncio
+import heapq
+import time
+import config
+from common import log, utils
+from database import mongo
+from database.dbutils import dbutils
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+"""
+Timer-heap scheduler for SCHEDULER_MODE=timer: sleeps until the next due minute
+instead of polling mongo every 60 seconds
+"""
+
+
+class TimerScheduler:
+    def __init__(self, dispatch: Callable[[], Awaitable[None]]) -> None:
+        self.dispatch = dispatch
+        self.heap: List[Tuple[float, Any]] = []  # (due epoch, job id)
+        self.due_at: Dict[Any, Optional[float]] = {}  # latest due epoch per job
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.wakeup: Optional[asyncio.Event] = None
+
+    def notify(self, job_id: Any, nextrun_ts: Optional[str]) -> None:
+        # db writes happen on worker threads, hop onto the scheduler's loop
+        if self.loop is None or self.loop.is_closed():
+            return
+        self.loop.call_soon_threadsafe(self.push, job_id, nextrun_ts)
+
+    def push(self, job_id: Any, nextrun_ts: Optional[str]) -> None:
+        if nextrun_ts is None:
+            self.due_at[job_id] = None
+            return
+        due = utils.parse_db_time(nextrun_ts).timestamp()
+        self.due_at[job_id] = due
+        heapq.heappush(self.heap, (due, job_id))
+        if self.wakeup is not None and self.heap[0][0] == due:
+            self.wakeup.set()  # new earliest job, recompute the sleep
+
+    def next_due(self) -> Optional[float]:
+        # lazily drop heap entries superseded by a later edit
+        while self.heap:
+            due, job_id = self.heap[0]
+            if self.due_at.get(job_id) == due:
+                return due
+            heapq.heappop(self.heap)
+        return None
+
+    def pop_due(self, now: float) -> int:
+        count = 0
+        while self.next_due() is not None and self.heap[0][0] <= now:
+            _, job_id = heapq.heappop(self.heap)
+            del self.due_at[job_id]
+            count += 1
+        return count
+
+    async def load(self) -> None:
+        db_service = await asyncio.to_thread(mongo.MongoService)
+        entries = await asyncio.to_thread(dbutils.find_scheduled_nextruns, db_service)
+        self.heap, self.due_at = [], {}
+        for entry in entries:
+            self.push(entry["_id"], entry["nextrun_ts"])
+        log.log_scheduler_loaded(len(self.due_at))
+
+    async def refresh_head(self) -> None:
+        # catches edits made by other processes, one indexed read per interval
+        db_service = await asyncio.to_thread(mongo.MongoService)
+        entry = await asyncio.to_thread(dbutils.find_earliest_nextrun, db_service)
+        if entry is not None:
+            self.push(entry["_id"], entry["nextrun_ts"])
+
+    async def run_forever(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+        dbutils.nextrun_listeners.append(self.notify)
+        try:
+            while True:
+                try:
+                    await self.run()
+                except Exception as err:
+                    # started once, so a mongo hiccup must not stop dispatching
+                    # until restart; reloading also brings back popped jobs
+                    log.log_scheduler_failed(err)
+                    await asyncio.sleep(config.SCHEDULER_RETRY_SECS)
+        finally:
+            dbutils.nextrun_listeners.remove(self.notify)
+
+    async def run(self) -> None:
+        await self.load()
+        next_refresh = time.time() + config.SCHEDULER_RESYNC_INTERVAL
+        while True:
+            now = time.time()
+            if now >= next_refresh:
+                await self.refresh_head()
+                next_refresh = now + config.SCHEDULER_RESYNC_INTERVAL
+
+            due = self.next_due()
+            if due is not None and due <= now:
+                log.log_scheduler_fired(self.pop_due(now))
+                await self.dispatch()
+                continue
+
+            timeout = next_refresh - now
+            if due is not None:
+                timeout = min(timeout, due - now)
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,33 @@
+import threading
+import time
+from common import log, metrics
+from dispatch import jobs
+from typing import Awaitable, Callable
+
+"""
+Keeps at most one dispatch run in progress per process, whether it was started
+by the scheduler tick or the public /api route
+"""
+
+# a thread lock, the thread fallback and separate event loops share it too
+run_lock = threading.Lock()
+
+
+async def run_exclusive(run: Callable[[], Awaitable[None]]) -> bool:
+    if not run_lock.acquire(blocking=False):
+        metrics.dispatch_runs_skipped.inc()
+        log.log_dispatch_run_skipped()
+        return False
+
+    started = time.monotonic()
+    deadline = jobs.minute_deadline()
+    try:
+        await run()
+    finally:
+        run_lock.release()
+        duration = time.monotonic() - started
+        metrics.dispatch_run_duration.observe(duration)
+        if time.monotonic() > deadline:  # spilled into the next minute's tick
+            metrics.dispatch_run_overruns.inc()
+            log.log_dispatch_run_overrun(duration)
+    return True
@@ -0,0 +1,59 @@
+import time
+from common import log, metrics
+from threading import Lock
+from typing import Dict, List
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class RunStats:
+    """Per-run queue depth, worker utilisation and latency, safe to share across workers."""
+
+    def __init__(self, workers: int) -> None:
+        self.workers = workers
+        self.started = time.monotonic()
+        self.depth = 0
+        self.max_depth = 0
+        self.busy = 0.0
+        self.latencies: List[float] = []
+        self.lock = Lock()
+
+    def enqueue(self, count: int = 1) -> None:
+        with self.lock:
+            self.depth += count
+            self.max_depth = max(self.max_depth, self.depth)
+            metrics.dispatch_queue_depth.set(self.depth)
+
+    def dequeue(self) -> None:
+        with self.lock:
+            self.depth -= 1
+            metrics.dispatch_queue_depth.set(self.depth)
+
+    def record(self, started: float) -> None:
+        elapsed = time.monotonic() - started
+        metrics.dispatch_job_latency.observe(elapsed)
+        with self.lock:
+            self.busy += elapsed
+            self.latencies.append(elapsed)
+
+    def quantiles(self) -> Dict[float, float]:
+        latencies = sorted(self.latencies)
+        if len(latencies) < 1:
+            return {q: 0.0 for q in QUANTILES}
+        last = len(latencies) - 1
+        return {q: latencies[min(last, int(q * len(latencies)))] for q in QUANTILES}
+
+    def finish(self) -> None:
+        wall = time.monotonic() - self.started
+        capacity = wall * self.workers  # no workers when nothing was claimed
+        utilisation = self.busy / capacity if capacity > 0 else 0.0
+        quantiles = self.quantiles()
+
+        metrics.dispatch_queue_depth.set(0)
+        metrics.dispatch_worker_utilisation.set(utilisation)
+        for q, value in quantiles.items():
+            metrics.dispatch_job_latency_quantile.labels(str(q)).set(value)
+
+        log.log_dispatch_stats(
+            len(self.latencies), self.workers, self.max_depth, utilisation, quantiles
+        )
@@ -0,0 +1,192 @@
+import config
+import time
+from common import log, metrics
+from common.enums import ContentType
+from database import mongo
+from database.writeback import BulkWriter
+from dispatch import jobs
+from dispatch.ratelimit import limiter
+from dispatch.stats import RunStats
+from queue import Queue
+from teleapi import endpoints as teleapi
+from threading import Event, Semaphore, Thread, Timer
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+"""
+Thread fallback for DISPATCH_MODE=thread, blocking requests on worker threads
+"""
+
+
+def run(db_service: mongo.MongoService, entries: Iterable, parsed_time: str) -> int:
+    ctx = jobs.RunContext(db_service, parsed_time)
+    q: Queue = Queue()
+    # caps the documents held in memory, requeued jobs keep their slot
+    in_flight = Semaphore(2 * config.DISPATCH_CURSOR_BATCH_SIZE)
+    workers: List[Thread] = []
+    stop = Event()
+    flusher = Thread(target=flush_periodically, args=(ctx.writer, stop), daemon=True)
+    flusher.start()
+
+    try:
+        entries = iter(entries)
+        while True:
+            chunk = jobs.next_chunk(entries)
+            if len(chunk) < 1:
+                break
+            claimed = ctx.claim(chunk)
+            log.log_entry_count(len(claimed))
+            # start workers as jobs arrive, a quiet minute spawns none
+            while len(workers) < min(config.BATCH_SIZE, ctx.claimed):
+                t = Thread(target=worker, args=(ctx, q, in_flight), daemon=True)
+                t.start()
+                workers.append(t)
+            for entry in claimed:
+                in_flight.acquire()
+                q.put(entry)
+                ctx.stats.enqueue()
+
+        q.join()  # also waits for rate limited jobs that are due for a retry
+    finally:
+        # also when the cursor or a claim fails, workers finish what they were
+        # given and the buffered updates still get written
+        for _ in workers:
+            q.put(None)
+        for t in workers:
+            t.join()
+        stop.set()
+        flusher.join()
+        ctx.writer.flush()
+    ctx.stats.workers = len(workers)
+    ctx.stats.finish()
+    return ctx.claimed
+
+
+def flush_periodically(writer: BulkWriter, stop: Event) -> None:
+    # time bound for the buffer when sends are too slow to fill a batch
+    while not stop.wait(config.WRITEBACK_FLUSH_SECS):
+        if writer.due():
+            writer.flush()
+
+
+def write_back(
+    ctx: jobs.RunContext, entry: Optional[Any], payload: Dict[str, Any]
+) -> None:
+    if ctx.buffer_update(entry, payload):
+        ctx.writer.flush()
+
+
+def worker(ctx: jobs.RunContext, q: Queue, in_flight: Semaphore) -> None:
+    while True:
+        entry = q.get()
+        if entry is None:
+            return
+        ctx.stats.dequeue()
+        started = time.monotonic()
+        retry_after = None
+        try:
+            delay = jobs.throttle(ctx, entry)
+            if delay > 0:
+                # over a limit: come back when the reserved slot is due instead
+                # of sleeping on this thread while other chats could be sent
+                retry_after = delay
+                if not jobs.can_retry_within(ctx.deadline, delay):
+                    ctx.throttled.discard(entry["_id"])
+                    write_back(ctx, entry, jobs.release_payload())
+                    retry_after = None
+            else:
+                retry_after = process_job(ctx, entry)
+                if retry_after is not None and not jobs.can_retry_within(
+                    ctx.deadline, retry_after
+                ):
+                    metrics.dispatch_rate_limited.labels("released").inc()
+                    write_back(ctx, entry, jobs.release_payload())
+                    retry_after = None
+                elif retry_after is not None:
+                    metrics.dispatch_rate_limited.labels("requeued").inc()
+        except Exception as err:
+            log.log_dispatch_job_failed(entry["_id"], err)
+            retry_after = None
+        ctx.stats.record(started)
+
+        if retry_after is None:
+            in_flight.release()
+            q.task_done()
+            continue
+        # requeue without blocking this worker; task_done once it is back in the queue
+        timer = Timer(retry_after, requeue, args=(q, entry, ctx.stats))
+        timer.daemon = True
+        timer.start()
+
+
+def requeue(q: Queue, entry: Optional[Any], stats: RunStats) -> None:
+    q.put(entry)
+    stats.enqueue()
+    q.task_done()
+
+
+def process_job(ctx: jobs.RunContext, entry: Optional[Any]) -> Optional[int]:
+    job_id = entry["_id"]
+    chat_id = jobs.target_chat_id(entry)
+    content = entry.get("content", "")
+    content_type = entry.get("content_type", "")
+    photo_id = entry.get("photo_id", "")
+    photo_group_id = str(entry.get("photo_group_id", ""))
+    previous_message_id = str(entry.get("previous_message_id", ""))
+    message_thread_id = entry.get("message_thread_id", None)
+    user_bot_token = jobs.sender_token(entry)
+
+    bot_message_id, status, err, retry_after = send_message(
+        job_id,
+        chat_id,
+        content,
+        content_type,
+        photo_id,
+        photo_group_id,
+        user_bot_token,
+        message_thread_id,
+    )
+
+    # throttled, not failed: retry later without touching the error budget
+    if retry_after is not None:
+        log.log_dispatch_rate_limited(job_id, chat_id, retry_after)
+        metrics.dispatch_retry_after.observe(retry_after)
+        limiter.penalise(chat_id, retry_after)
+        return retry_after
+
+    if entry.get("option_delete_previous", "") != "" and previous_message_id != "":
+        teleapi.delete_message(chat_id, previous_message_id, user_bot_token)
+
+    # calculate and update next run time
+    chat_entry = ctx.lookup_chat(chat_id)
+    payload = jobs.completion_payload(
+        entry, chat_entry, bot_message_id, err, ctx.parsed_time
+    )
+    write_back(ctx, entry, payload)
+
+
+def send_message(
+    job_id: int,
+    chat_id: int,
+    content: str,
+    content_type: str,
+    photo_id: str,
+    photo_group_id: str,
+    user_bot_token: str,
+    message_thread_id: int,
+) -> Tuple[Any, int, Optional[str], Optional[int]]:
+    if photo_group_id != "":  # media group
+        resp = teleapi.send_media_group(
+            chat_id, photo_id, content, user_bot_token, message_thread_id
+        )
+    elif photo_id != "":  # single photo
+        resp = teleapi.send_single_photo(
+            chat_id, photo_id, content, user_bot_token, message_thread_id
+        )
+    elif content_type == ContentType.POLL.value:
+        resp = teleapi.send_poll(chat_id, content, user_bot_token, message_thread_id)
+    else:  # text message
+        resp = teleapi.send_text(chat_id, content, user_bot_token, message_thread_id)
+
+    return jobs.parse_send_response(
+        job_id, chat_id, resp.status_code, resp.json(), photo_group_id
+    )
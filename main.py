@@ -11,11 +11,11 @@ main.py — точка входа веб-приложения и Telegram-бот
     pip install "python-telegram-bot[job-queue]"
 """
 
+import asyncio
 from http import HTTPStatus
 from typing import Any, Dict
 
 import aiohttp
-import asyncio
 import uvicorn
 from fastapi import Request, Response
 from telegram import Update
@@ -35,7 +35,14 @@ from api import app
 from bot import commands, handlers
 from bot.convos import handlers as convo_handlers
 from bot.ptb import ptb
+from common.enums import SchedulerMode
 from common.log import logger
+from database import indexes
+from database.archive import archive_removed_entries
+from database.dbutils import adbutils
+from database.dbutils.dbutils_user import flush_user_touches
+from dispatch.leader import scheduler_lock
+from dispatch.scheduler import TimerScheduler
 
 # ---------------------------------------------------------------------------
 # 🔒 Ограничиваем доступ к боту
@@ -64,6 +71,36 @@ async def _ping(_: ContextTypes.DEFAULT_TYPE) -> None:
         logger.warning("PING failed: %s", exc)
 
 
+# ---------------------------------------------------------------------------
+#  Лидер: при нескольких воркерах gunicorn рассылает только один процесс
+# ---------------------------------------------------------------------------
+async def _leader_heartbeat(_: ContextTypes.DEFAULT_TYPE) -> None:
+    """Продлевает lock лидера в Mongo или перехватывает его у упавшего процесса."""
+    await asyncio.to_thread(scheduler_lock.heartbeat)
+
+
+async def _flush_user_touches(_: ContextTypes.DEFAULT_TYPE) -> None:
+    """Пишет накопленные `last_used_at` пользователей одним bulk_write."""
+    db_service = await adbutils.connect()
+    await adbutils.run(flush_user_touches, db_service)
+
+
+async def _archive_removed_jobs(_: ContextTypes.DEFAULT_TYPE) -> None:
+    """Только лидер: переносит давно удалённые задачи в `job_data_archive`."""
+    if not scheduler_lock.is_leader:
+        return
+    db_service = await adbutils.connect()
+    await adbutils.run(archive_removed_entries, db_service)
+
+
+async def _dispatch_as_leader() -> None:
+    """Рассылает, только если этот процесс сейчас лидер; web-hook-и обслуживают все."""
+    if not scheduler_lock.is_leader:
+        return
+    from api import dispatch                              # локальный импорт ⬅
+    await dispatch()                   # async-движок или пул потоков (DISPATCH_MODE)
+
+
 # ---------------------------------------------------------------------------
 #  Scheduler: вызываем «рассыльщик» (`api.run`) каждые 60 сек
 # ---------------------------------------------------------------------------
@@ -72,8 +109,16 @@ async def _run_scheduler(_: ContextTypes.DEFAULT_TYPE) -> None:
     Имитация GET /api — забирает из Mongo записи с истекшим `nextrun_ts`
     и рассылает сообщения.
     """
-    from api import run as process_jobs                   # локальный импорт ⬅
-    await asyncio.to_thread(process_jobs)                 # не блокируем event-loop
+    await _dispatch_as_leader()
+
+
+async def _run_timer_scheduler(_: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    SCHEDULER_MODE=timer: вместо опроса раз в 60 сек спим до ближайшего
+    `nextrun_ts` из кучи таймеров и рассылаем ровно на границе минуты.
+    Куча прогрета и у последователей, так что смена лидера проходит быстро.
+    """
+    await TimerScheduler(_dispatch_as_leader).run_forever()
 
 
 # ---------------------------------------------------------------------------
@@ -133,7 +178,13 @@ add_handlers(ptb)
 # ---------------------------------------------------------------------------
 if ptb.job_queue is not None:
     ptb.job_queue.run_repeating(_ping,          interval=PING_INTERVAL, first=30)
-    ptb.job_queue.run_repeating(_run_scheduler, interval=60,            first=10)
+    ptb.job_queue.run_repeating(_leader_heartbeat, interval=config.LEADER_HEARTBEAT_SECS, first=0)
+    ptb.job_queue.run_repeating(_flush_user_touches, interval=config.USER_TOUCH_FLUSH_SECS)
+    ptb.job_queue.run_repeating(_archive_removed_jobs, interval=config.JOB_ARCHIVE_INTERVAL_SECS, first=60)
+    if config.SCHEDULER_MODE == SchedulerMode.TIMER.value:
+        ptb.job_queue.run_once(_run_timer_scheduler, when=10)
+    else:
+        ptb.job_queue.run_repeating(_run_scheduler, interval=60,        first=10)
 else:
     logger.warning("JobQueue not available — keep-alive / scheduler disabled!")
 
@@ -150,6 +201,7 @@ if config.ENV:
 else:
     # локальный режим (python main.py)
     if __name__ == "__main__":
+        indexes.setup()  # no FastAPI lifespan when polling
         ptb.run_polling()
 
 # Запуск через gunicorn в проде
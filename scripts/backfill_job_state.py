@@ -0,0 +1,33 @@
+from database import mongo, schema, writeback
+from common import log
+from itertools import islice
+import os
+
+# Backfills the job state field on job_data while the bot keeps running.
+# Safe to stop and re-run: only documents without a state are read, and every
+# update is conditioned on the timestamps the state was derived from.
+# Set JOB_SCHEMA_DUAL_READ=0 once this and migrate_job_datetimes.py report
+# nothing left to migrate.
+
+BATCH_SIZE = 500
+
+mongo_conn = os.getenv("PROD_MONGODB_CONNECTION_STRING")
+db_service = mongo.MongoService(None, mongo_conn)
+
+q = {"state": {"$exists": False}}
+projection = {field: 1 for field in schema.STATE_FIELDS}
+entries = db_service.iter_entries(q, [("_id", 1)], projection, BATCH_SIZE)
+
+migrated, skipped = 0, 0
+while True:
+    batch = list(islice(entries, BATCH_SIZE))
+    if len(batch) < 1:
+        break
+    updates = [schema.state_backfill_update(entry) for entry in batch]
+    # the job itself is unchanged, keep its last_update_ts
+    failed = writeback.bulk_update(db_service, updates, touch=False)
+    migrated += len(batch) - len(failed)
+    skipped += len(failed)
+    log.log_migration_progress(migrated, skipped)
+
+entries.close()
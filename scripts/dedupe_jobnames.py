@@ -0,0 +1,15 @@
+from database import indexes, mongo
+from database.dbutils import dbutils
+import os
+
+# Renames active jobs that share a chat and jobname, which the old
+# check-then-insert jobname generation let through, then builds the unique
+# active_chat_jobname index that startup skips while duplicates exist.
+# The oldest job keeps its name, the others become "jobname (n)".
+# Safe to re-run, nothing is renamed once the names are unique.
+
+mongo_conn = os.getenv("PROD_MONGODB_CONNECTION_STRING")
+db_service = mongo.MongoService(None, mongo_conn)
+
+dbutils.rename_duplicate_jobnames(db_service)
+indexes.ensure_unique_indexes(db_service)
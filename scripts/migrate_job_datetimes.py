@@ -0,0 +1,32 @@
+from database import mongo, schema, writeback
+from common import log
+from itertools import islice
+import os
+
+# Backfills the schema v2 datetime fields on job_data while the bot keeps running.
+# Safe to stop and re-run: only documents below the current schema version are
+# read, and every update is conditioned on the strings it was computed from.
+# Set JOB_SCHEMA_DUAL_READ=0 once a run reports nothing left to migrate.
+
+BATCH_SIZE = 500
+
+mongo_conn = os.getenv("PROD_MONGODB_CONNECTION_STRING")
+db_service = mongo.MongoService(None, mongo_conn)
+
+q = {"schema_version": {"$ne": schema.JOB_SCHEMA_VERSION}}
+projection = {field: 1 for field in schema.DATETIME_FIELDS}
+entries = db_service.iter_entries(q, [("_id", 1)], projection, BATCH_SIZE)
+
+migrated, skipped = 0, 0
+while True:
+    batch = list(islice(entries, BATCH_SIZE))
+    if len(batch) < 1:
+        break
+    updates = [schema.migration_update(entry) for entry in batch]
+    # the job itself is unchanged, keep its last_update_ts
+    failed = writeback.bulk_update(db_service, updates, touch=False)
+    migrated += len(batch) - len(failed)
+    skipped += len(failed)
+    log.log_migration_progress(migrated, skipped)
+
+entries.close()
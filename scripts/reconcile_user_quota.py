@@ -0,0 +1,26 @@
+from database import mongo
+from database.dbutils import dbutils
+from common import log
+import os
+
+# Recomputes user_quota from job_data and the whitelist, repairing counts that
+# drifted, e.g. jobs edited by hand or a quota update that failed after its job
+# write. Run it after editing the whitelist too, limits are folded in here.
+# A job added or removed while it runs can be counted twice or not at all, so
+# prefer a quiet moment; running it again fixes that.
+
+mongo_conn = os.getenv("PROD_MONGODB_CONNECTION_STRING")
+db_service = mongo.MongoService(None, mongo_conn)
+
+expected = dbutils.expected_user_quotas(db_service)
+current = dbutils.find_user_quotas(db_service)
+
+repaired = 0
+for user_id, quota in expected.items():
+    stored = current.get(user_id, {})
+    if all(stored.get(field) == value for field, value in quota.items()):
+        continue
+    dbutils.reset_user_quota(db_service, user_id, **quota)
+    repaired += 1
+
+log.log_quota_reconciled(len(expected), repaired)
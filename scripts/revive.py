@@ -1,6 +1,7 @@
-from database import mongo
+from database import archive, mongo
 from database.dbutils import dbutils
 from common import log, utils
+from common.enums import JobState
 import os
 
 # https://github.com/telegraf/telegraf/discussions/1833
@@ -11,6 +12,8 @@ end_ts = "2023-11-01"
 mongo_conn = os.getenv("PROD_MONGODB_CONNECTION_STRING")
 db_service = mongo.MongoService(None, mongo_conn)
 
+# jobs removed long enough ago have been archived, move them back first
+archive.restore_entries_removed_between(db_service, start_ts, end_ts, 400)
 entries = dbutils.find_entries_removed_between(db_service, start_ts, end_ts, 400)
 
 entry_count = len(entries)
@@ -19,7 +22,6 @@ log.log_update_count(entry_count)
 for entry in entries:
     chat_id = entry["chat_id"]
     crontab = entry["crontab"]
-    entry_id = entry["_id"]
     chat_entry = dbutils.find_chat_by_chatid(db_service, chat_id)
     user_tz_offset = chat_entry.get("tz_offset")
     user_nextrun_ts, db_nextrun_ts = utils.calc_next_run(crontab, user_tz_offset)
@@ -28,9 +30,12 @@ for entry in entries:
         "user_nextrun_ts": user_nextrun_ts,
         "remarks": "",
         "removed_ts": "",
+        "state": JobState.ACTIVE.value,
+        "error_count": 0,
+        "last_error": None,
     }
-    res = dbutils.update_entry_by_jobid(
-        db_service, entry_id, payload, include_removed=True
-    )
+    res = dbutils.revive_entry(db_service, entry, payload)
+    if res is None:
+        continue
     log.log_entry_updated(entry)
     log.log_update_details(res)
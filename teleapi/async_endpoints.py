@@ -0,0 +1,166 @@
+import asyncio
+import json
+import aiohttp
+import config
+from common import log
+from urllib.parse import urlencode
+from config import TELEGRAM_BOT_TOKEN
+from typing import Optional, Any, Dict, Tuple
+
+# (status code, decoded json body)
+Response = Tuple[int, Dict[str, Any]]
+
+_session: Optional[aiohttp.ClientSession] = None
+_session_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def get_session() -> aiohttp.ClientSession:
+    # one pooled session per event loop, shared by every dispatch coroutine
+    global _session, _session_loop
+    loop = asyncio.get_running_loop()
+    if _session is None or _session.closed or _session_loop is not loop:
+        connector = aiohttp.TCPConnector(limit=config.DISPATCH_CONCURRENCY)
+        timeout = aiohttp.ClientTimeout(total=config.DISPATCH_HTTP_TIMEOUT)
+        _session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        _session_loop = loop
+    return _session
+
+
+async def close_session() -> None:
+    global _session, _session_loop
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session, _session_loop = None, None
+
+
+async def request(method: str, endpoint: str, **kwargs: Any) -> Response:
+    async with get_session().request(method, endpoint, **kwargs) as resp:
+        return resp.status, await resp.json(content_type=None)
+
+
+async def send_media_group(
+    chat_id: int,
+    photo_id: str,
+    content: str,
+    user_bot_token: str,
+    message_thread_id: int,
+) -> Response:
+    media, files = await prepare_photos(photo_id, content)
+    query = {
+        "chat_id": chat_id,
+        "media": media,
+        "reply_to_message_id": message_thread_id,
+    }
+    query_string = urlencode(query)
+    endpoint = "https://api.telegram.org/bot{}/sendMediaGroup?{}".format(
+        user_bot_token, query_string
+    )
+    form = aiohttp.FormData()
+    for name, data in files.items():
+        form.add_field(name, data, filename=name)
+    return await request("POST", endpoint, data=form)
+
+
+async def send_single_photo(
+    chat_id: int,
+    photo_id: str,
+    content: str,
+    user_bot_token: str,
+    message_thread_id: int,
+) -> Response:
+    query = {
+        "chat_id": chat_id,
+        "photo": photo_id,
+        "caption": content,
+        "parse_mode": "html",
+        "reply_to_message_id": message_thread_id,
+    }
+    query_string = urlencode(query)
+    endpoint = "https://api.telegram.org/bot{}/sendPhoto?{}".format(
+        user_bot_token, query_string
+    )
+    return await request("GET", endpoint)
+
+
+async def send_poll(
+    chat_id: int, content: str, user_bot_token: str, message_thread_id: int
+) -> Response:
+    poll_content = json.loads(content)
+    endpoint = "https://api.telegram.org/bot{}/sendPoll".format(user_bot_token)
+    parameters = {
+        "chat_id": chat_id,
+        "question": poll_content.get("question"),
+        "options": json.dumps(
+            [option.get("text") for option in poll_content.get("options")]
+        ),
+        "type": poll_content.get("type"),
+        "is_anonymous": poll_content.get("is_anonymous"),
+        "allows_multiple_answers": poll_content.get("allows_multiple_answers"),
+        "correct_option_id": poll_content.get("correct_option_id"),
+        "explanation": poll_content.get("explanation"),
+        "explanation_parse_mode": "html",
+        "is_closed": poll_content.get("is_closed"),
+        "close_date": poll_content.get("close_date"),
+        "reply_to_message_id": message_thread_id,
+    }
+    # form-encode like requests does: drop None values, stringify the rest
+    data = {k: str(v) for k, v in parameters.items() if v is not None}
+    return await request("GET", endpoint, data=data)
+
+
+async def send_text(
+    chat_id: int, content: str, user_bot_token: str, message_thread_id: int
+) -> Response:
+    query = {
+        "chat_id": chat_id,
+        "text": content,
+        "parse_mode": "html",
+        "reply_to_message_id": message_thread_id,
+    }
+    query_string = urlencode(query)
+    endpoint = "https://api.telegram.org/bot{}/sendMessage?{}".format(
+        user_bot_token, query_string
+    )
+    return await request("GET", endpoint)
+
+
+async def delete_message(
+    chat_id: int, previous_message_id: str, user_bot_token: Optional[str] = None
+) -> Any:
+    if user_bot_token is None:
+        user_bot_token = TELEGRAM_BOT_TOKEN
+    for message_id in str(previous_message_id).split(";"):
+        endpoint = "https://api.telegram.org/bot{}/deleteMessage?chat_id={}&message_id={}".format(
+            user_bot_token, chat_id, message_id
+        )
+        status_code, body = await request("GET", endpoint)
+        log.log_api_previous_message_deletion(chat_id, message_id, status_code)
+    return body["ok"]
+
+
+async def prepare_photos(photo_id: str, content: str) -> Tuple[str, Dict[str, bytes]]:
+    photo_ids = photo_id.split(";")
+    media, files = [], {}
+    for i, photo_id in enumerate(photo_ids):
+        files[photo_id] = await download_photo(photo_id)
+        media.append(
+            {
+                "type": "photo",
+                "media": "attach://%s" % photo_id,
+                "caption": content if i <= 0 else "",
+            }
+        )
+    return json.dumps(media), files
+
+
+async def download_photo(
+    photo_id: str, bot_token: Optional[str] = TELEGRAM_BOT_TOKEN
+) -> bytes:
+    file_details_endpoint = "https://api.telegram.org/bot{}/getFile?file_id={}".format(
+        bot_token, photo_id
+    )
+    _, file_details = await request("GET", file_details_endpoint)
+    file_path = file_details["result"]["file_path"]
+    file_url = "https://api.telegram.org/file/bot{}/{}".format(bot_token, file_path)
+    async with get_session().get(file_url) as resp:
+        return await resp.read()
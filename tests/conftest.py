@@ -1,7 +1,9 @@
 import mongomock
 import pytest
 
+from database import mongo
 from database.mongo import MongoService
+from database.dbutils import dbutils_chat, dbutils_user
 
 pytest_plugins = ("pytest_asyncio",)
 
@@ -10,4 +12,12 @@ pytest_plugins = ("pytest_asyncio",)
 def mongo_service(mocker):
     client = mongomock.MongoClient()
     mocker.patch("database.mongo.MongoClient", return_value=client)
+    mongo.clients.clear()  # every test gets a fresh client
+    dbutils_chat.chat_cache.clear()
+    dbutils_user.user_cache.clear()
+    dbutils_user.touches.clear()
     yield MongoService()
+    mongo.clients.clear()
+    dbutils_chat.chat_cache.clear()
+    dbutils_user.user_cache.clear()
+    dbutils_user.touches.clear()
@@ -0,0 +1,65 @@
+from unittest import mock
+
+import pytest
+from bot.actions import actions
+from database import indexes
+from database.dbutils import dbutils, dbutils_job
+from telegram import Chat, Message, Update, User
+
+from tests.unit.conftest import mock_update
+
+
+def forwarded_update():
+    chat = Chat(id=1, type="private")
+    channel = Chat(id=2, type="channel", title="channel")
+    usr = User(id=1, first_name="hs", is_bot=False)
+    msg = Message(
+        date=1,
+        chat=chat,
+        message_id=1,
+        from_user=usr,
+        text="hello",
+        forward_from_chat=channel,
+    )
+    return Update(message=msg, update_id=1)
+
+
+@pytest.mark.asyncio
+@mock.patch("bot.replies.replies.send_request_text_message")
+@mock.patch("bot.replies.replies.send_invalid_new_job_message")
+@mock.patch(
+    "bot.actions.actions.permissions.check_rights", mock.AsyncMock(return_value=True)
+)
+async def test_add_new_job_taken_meanwhile(
+    invalid, request_text, mongo_service, mock_private, simple_context
+):
+    indexes.ensure_unique_indexes(mongo_service)
+    mongo_service.insert_new_chat(mock_private)
+    dbutils_job.add_new_entry(mongo_service, chat_id=1, jobname="a", user_id=2)
+
+    # the name was still free when checked
+    with mock.patch.object(dbutils, "entry_exists", return_value=False):
+        res = await actions.add_new_job(mock_update("a"), simple_context)
+    assert isinstance(res, Exception)
+    invalid.assert_awaited_once()
+    request_text.assert_not_called()
+
+
+@pytest.mark.asyncio
+@mock.patch("bot.replies.replies.send_request_crontab_message")
+async def test_add_new_channel_job_taken_meanwhile(
+    request_crontab, mongo_service, mock_private, mock_channel
+):
+    indexes.ensure_unique_indexes(mongo_service)
+    mongo_service.insert_new_chat(mock_private)
+    mongo_service.insert_new_chat(mock_channel)
+    # typed in by hand after the counter handed it out
+    dbutils_job.add_new_entry(mongo_service, chat_id=1, jobname="channe (1)", user_id=2)
+
+    names = iter(["channe (1)", "channe (2)"])
+    with mock.patch.object(
+        actions, "generate_jobname", side_effect=lambda *a: next(names)
+    ):
+        assert await actions.add_new_channel_job(forwarded_update()) is None
+    request_crontab.assert_awaited_once()
+    assert mongo_service.count_entries({"jobname": "channe (2)"}) == 1
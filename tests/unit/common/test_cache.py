@@ -0,0 +1,44 @@
+from unittest import mock
+
+from common import metrics
+from common.cache import TTLCache
+
+
+def test_lru_eviction():
+    cache = TTLCache("test_lru", maxsize=2, ttl=60)
+    cache.put(1, "a")
+    cache.put(2, "b")
+    assert cache.get(1) == "a"  # 2 is now the least recently used
+    cache.put(3, "c")
+
+    assert cache.get(2) is None
+    assert cache.get(1) == "a"
+    assert cache.get(3) == "c"
+    assert metrics.cache_evictions.labels("test_lru", "size")._value.get() == 1
+    assert metrics.cache_lookups.labels("test_lru", "hit")._value.get() == 3
+
+
+def test_ttl_expiry():
+    cache = TTLCache("test_ttl", maxsize=2, ttl=60)
+    with mock.patch("time.monotonic", return_value=100):
+        cache.put(1, "a")
+    with mock.patch("time.monotonic", return_value=159):
+        assert cache.get(1) == "a"
+    with mock.patch("time.monotonic", return_value=160):
+        assert cache.get(1) is None
+    assert metrics.cache_evictions.labels("test_ttl", "expired")._value.get() == 1
+
+
+def test_invalidate():
+    cache = TTLCache("test_invalidate", maxsize=3, ttl=60)
+    for key, value in enumerate([{"user": 1}, {"user": 1}, {"user": 2}]):
+        cache.put(key, value)
+    cache.invalidate(0)
+    cache.invalidate_where(lambda value: value["user"] == 1)
+    assert [cache.get(key) for key in range(3)] == [None, None, {"user": 2}]
+
+
+def test_disabled():
+    cache = TTLCache("test_disabled", maxsize=0, ttl=60)
+    cache.put(1, "a")
+    assert cache.get(1) is None
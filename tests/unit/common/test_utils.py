@@ -60,3 +60,12 @@ def test_extract_jobs():
     crontab, content = res[4]
     assert crontab == "* * * * *"
     assert content == "Every minute"
+
+
+def test_calc_next_runs(mocker):
+    calc = mocker.patch("common.utils.calc_next_run", return_value=("a", "b"))
+    calc.side_effect = lambda crontab, _: ("a", "b") if crontab != "bad" else 1 / 0
+
+    res = utils.calc_next_runs(["* * * * *", "bad", "* * * * *"], 8)
+    assert res == {"* * * * *": ("a", "b"), "bad": None}
+    assert calc.call_count == 2
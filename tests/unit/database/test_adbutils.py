@@ -0,0 +1,30 @@
+from unittest import mock
+import pytest
+
+from database import mongo
+from database.dbutils import adbutils, dbutils
+
+
+@pytest.mark.asyncio
+async def test_mirrors_dbutils(mongo_service, mock_group):
+    mongo_service.insert_new_chat(mock_group)
+    db_service = await adbutils.connect()
+    assert isinstance(db_service, mongo.MongoService)
+
+    chat_id = mock_group["chat_id"]
+    res = await adbutils.find_chat_by_chatid(db_service, chat_id)
+    assert res == dbutils.find_chat_by_chatid(db_service, chat_id)
+
+
+@pytest.mark.asyncio
+async def test_late_binding(mongo_service):
+    find = adbutils.find_chat_by_chatid
+    with mock.patch("database.dbutils.dbutils.find_chat_by_chatid", return_value=1):
+        assert await find(mongo_service, 1) == 1
+
+
+def test_unknown_name():
+    with pytest.raises(AttributeError):
+        adbutils.not_a_dbutils_function
+    with pytest.raises(AttributeError):
+        adbutils.nextrun_listeners
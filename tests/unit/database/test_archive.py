@@ -0,0 +1,101 @@
+from unittest import mock
+from database import archive
+
+
+def insert_removed(mongo_service, job_id, removed_ts):
+    mongo_service.insert_new_entry(
+        {"_id": job_id, "chat_id": 1, "jobname": str(job_id), "removed_ts": removed_ts}
+    )
+
+
+# utils.now(offset) is the cutoff, 30 days back
+@mock.patch("common.utils.now", mock.MagicMock(return_value="2024-01-01 00:00"))
+def test_archive_removed_entries(mongo_service):
+    insert_removed(mongo_service, 1, "2023-12-01 00:00")
+    insert_removed(mongo_service, 2, "2023-12-02 00:00")
+    insert_removed(mongo_service, 3, "2023-12-02 00:00")
+    insert_removed(mongo_service, 4, "2024-01-02 00:00")  # not old enough
+    insert_removed(mongo_service, 5, "")  # active
+
+    # batches of two, the last one short
+    assert archive.archive_removed_entries(mongo_service, 30, 2) == 3
+    ids = [x["_id"] for x in mongo_service.find_entries({})]
+    assert ids == [4, 5]
+    archived = mongo_service.find_archived_entries({})
+    assert [x["_id"] for x in archived] == [1, 2, 3]
+    assert "archived_at" not in archived[0]
+
+    checkpoint = mongo_service.find_checkpoint(archive.CHECKPOINT)
+    assert checkpoint["removed_ts"] == "2023-12-02 00:00"
+    assert checkpoint["job_id"] == 3
+    assert archive.archive_removed_entries(mongo_service, 30, 2) == 0
+    assert archive.archive_removed_entries(mongo_service, 0, 2) == 0
+
+
+@mock.patch("common.utils.now", mock.MagicMock(return_value="2024-01-01 00:00"))
+def test_archive_resumes_from_checkpoint(mongo_service):
+    insert_removed(mongo_service, 1, "2023-12-01 00:00")
+    insert_removed(mongo_service, 2, "2023-12-02 00:00")
+    mongo_service.save_checkpoint(
+        archive.CHECKPOINT, {"removed_ts": "2023-12-01 00:00", "job_id": 1}
+    )
+    assert archive.archive_removed_entries(mongo_service, 30, 10) == 1
+    assert [x["_id"] for x in mongo_service.find_archived_entries({})] == [2]
+
+
+def test_archive_keeps_revived_entries(mongo_service):
+    insert_removed(mongo_service, 1, "2023-12-01 00:00")
+    docs = mongo_service.find_entries({})
+    mongo_service.archive_entries(docs)
+    mongo_service.update_entry({"_id": 1}, {"removed_ts": ""})  # revived meanwhile
+
+    assert mongo_service.delete_archived_entries(docs).deleted_count == 0
+    assert mongo_service.find_one_entry({"_id": 1}) is not None
+
+
+@mock.patch("common.utils.now", mock.MagicMock(return_value="2024-01-01 00:00"))
+def test_archive_drops_copies_of_revived_entries(mongo_service):
+    insert_removed(mongo_service, 1, "2023-10-30 12:00")
+    insert_removed(mongo_service, 2, "2023-10-30 13:00")
+    delete = mongo_service.delete_archived_entries
+
+    def revive_then_delete(docs):  # revived between the copy and the delete
+        mongo_service.update_entry({"_id": 1}, {"removed_ts": ""})
+        return delete(docs)
+
+    with mock.patch.object(
+        mongo_service, "delete_archived_entries", side_effect=revive_then_delete
+    ):
+        assert archive.archive_removed_entries(mongo_service, 30, 10) == 2
+    assert [x["_id"] for x in mongo_service.find_archived_entries({})] == [2]
+
+    # a later restore of that range leaves the live job alone
+    archive.restore_entries_removed_between(mongo_service, "2023-10-30", "2023-11-01")
+    assert mongo_service.find_one_entry({"_id": 1})["removed_ts"] == ""
+    assert mongo_service.find_one_entry({"_id": 2})["removed_ts"] != ""
+
+
+def test_restore_never_overwrites_live_entries(mongo_service):
+    insert_removed(mongo_service, 1, "2023-10-30 12:00")
+    mongo_service.archive_entries(mongo_service.find_entries({}))
+    mongo_service.update_entry({"_id": 1}, {"removed_ts": ""})  # a stale copy left
+
+    archive.restore_entries_removed_between(mongo_service, "2023-10-30", "2023-11-01")
+    assert mongo_service.find_one_entry({"_id": 1})["removed_ts"] == ""
+    assert mongo_service.find_archived_entries({}) == []
+
+
+def test_restore_entries_removed_between(mongo_service):
+    insert_removed(mongo_service, 1, "2023-10-30 12:00")
+    insert_removed(mongo_service, 2, "2023-12-01 00:00")
+    mongo_service.archive_entries(mongo_service.find_entries({}))
+    mongo_service.delete_archived_entries(mongo_service.find_entries({}))
+
+    res = archive.restore_entries_removed_between(
+        mongo_service, "2023-10-30", "2023-11-01"
+    )
+    assert [x["_id"] for x in res] == [1]
+    restored = mongo_service.find_one_entry({"_id": 1})
+    assert restored["removed_ts"] == "2023-10-30 12:00"
+    assert "archived_at" not in restored
+    assert [x["_id"] for x in mongo_service.find_archived_entries({})] == [2]
@@ -1,4 +1,12 @@
-from database.dbutils.dbutils_chat import find_groups_created_by
+from unittest import mock
+from database import mongo
+from database.dbutils import dbutils_chat
+from database.dbutils.dbutils_chat import (
+    find_chat_by_chatid,
+    find_chats_by_chatids,
+    find_groups_created_by,
+    update_chat_entry,
+)
 
 
 def test_find_groups_created_by(mongo_service):
@@ -20,3 +28,58 @@ def test_find_groups_created_by(mongo_service):
     assert len(res) == 2
     assert res[0]["chat_type"] == "group"
     assert res[1]["chat_type"] == "supergroup"
+
+
+def test_find_chats_by_chatids(mongo_service):
+    for chat_id in [1.0, -100.0, 2.0]:
+        mongo_service.insert_new_chat({"chat_id": chat_id, "tz_offset": 8})
+
+    res = find_chats_by_chatids(mongo_service, [1, "-100", 1, 3])
+    assert set(res.keys()) == {1.0, -100.0}
+    assert res[-100.0]["tz_offset"] == 8
+
+
+def test_find_chat_by_chatid_remembered(mongo_service, mock_group):
+    mongo_service.insert_new_chat(mock_group)
+    with mock.patch.object(
+        mongo_service, "find_one_chat_entry", wraps=mongo_service.find_one_chat_entry
+    ) as find_one:
+        first = find_chat_by_chatid(mongo_service, 1)
+        assert find_chat_by_chatid(mongo_service, "1") is first
+        assert find_one.call_count == 1
+
+        # a write forgets what was read, the next lookup sees the change
+        update_chat_entry(mongo_service, 1, {"restriction": "creator"})
+        assert find_chat_by_chatid(mongo_service, 1)["restriction"] == "creator"
+        assert find_one.call_count == 2
+
+
+def test_chat_cache(mongo_service, mock_group):
+    mongo_service.insert_new_chat(mock_group)
+    find_chat_by_chatid(mongo_service, 1)
+
+    # another request, another service: served from the process-wide cache
+    other = mongo.MongoService()
+    with mock.patch.object(other, "find_one_chat_entry") as find_one:
+        assert find_chat_by_chatid(other, 1)["chat_title"] == "test_group"
+        find_one.assert_not_called()
+    assert find_chats_by_chatids(other, [1]).keys() == {1.0}
+
+    update_chat_entry(other, 1, {"restriction": "creator"})
+    assert 1.0 not in dbutils_chat.chat_cache.entries
+
+
+@mock.patch("config.CHAT_CACHE_SIGNAL", True)
+def test_chat_cache_signal(mongo_service, mock_group):
+    mongo_service.insert_new_chat(mock_group)
+    find_chat_by_chatid(mongo_service, 1)
+    assert 1.0 in dbutils_chat.chat_cache.entries
+
+    # written by another process, only the signal reaches this one
+    mongo_service.chat_data_collection.update_one(
+        {"chat_id": 1}, {"$set": {"restriction": "creator"}}
+    )
+    dbutils_chat.invalidate_chat(mongo_service, 1)
+    dbutils_chat.chat_cache.put(1.0, mock_group)
+    dbutils_chat.signals_polled["at"] = 0.0
+    assert find_chat_by_chatid(mongo.MongoService(), 1)["restriction"] == "creator"
@@ -1,5 +1,6 @@
 from unittest import mock
 import pytest
+from database import indexes
 from database.dbutils import dbutils_job
 
 
@@ -192,6 +193,20 @@ def test_add_new_entry(mongo_service):
     assert res["remarks"] == ""
     assert res["user_bot_token"] is None
     assert res["errors"] == []
+    assert res["state"] == "active"
+
+
+def test_add_new_entry_taken_name(mongo_service):
+    indexes.ensure_unique_indexes(mongo_service)
+    assert dbutils_job.add_new_entry(mongo_service, chat_id=1, jobname="a", user_id=2)
+
+    # lost the race to an update adding the same name, nothing counted
+    with mock.patch.object(dbutils_job.dbutils_quota, "update_user_quotas") as quota:
+        assert not dbutils_job.add_new_entry(
+            mongo_service, chat_id=1, jobname="a", user_id=3
+        )
+    quota.assert_not_called()
+    assert mongo_service.count_entries({"chat_id": 1}) == 1
 
 
 def test_remove_entries_by_chat(mongo_service, mock_jobs):
@@ -199,6 +214,7 @@ def test_remove_entries_by_chat(mongo_service, mock_jobs):
     dbutils_job.remove_entries_by_chat(mongo_service, 1)
     result = dbutils_job.find_entries_by_chatid(mongo_service, 1)
     assert len(result) == 0
+    assert mongo_service.count_entries({"chat_id": 1, "state": "removed"}) == 4
 
 
 def test_update_entry_by_jobname(mongo_service, mock_jobs):
@@ -211,3 +227,226 @@ def test_update_entry_by_jobname(mongo_service, mock_jobs):
     res = mongo_service.find_one_entry({"_id": 1})
     assert res is not None
     assert res["created_ts"] == 4
+
+
+def test_claim_entries(mongo_service, mock_jobs):
+    mongo_service.main_collection.insert_many(mock_jobs)
+    ts = "2012-02-11 08:23"
+    entries = [{"_id": 2}, {"_id": 1}]
+
+    res = dbutils_job.claim_entries(mongo_service, entries, ts, "worker-a")
+    assert [entry["_id"] for entry in res] == [2, 1]
+    assert res[0]["crontab"] == "* * * * *"
+    assert "lease_owner" not in res[0]  # projected to what workers need
+    claimed = mongo_service.find_entries({"lease_owner": "worker-a"})
+    assert len(claimed) == 2
+    assert all(entry["pending_ts"] is not None for entry in claimed)
+
+    # held by another worker until the lease expires
+    assert dbutils_job.claim_entries(mongo_service, entries, ts, "worker-b") == []
+
+    mongo_service.update_entry({"_id": 1}, {"lease_expires_ts": "2000-01-01 00:00"})
+    res = dbutils_job.claim_entries(mongo_service, entries, ts, "worker-b")
+    assert [entry["_id"] for entry in res] == [1]
+
+
+def test_claim_entries_not_due(mongo_service, mock_jobs):
+    mongo_service.main_collection.insert_many(mock_jobs)
+    # already sent by another dispatcher, next run moved forward
+    res = dbutils_job.claim_entries(
+        mongo_service, [{"_id": 1}], "2012-02-11 08:21", "a"
+    )
+    assert res == []
+    # removed jobs can't be claimed
+    res = dbutils_job.claim_entries(
+        mongo_service, [{"_id": 4}], "2012-02-11 08:23", "a"
+    )
+    assert res == []
+
+
+@mock.patch("common.utils.now", mock.MagicMock(return_value="2012-12-11 00:00:00"))
+def test_iter_entries_by_nextrun(mongo_service, mock_jobs):
+    mongo_service.main_collection.insert_many(mock_jobs)
+    res = dbutils_job.iter_entries_by_nextrun(mongo_service, "2013-12-11 00:00:00")
+    assert not isinstance(res, list)
+    res = list(res)
+    assert set(entry["_id"] for entry in res) == set([1, 2, 3])
+    assert all(list(entry.keys()) == ["_id"] for entry in res)
+
+
+@mock.patch("config.JOB_SCHEMA_DUAL_READ", False)
+def test_find_entries_by_nextrun_by_state(mongo_service):
+    for i, state in enumerate(["active", "paused", "removed", "pending"]):
+        doc = {"_id": i, "state": state, "nextrun_ts": "2012-02-11 08:22"}
+        mongo_service.insert_new_entry(doc)
+    mongo_service.insert_new_entry({"_id": 4, "nextrun_ts": "2012-02-11 08:22"})
+
+    res = dbutils_job.find_entries_by_nextrun(mongo_service, "2012-02-11 08:22")
+    assert [entry["_id"] for entry in res] == [0]
+
+
+@mock.patch("config.JOB_SCHEMA_DUAL_READ", False)
+def test_find_entries_by_nextrun_oldest_first(mongo_service):
+    for i, nextrun_ts in enumerate(["2012-02-11 08:22", "2012-02-11 08:20"]):
+        doc = {"_id": i, "state": "active", "nextrun_ts": nextrun_ts}
+        mongo_service.insert_new_entry(doc)
+
+    res = dbutils_job.find_entries_by_nextrun(mongo_service, "2012-02-11 08:22")
+    assert [entry["_id"] for entry in res] == [1, 0]
+
+
+def test_release_expired_leases(mongo_service):
+    claim = {"state": "pending", "pending_ts": "2012-02-11 08:22", "lease_owner": "a"}
+    mongo_service.insert_new_entry(
+        {"_id": 1, "lease_expires_ts": "2012-02-11 08:27", "removed_ts": "", **claim}
+    )
+    mongo_service.insert_new_entry(
+        {"_id": 2, "lease_expires_ts": "2999-01-01 00:00", "removed_ts": "", **claim}
+    )
+
+    dbutils_job.release_expired_leases(mongo_service)
+    res = mongo_service.find_one_entry({"_id": 1})
+    assert res["state"] == "active"
+    assert res["lease_owner"] is None
+    assert res["pending_ts"] is None
+    assert mongo_service.find_one_entry({"_id": 2})["state"] == "pending"
+
+
+def test_allocate_jobname(mongo_service):
+    for jobname in ["group (1)", "group (3)", "grp(x) (7)", "group (4"]:
+        mongo_service.insert_new_entry({"chat_id": 1, "jobname": jobname})
+
+    # seeded once from the highest number in use, then one $inc per name
+    assert dbutils_job.allocate_jobname(mongo_service, 1, "group") == "group (4)"
+    with mock.patch.object(dbutils_job, "jobname_seed") as seed:
+        assert dbutils_job.allocate_jobname(mongo_service, 1, "group") == "group (5)"
+        seed.assert_not_called()
+
+    assert dbutils_job.allocate_jobname(mongo_service, 1, "grp(x)") == "grp(x) (8)"
+    assert dbutils_job.allocate_jobname(mongo_service, 2, "group") == "group (1)"
+
+    # typed in by hand, skipped
+    mongo_service.insert_new_entry(
+        {"chat_id": 1, "jobname": "group (6)", "removed_ts": ""}
+    )
+    assert dbutils_job.allocate_jobname(mongo_service, 1, "group") == "group (7)"
+
+
+def test_allocate_jobnames(mongo_service):
+    mongo_service.insert_new_entry({"chat_id": 1, "jobname": "group (2)"})
+    assert dbutils_job.allocate_jobname(mongo_service, 1, "group") == "group (3)"
+    mongo_service.insert_new_entry(
+        {"chat_id": 1, "jobname": "group (5)", "removed_ts": ""}
+    )
+
+    # one $inc for the batch, then one more to replace the name typed in by hand
+    with mock.patch.object(
+        mongo_service, "increment_counter", wraps=mongo_service.increment_counter
+    ) as inc:
+        res = dbutils_job.allocate_jobnames(mongo_service, 1, "group", 3)
+        assert res == ["group (4)", "group (6)", "group (7)"]
+        assert [c.args[1] for c in inc.call_args_list] == [3, 1]
+    assert dbutils_job.allocate_jobnames(mongo_service, 1, "group", 0) == []
+
+
+def test_add_new_entries(mongo_service):
+    entries = [
+        {
+            "chat_id": 1,
+            "jobname": str(i),
+            "user_id": 2,
+            "nextrun_ts": "2999-01-01 00:00",
+        }
+        for i in range(3)
+    ]
+    assert dbutils_job.add_new_entries(mongo_service, entries) == {}
+    res = mongo_service.find_entries({"chat_id": 1})
+    assert [x["jobname"] for x in res] == ["0", "1", "2"]
+    assert all(x["state"] == "active" and x["schema_version"] for x in res)
+    assert res[0]["nextrun_at"] is not None
+    assert dbutils_job.dbutils_quota.find_user_quota(mongo_service, 2)["job_count"] == 3
+    assert dbutils_job.add_new_entries(mongo_service, []) == {}
+
+
+def test_add_new_entries_partial_failure(mongo_service):
+    from pymongo.errors import BulkWriteError
+
+    err = BulkWriteError({"writeErrors": [{"index": 1, "errmsg": "duplicate key"}]})
+    entries = [{"chat_id": 1, "jobname": str(i), "user_id": 2} for i in range(3)]
+    with mock.patch.object(mongo_service, "insert_new_entries", side_effect=err):
+        with mock.patch.object(dbutils_job.dbutils_quota, "update_user_quotas") as q:
+            res = dbutils_job.add_new_entries(mongo_service, entries)
+    assert res == {1: "duplicate key"}
+    # only the two that went in count towards the quota
+    q.assert_called_once_with(mongo_service, {2: 2})
+
+
+def test_recompute_nextruns(mongo_service):
+    base = {"crontab": "0 * * * *", "nextrun_ts": "2000-01-01 00:00", "removed_ts": ""}
+    mongo_service.insert_new_entry({"_id": 1, "chat_id": 1, **base})
+    mongo_service.insert_new_entry({"_id": 2, "chat_id": 2, **base})
+    mongo_service.insert_new_entry({"_id": 3, "chat_id": 3, **base})
+    mongo_service.insert_new_entry({"_id": 4, "chat_id": 1, **base, "removed_ts": "x"})
+    mongo_service.insert_new_entry({"_id": 5, "chat_id": 1, **base, "nextrun_ts": ""})
+    mongo_service.insert_new_entry({"_id": 6, "chat_id": 1, **base, "crontab": "bad"})
+
+    with mock.patch.object(
+        mongo_service, "bulk_update_entries", wraps=mongo_service.bulk_update_entries
+    ) as bulk:
+        assert dbutils_job.recompute_nextruns(mongo_service, [1, 2], 9) == 2
+        bulk.assert_called_once()
+
+    res = {x["_id"]: x for x in mongo_service.find_entries({})}
+    for i in [1, 2]:
+        assert res[i]["nextrun_ts"] != "2000-01-01 00:00"
+        assert res[i]["user_nextrun_ts"] != ""
+        assert res[i]["nextrun_at"] is not None
+    for i in [3, 4, 6]:
+        assert res[i]["nextrun_ts"] == "2000-01-01 00:00"
+    assert res[5]["nextrun_ts"] == ""
+    assert dbutils_job.recompute_nextruns(mongo_service, [3], 9) == 1
+    assert dbutils_job.recompute_nextruns(mongo_service, [4], 9) == 0
+
+
+def test_rename_duplicate_jobnames(mongo_service):
+    for i, jobname in enumerate(["a", "a", "a (1)", "a", "b"]):
+        mongo_service.insert_new_entry(
+            {"_id": i, "chat_id": 1, "jobname": jobname, "removed_ts": ""}
+        )
+        mongo_service.update_entry({"_id": i}, {"created_ts": str(i)})
+
+    assert dbutils_job.rename_duplicate_jobnames(mongo_service) == 2
+    res = {x["_id"]: x["jobname"] for x in mongo_service.find_entries({})}
+    assert res == {0: "a", 1: "a (2)", 2: "a (1)", 3: "a (3)", 4: "b"}
+    assert dbutils_job.rename_duplicate_jobnames(mongo_service) == 0
+
+
+def test_revive_entry(mongo_service):
+    removed = {"chat_id": 1, "jobname": "a", "created_by": 2, "removed_ts": "x"}
+    mongo_service.insert_new_entry({"_id": 1, **removed})
+    mongo_service.insert_new_entry(
+        {"_id": 2, "chat_id": 1, "jobname": "a", "removed_ts": ""}
+    )
+
+    # name reused since, revived under a free one
+    entry = mongo_service.find_one_entry({"_id": 1})
+    res = dbutils_job.revive_entry(mongo_service, entry, {"removed_ts": ""})
+    assert res.modified_count == 1
+    revived = mongo_service.find_one_entry({"_id": 1})
+    assert revived["jobname"] == "a (1)"
+    assert revived["removed_ts"] == ""
+    assert dbutils_job.dbutils_quota.find_user_quota(mongo_service, 2)["job_count"] == 1
+
+
+def test_revive_entry_name_taken_meanwhile(mongo_service):
+    from pymongo.errors import DuplicateKeyError
+
+    entry = {"_id": 1, "chat_id": 1, "jobname": "a", "removed_ts": "x"}
+    mongo_service.insert_new_entry(dict(entry))
+    with mock.patch.object(
+        dbutils_job, "update_entry_by_jobid", side_effect=DuplicateKeyError("dup")
+    ):
+        assert (
+            dbutils_job.revive_entry(mongo_service, entry, {"removed_ts": ""}) is None
+        )
+    assert mongo_service.find_one_entry({"_id": 1})["removed_ts"] == "x"
@@ -0,0 +1,51 @@
+from unittest import mock
+import config
+from database.dbutils import dbutils, dbutils_job, dbutils_quota
+
+
+def test_get_user_limit(mongo_service):
+    for i in range(3):
+        dbutils_job.add_new_entry(mongo_service, chat_id=1, jobname=str(i), user_id=2)
+
+    # no whitelist entry, first flag is whether the default limit is reached
+    assert dbutils.get_user_limit(mongo_service, 2) == (
+        False,
+        config.JOB_LIMIT_PER_PERSON,
+    )
+
+    mongo_service.user_whitelist_collection.insert_one(
+        {"user_id": 3, "removed_ts": "", "new_limit": 50}
+    )
+    dbutils_job.add_new_entry(mongo_service, chat_id=1, jobname="3", user_id=3)
+    assert dbutils.get_user_limit(mongo_service, 3) == (1, 50)
+
+
+def test_user_quota_maintained(mongo_service):
+    dbutils_job.add_new_entry(mongo_service, chat_id=1, jobname="a", user_id=2)
+    assert dbutils_quota.find_user_quota(mongo_service, 2)["job_count"] == 1
+
+    # counted once, then only adjusted
+    with mock.patch.object(mongo_service, "count_entries") as count:
+        dbutils_job.add_new_entry(mongo_service, chat_id=1, jobname="b", user_id=2)
+        dbutils_job.add_new_entry(mongo_service, chat_id=2, jobname="c", user_id=2)
+        assert dbutils_quota.find_user_quota(mongo_service, 2)["job_count"] == 3
+        dbutils_job.remove_entries_by_chat(mongo_service, 1)
+        assert dbutils_quota.find_user_quota(mongo_service, 2)["job_count"] == 1
+        count.assert_not_called()
+
+
+def test_expected_user_quotas(mongo_service):
+    for jobname, user_id, removed_ts in [("a", 2, ""), ("b", 2, ""), ("c", 3, "x")]:
+        mongo_service.main_collection.insert_one(
+            {"jobname": jobname, "created_by": user_id, "removed_ts": removed_ts}
+        )
+    mongo_service.user_whitelist_collection.insert_one(
+        {"user_id": 4, "removed_ts": "", "new_limit": 50}
+    )
+    dbutils_quota.reset_user_quota(mongo_service, 3, 5, None)  # drifted
+
+    assert dbutils_quota.expected_user_quotas(mongo_service) == {
+        2.0: {"job_count": 2, "new_limit": None},
+        3.0: {"job_count": 0, "new_limit": None},
+        4.0: {"job_count": 0, "new_limit": 50},
+    }
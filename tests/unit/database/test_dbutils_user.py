@@ -0,0 +1,57 @@
+from unittest import mock
+from telegram import Chat, Message, Update, User
+
+from database.dbutils import dbutils_user
+
+
+def user_update(first_name="hs", username=None):
+    chat = Chat(id=1, type="private")
+    usr = User(id=1, first_name=first_name, is_bot=False, username=username)
+    msg = Message(date=1, chat=chat, message_id=1, from_user=usr)
+    return Update(message=msg, update_id=1)
+
+
+def current_users(mongo_service):
+    return list(mongo_service.user_data_collection.find({"superseded_at": ""}))
+
+
+@mock.patch("common.utils.now", mock.MagicMock(return_value="2012-02-11 08:22"))
+def test_sync_user_data_unchanged(mongo_service):
+    dbutils_user.sync_user_data(mongo_service, user_update())
+    user = current_users(mongo_service)[0]
+
+    with mock.patch.object(mongo_service, "user_data_collection") as collection:
+        dbutils_user.sync_user_data(mongo_service, user_update())
+        dbutils_user.sync_user_data(mongo_service, user_update())
+        assert collection.mock_calls == []  # served from the cache, touch deferred
+    assert list(dbutils_user.touches) == [user["_id"]]
+
+    assert dbutils_user.flush_user_touches(mongo_service) == 1
+    assert dbutils_user.touches == {}
+    res = mongo_service.find_one_user({"_id": user["_id"]})
+    assert res["last_used_at"] == "2012-02-11 08:22"
+
+
+def test_sync_user_data_changed(mongo_service):
+    dbutils_user.sync_user_data(mongo_service, user_update())
+    dbutils_user.sync_user_data(mongo_service, user_update(first_name="new"))
+
+    users = current_users(mongo_service)
+    assert len(users) == 1
+    assert users[0]["first_name"] == "new"
+    assert mongo_service.user_data_collection.count_documents({}) == 2
+
+
+def test_sync_user_data_stale_cache(mongo_service):
+    dbutils_user.sync_user_data(mongo_service, user_update())
+    # another process already recorded the new name, our cached copy is stale
+    mongo_service.user_data_collection.update_one(
+        {"superseded_at": ""}, {"$set": {"superseded_at": "x"}}
+    )
+    mongo_service.insert_new_user(
+        {"user_id": 1, "username": None, "first_name": "new", "superseded_at": ""}
+    )
+
+    dbutils_user.sync_user_data(mongo_service, user_update(first_name="new"))
+    assert [user["first_name"] for user in current_users(mongo_service)] == ["new"]
+    assert mongo_service.user_data_collection.count_documents({}) == 2
@@ -0,0 +1,118 @@
+from unittest import mock
+import pytest
+
+import config
+from database import indexes
+from database.dbutils import dbutils_job
+
+
+def test_ensure_indexes(mongo_service):
+    indexes.ensure_indexes(mongo_service)
+    info = mongo_service.main_collection.index_information()
+    assert "active_nextrun" in info
+    assert "active_nextrun_at" not in info
+    assert "chat_jobname" in info
+    assert "chat_id" in mongo_service.chat_data_collection.index_information()
+
+    # idempotent on every startup
+    indexes.ensure_indexes(mongo_service)
+
+
+def test_ensure_unique_indexes_isolated(mongo_service):
+    # duplicates fail the unique index alone, not the ones dispatch relies on
+    for _ in range(2):
+        mongo_service.insert_new_entry({"chat_id": 1, "jobname": "a", "removed_ts": ""})
+    indexes.ensure_indexes(mongo_service)
+    indexes.ensure_unique_indexes(mongo_service)
+    info = mongo_service.main_collection.index_information()
+    assert "state_nextrun_at" in info
+    assert "active_chat_jobname" not in info
+
+
+def test_ensure_capped_collections(mongo_service):
+    # mongomock can't create capped collections, check what would be asked for
+    with mock.patch.object(mongo_service.db, "create_collection") as create:
+        indexes.ensure_capped_collections(mongo_service)
+        create.assert_called_once_with(
+            config.MONGODB_JOB_ERRORS_COLLECTION,
+            capped=True,
+            size=config.JOB_ERRORS_CAP_BYTES,
+        )
+
+    # created uncapped by an insert before setup ever ran; mongomock has no
+    # Collection.options, so what mongo would report is patched in
+    mongo_service.insert_job_error({"job_id": 1})
+    for options, calls in [
+        ({}, [mock.call("convertToCapped", "job_errors", size=64 * 1024 * 1024)]),
+        ({"capped": True}, []),
+    ]:
+        with mock.patch(
+            "mongomock.collection.Collection.options",
+            create=True,
+            return_value=options,
+        ), mock.patch.object(mongo_service.db, "command") as command:
+            indexes.ensure_capped_collections(mongo_service)
+        assert command.call_args_list == calls
+
+
+def test_active_jobname_unique():
+    # mongomock drops partialFilterExpression, check the declared spec instead
+    models = indexes.UNIQUE_INDEXES[config.MONGODB_JOB_DATA_COLLECTION]
+    spec = next(
+        m.document for m in models if m.document["name"] == "active_chat_jobname"
+    )
+    assert spec["unique"] is True
+    assert spec["partialFilterExpression"] == {"removed_ts": ""}
+
+
+@pytest.mark.parametrize(
+    ["plan", "expected"],
+    [
+        ({"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}}, False),
+        ({"stage": "COLLSCAN"}, True),
+        (
+            {
+                "stage": "SUBPLAN",
+                "inputStage": {
+                    "stage": "OR",
+                    "inputStages": [{"stage": "IXSCAN"}, {"stage": "COLLSCAN"}],
+                },
+            },
+            True,
+        ),
+    ],
+)
+def test_uses_collscan(plan, expected):
+    assert indexes.uses_collscan(plan) == expected
+
+
+def explain_with(plan):
+    # mongomock has no query planner
+    explain = mock.MagicMock(return_value={"queryPlanner": {"winningPlan": plan}})
+    return mock.patch("mongomock.collection.Cursor.explain", explain, create=True)
+
+
+@explain_with({"stage": "IXSCAN"})
+def test_verify_query_plans(mongo_service):
+    assert indexes.verify_query_plans(mongo_service) == []
+
+
+@explain_with({"stage": "COLLSCAN"})
+def test_verify_query_plans_collscan(mongo_service):
+    scans = indexes.verify_query_plans(mongo_service)
+    assert "due_jobs" in scans
+
+    with mock.patch("config.INDEX_CHECK_STRICT", True):
+        with pytest.raises(RuntimeError):
+            indexes.verify_query_plans(mongo_service)
+
+
+def test_due_jobs_sort_served_by_index():
+    # the dispatch cursor only streams if the sort follows the index, not a SORT stage
+    shape = next(s for s in indexes.query_shapes() if s[0] == "due_jobs")
+    models = indexes.INDEXES[config.MONGODB_JOB_DATA_COLLECTION]
+    keys = next(
+        m.document["key"] for m in models if m.document["name"] == "state_nextrun_at"
+    )
+    assert shape[3] == dbutils_job.DUE_SORT
+    assert list(keys.items())[-len(shape[3]) :] == shape[3]
@@ -0,0 +1,53 @@
+from unittest import mock
+from pymongo import MongoClient
+
+from common import metrics
+from database import mongo
+
+
+def test_get_client_is_shared(mongo_service):
+    assert mongo.get_client(None) is mongo.get_client(None)
+    assert mongo.MongoService().db.client is mongo_service.db.client
+    assert len(mongo.clients) == 1
+
+
+def test_close_clients():
+    client = mock.MagicMock()
+    with mock.patch("database.mongo.MongoClient", return_value=client):
+        mongo.get_client("mongodb://a")
+        mongo.close_clients()
+    client.close.assert_called_once()
+    assert mongo.clients == {}
+
+
+def test_pool_metrics():
+    # pymongo validates the listener when the client is built
+    MongoClient(
+        "mongodb://localhost:1", connect=False, event_listeners=[mongo.PoolMetrics()]
+    ).close()
+
+    listener = mongo.PoolMetrics()
+    event = mock.MagicMock(address=("localhost", 27017))
+    gauge = metrics.mongo_pool_checked_out.labels("localhost:27017")
+    before = gauge._value.get()
+    listener.connection_checked_out(event)
+    assert gauge._value.get() == before + 1
+    listener.connection_checked_in(event)
+    assert gauge._value.get() == before
+
+
+def test_identity_map(mongo_service):
+    load = mock.MagicMock(return_value=None)
+    hits = metrics.mongo_identity_map_lookups.labels("chat", "hit")
+    before = hits._value.get()
+
+    assert mongo_service.remember(("chat", 1.0), load) is None
+    assert mongo_service.remember(("chat", 1.0), load) is None
+    assert load.call_count == 1  # misses are remembered too
+    assert hits._value.get() == before + 1
+
+    mongo_service.insert_new_chat({"chat_id": 1.0})
+    mongo_service.remember(("chat", 1.0), load)
+    assert load.call_count == 2
+    # every service starts empty, i.e. one map per bot update
+    assert mongo.MongoService().identity_map == {}
@@ -0,0 +1,131 @@
+from datetime import datetime, timezone
+from unittest import mock
+import pytest
+
+from database import schema, writeback
+from database.dbutils import dbutils_job
+
+
+@pytest.mark.parametrize(
+    ["ts", "expected"],
+    [
+        ("", None),
+        (None, None),
+        ("2012-02-11 08:22", datetime(2012, 2, 11, 0, 22, tzinfo=timezone.utc)),
+        (
+            "2012-02-11 08:22:10.500000",
+            datetime(2012, 2, 11, 0, 22, 10, 500000, tzinfo=timezone.utc),
+        ),
+    ],
+)
+def test_to_utc(ts, expected):
+    assert schema.to_utc(ts) == expected
+
+
+def test_datetime_mirrors():
+    update = {"nextrun_ts": "2012-02-11 08:22", "removed_ts": "", "created_ts": 1}
+    assert schema.datetime_mirrors(update) == {
+        "nextrun_at": datetime(2012, 2, 11, 0, 22, tzinfo=timezone.utc),
+        "removed_at": None,
+    }
+
+
+def test_writes_keep_mirrors(mongo_service):
+    mongo_service.insert_new_entry({"_id": 1, "nextrun_ts": "", "removed_ts": ""})
+    res = mongo_service.find_one_entry({"_id": 1})
+    assert res["schema_version"] == schema.JOB_SCHEMA_VERSION
+    assert res["nextrun_at"] is None
+    assert res["created_at"] is not None
+
+    mongo_service.update_entry({"_id": 1}, {"nextrun_ts": "2012-02-11 08:22"})
+    res = mongo_service.find_one_entry({"_id": 1})
+    assert res["nextrun_at"] == datetime(2012, 2, 11, 0, 22)
+
+
+def test_migration_update(mongo_service):
+    entry = {
+        "_id": 1,
+        "nextrun_ts": "2012-02-11 08:22",
+        "removed_ts": "",
+        "last_update_ts": "2012-02-10 10:00",
+    }
+    mongo_service.main_collection.insert_one(entry)
+
+    q, payload = schema.migration_update(entry)
+    writeback.bulk_update(mongo_service, [(q, payload)], touch=False)
+    res = mongo_service.find_one_entry({"_id": 1})
+    assert res["schema_version"] == schema.JOB_SCHEMA_VERSION
+    assert res["removed_at"] is None
+    # migrating is not an edit, the last update time survives
+    assert res["last_update_ts"] == "2012-02-10 10:00"
+    assert res["last_update_at"] == datetime(2012, 2, 10, 2, 0)
+
+    # a concurrent write changed the job, the stale update must not apply
+    mongo_service.main_collection.insert_one({"_id": 2, "nextrun_ts": "a"})
+    q, payload = schema.migration_update({"_id": 2, "nextrun_ts": "b"})
+    assert mongo_service.bulk_update_entries([(q, payload)]).matched_count == 0
+
+
+@mock.patch("common.utils.now", mock.MagicMock(return_value="2012-12-11 00:00:00"))
+@pytest.mark.parametrize("dual_read", [True, False])
+def test_find_entries_by_nextrun_dual_read(mongo_service, dual_read):
+    base = {"removed_ts": "", "crontab": "* * * * *", "pending_ts": None}
+    mongo_service.main_collection.insert_one(
+        {"_id": 1, "nextrun_ts": "2012-02-11 08:22", **base}
+    )
+    base = {"state": "active", **base}
+    mongo_service.insert_new_entry({"_id": 2, "nextrun_ts": "2012-02-11 08:22", **base})
+    mongo_service.insert_new_entry({"_id": 3, "nextrun_ts": "2012-02-11 09:22", **base})
+
+    with mock.patch("config.JOB_SCHEMA_DUAL_READ", dual_read):
+        res = dbutils_job.find_entries_by_nextrun(mongo_service, "2012-02-11 08:22")
+    expected = {1, 2} if dual_read else {2}
+    assert set(entry["_id"] for entry in res) == expected
+
+
+@pytest.mark.parametrize(
+    ["entry", "expected"],
+    [
+        (
+            {"removed_ts": "2012-02-11 08:00", "paused_ts": "2012-02-11 08:00"},
+            "removed",
+        ),
+        ({"removed_ts": "", "paused_ts": "2012-02-11 08:00"}, "paused"),
+        ({"removed_ts": "", "pending_ts": None}, "active"),
+        (
+            {"pending_ts": "2012-02-11 08:20", "lease_expires_ts": "2999-01-01 00:00"},
+            "pending",
+        ),
+        (
+            {"pending_ts": "2012-02-11 08:10", "lease_expires_ts": "2012-02-11 08:15"},
+            "active",
+        ),
+        ({"pending_ts": "2999-01-01 00:00"}, "pending"),
+        ({"pending_ts": "2012-02-11 08:00"}, "active"),
+    ],
+)
+def test_job_state(entry, expected):
+    assert schema.job_state(entry) == expected
+
+
+def test_state_backfill_update(mongo_service):
+    entry = {
+        "_id": 1,
+        "removed_ts": "",
+        "paused_ts": "2012-02-11 08:00",
+        "last_update_ts": "2012-02-10 10:00",
+    }
+    mongo_service.main_collection.insert_one(entry)
+    q, payload = schema.state_backfill_update(entry)
+    assert payload == {"state": "paused"}
+    assert writeback.bulk_update(mongo_service, [(q, payload)], touch=False) == {}
+    res = mongo_service.find_one_entry({"_id": 1})
+    assert res["state"] == "paused"
+    assert res["last_update_ts"] == "2012-02-10 10:00"
+    assert "last_update_at" not in res
+
+    # unpaused since it was read, the stale state must not apply
+    entry = {"_id": 2, "removed_ts": "", "paused_ts": "2012-02-11 08:00"}
+    mongo_service.main_collection.insert_one({**entry, "paused_ts": ""})
+    q, payload = schema.state_backfill_update(entry)
+    assert mongo_service.bulk_update_entries([(q, payload)]).matched_count == 0
@@ -0,0 +1,55 @@
+from unittest import mock
+from pymongo.errors import BulkWriteError
+
+from database.writeback import BulkWriter
+
+
+def test_bulk_writer_flush(mongo_service):
+    mongo_service.main_collection.insert_many([{"_id": 1}, {"_id": 2}])
+    written = []
+    writer = BulkWriter(mongo_service, lambda u, i: written.append(i), max_ops=2)
+
+    writer.add({"_id": 1}, {"x": 1})
+    assert not writer.due()
+    writer.add({"_id": 2}, {"x": 2})
+    assert writer.due()
+
+    assert writer.flush() == 2
+    assert not writer.due()
+    assert written == [1, 2]
+    assert mongo_service.find_one_entry({"_id": 2})["x"] == 2
+
+
+def test_bulk_writer_due_by_age(mongo_service):
+    writer = BulkWriter(mongo_service, max_ops=100, max_age=0)
+    assert not writer.due()
+    writer.add({"_id": 1}, {"x": 1})
+    assert writer.due()
+
+
+def test_bulk_writer_reports_failed_ops(mongo_service):
+    written = []
+    writer = BulkWriter(mongo_service, lambda u, i: written.append(i))
+    writer.add({"_id": 1}, {"x": 1})
+    writer.add({"_id": 2}, {"x": 2})
+
+    err = BulkWriteError({"writeErrors": [{"index": 0, "errmsg": "boom"}]})
+    with mock.patch.object(mongo_service, "bulk_update_entries", side_effect=err):
+        with mock.patch("common.log.log_writeback_failed") as log_failed:
+            assert writer.flush() == 1
+            log_failed.assert_called_once_with(1, "boom")
+    assert written == [2]
+
+
+def test_bulk_writer_skips_unmatched_ops(mongo_service):
+    # job 2 was paused, removed or re-leased while sending
+    mongo_service.main_collection.insert_many([{"_id": 1}, {"_id": 2, "lease": "b"}])
+    written = []
+    writer = BulkWriter(mongo_service, lambda u, i: written.append(i))
+    writer.add({"_id": 1}, {"x": 1})
+    writer.add({"_id": 2, "lease": "a"}, {"x": 2})
+
+    with mock.patch("common.log.log_writeback_failed") as log_failed:
+        assert writer.flush() == 1
+        log_failed.assert_not_called()
+    assert written == [1]
@@ -0,0 +1,9 @@
+import pytest
+
+from dispatch.ratelimit import limiter
+
+
+@pytest.fixture(autouse=True)
+def reset_limiter():
+    limiter.buckets.clear()
+    yield
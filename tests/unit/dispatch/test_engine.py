@@ -0,0 +1,316 @@
+import asyncio
+from unittest import mock
+import pytest
+
+from database.dbutils import dbutils_quota
+from dispatch import engine
+
+
+@pytest.fixture
+def mock_job():
+    return {
+        "_id": 1,
+        "chat_id": 1,
+        "jobname": "test_job_1",
+        "created_by": 1,
+        "created_ts": 1,
+        "removed_ts": "",
+        "crontab": "0 * * * *",
+        "content": "hello",
+        "content_type": "text",
+        "nextrun_ts": "2012-02-11 08:22",
+        "errors": [],
+    }
+
+
+@pytest.mark.asyncio
+@mock.patch("common.utils.calc_next_run", mock.MagicMock(return_value=("a", "b")))
+async def test_process_job(mongo_service, mock_group, mock_job):
+    mongo_service.insert_new_chat(mock_group)
+    mongo_service.main_collection.insert_one(mock_job)
+
+    resp = (200, {"ok": True, "result": {"message_id": 5}})
+    with mock.patch("teleapi.async_endpoints.send_text", return_value=resp) as send:
+        await engine.run(mongo_service, [mock_job], "2012-02-11 08:22")
+        send.assert_awaited_once()
+
+    res = mongo_service.find_one_entry({"_id": 1})
+    assert res["pending_ts"] is None
+    assert res["nextrun_ts"] == "b"
+    assert res["user_nextrun_ts"] == "a"
+    assert res["previous_message_id"] == "5"
+    assert res["errors"] == []
+
+
+@pytest.mark.asyncio
+@mock.patch("common.utils.calc_next_run", mock.MagicMock(return_value=("a", "b")))
+async def test_process_job_error(mongo_service, mock_group, mock_job):
+    mongo_service.insert_new_chat(mock_group)
+    mongo_service.main_collection.insert_one(mock_job)
+
+    resp = (400, {"ok": False, "description": "Bad Request"})
+    with mock.patch("teleapi.async_endpoints.send_text", return_value=resp):
+        await engine.run(mongo_service, [mock_job], "2012-02-11 08:22")
+
+    error = {"error": "Error 400: Bad Request", "timestamp": "2012-02-11 08:22"}
+    res = mongo_service.find_one_entry({"_id": 1})
+    assert res["errors"] == [error]
+    assert res["error_count"] == 1
+    assert res["last_error"] == error
+    assert res["removed_ts"] == ""
+    history = mongo_service.find_job_errors({"job_id": 1})
+    assert [{k: x[k] for k in error} for x in history] == [error]
+
+
+@pytest.mark.asyncio
+@mock.patch("common.utils.calc_next_run", mock.MagicMock(return_value=("a", "b")))
+@mock.patch("config.JOB_ERRORS_KEPT", 2)
+async def test_process_job_error_history_bounded(mongo_service, mock_group, mock_job):
+    mongo_service.insert_new_chat(mock_group)
+    mock_job["errors"] = [{"error": str(i), "timestamp": ""} for i in range(3)]
+    mongo_service.main_collection.insert_one(mock_job)
+
+    resp = (400, {"ok": False, "description": "Bad Request"})
+    with mock.patch("teleapi.async_endpoints.send_text", return_value=resp):
+        await engine.run(mongo_service, [mock_job], "2012-02-11 08:22")
+
+    res = mongo_service.find_one_entry({"_id": 1})
+    assert [x["error"] for x in res["errors"]] == ["2", "Error 400: Bad Request"]
+    assert res["error_count"] == 4  # counted from the errors it had before
+
+
+@pytest.mark.asyncio
+@mock.patch("common.utils.calc_next_run", mock.MagicMock(return_value=("a", "b")))
+async def test_process_job_error_legacy_count(mongo_service, mock_group, mock_job):
+    mongo_service.insert_new_chat(mock_group)
+    # failed once before error_count existed, no extra retry for it
+    mock_job["errors"] = [{"error": "Error 400: Bad Request", "timestamp": ""}]
+    mongo_service.main_collection.insert_one(mock_job)
+
+    resp = (400, {"ok": False, "description": "Bad Request"})
+    with mock.patch("teleapi.async_endpoints.send_text", return_value=resp):
+        await engine.run(mongo_service, [{"_id": 1}], "2012-02-11 08:22")
+
+    res = mongo_service.find_one_entry({"_id": 1})
+    assert res["error_count"] == 2
+    assert res["state"] == "removed"
+
+
+@pytest.mark.asyncio
+@mock.patch("common.utils.calc_next_run", mock.MagicMock(return_value=("a", "b")))
+async def test_process_job_success_resets_errors(mongo_service, mock_group, mock_job):
+    mongo_service.insert_new_chat(mock_group)
+    mock_job["error_count"] = 1
+    mock_job["last_error"] = {"error": "Error 400: Bad Request", "timestamp": ""}
+    mock_job["errors"] = [mock_job["last_error"]]
+    mongo_service.main_collection.insert_one(mock_job)
+
+    resp = (200, {"ok": True, "result": {"message_id": 5}})
+    with mock.patch("teleapi.async_endpoints.send_text", return_value=resp):
+        await engine.run(mongo_service, [mock_job], "2012-02-11 08:22")
+
+    res = mongo_service.find_one_entry({"_id": 1})
+    assert res["error_count"] == 0
+    assert res["last_error"] is None
+    # a later removal for another reason mustn't look like a send failure to revive
+    assert res["errors"] == []
+
+
+@pytest.mark.asyncio
+@mock.patch("dispatch.jobs.minute_deadline", mock.MagicMock(return_value=float("inf")))
+@mock.patch("common.utils.calc_next_run", mock.MagicMock(return_value=("a", "b")))
+async def test_process_job_rate_limited_requeued(mongo_service, mock_group, mock_job):
+    mongo_service.insert_new_chat(mock_group)
+    mongo_service.main_collection.insert_one(mock_job)
+
+    resp_429 = (429, {"ok": False, "parameters": {"retry_after": 0}})
+    resp_200 = (200, {"ok": True, "result": {"message_id": 5}})
+    with mock.patch(
+        "teleapi.async_endpoints.send_text", side_effect=[resp_429, resp_200]
+    ) as send:
+        await engine.run(mongo_service, [mock_job], "2012-02-11 08:22")
+        assert send.await_count == 2
+
+    res = mongo_service.find_one_entry({"_id": 1})
+    assert res["nextrun_ts"] == "b"
+    assert res["previous_message_id"] == "5"
+    assert res["errors"] == []
+
+
+@pytest.mark.asyncio
+@mock.patch("dispatch.jobs.minute_deadline", mock.MagicMock(return_value=0))
+async def test_process_job_rate_limited_released(mongo_service, mock_group, mock_job):
+    mongo_service.insert_new_chat(mock_group)
+    mongo_service.main_collection.insert_one(mock_job)
+
+    resp = (429, {"ok": False, "parameters": {"retry_after": 30}})
+    with mock.patch("teleapi.async_endpoints.send_text", return_value=resp):
+        await engine.run(mongo_service, [mock_job], "2012-02-11 08:22")
+
+    res = mongo_service.find_one_entry({"_id": 1})
+    assert res["pending_ts"] is None
+    assert res["nextrun_ts"] == "2012-02-11 08:22"
+    assert res["removed_ts"] == ""
+    assert res["errors"] == []
+
+
+@pytest.mark.asyncio
+async def test_process_job_claimed_elsewhere(mongo_service, mock_group, mock_job):
+    mongo_service.insert_new_chat(mock_group)
+    mock_job["pending_ts"] = "2012-02-11 08:22"
+    mock_job["lease_owner"] = "other-dispatcher"
+    mock_job["lease_expires_ts"] = "2999-01-01 00:00"
+    mongo_service.main_collection.insert_one(mock_job)
+
+    with mock.patch("teleapi.async_endpoints.send_text") as send:
+        await engine.run(mongo_service, [mock_job], "2012-02-11 08:22")
+        send.assert_not_awaited()
+
+    res = mongo_service.find_one_entry({"_id": 1})
+    assert res["lease_owner"] == "other-dispatcher"
+    assert res["nextrun_ts"] == "2012-02-11 08:22"
+
+
+@pytest.mark.asyncio
+@mock.patch("dispatch.jobs.minute_deadline", mock.MagicMock(return_value=float("inf")))
+async def test_run_prefetches_chats_once(mongo_service, mock_group, mock_job):
+    mock_group["tz_offset"] = -5
+    mongo_service.insert_new_chat(mock_group)
+    second_job = {**mock_job, "_id": 2, "jobname": "test_job_2"}
+    mongo_service.main_collection.insert_many([mock_job, second_job])
+
+    resp = (200, {"ok": True, "result": {"message_id": 5}})
+    calc = mock.MagicMock(return_value=("a", "b"))
+    with mock.patch("teleapi.async_endpoints.send_text", return_value=resp), mock.patch(
+        "common.utils.calc_next_run", calc
+    ), mock.patch.object(
+        mongo_service, "find_chat_entries", wraps=mongo_service.find_chat_entries
+    ) as find_chats:
+        await engine.run(mongo_service, [mock_job, second_job], "2012-02-11 08:22")
+        find_chats.assert_called_once()
+
+    calc.assert_called_with("0 * * * *", -5)
+    assert calc.call_count == 2
+
+
+@pytest.mark.asyncio
+@mock.patch("dispatch.jobs.minute_deadline", mock.MagicMock(return_value=float("inf")))
+@mock.patch("config.DISPATCH_CURSOR_BATCH_SIZE", 1)
+@mock.patch("common.utils.calc_next_run", mock.MagicMock(return_value=("a", "b")))
+async def test_run_streams_in_chunks(mongo_service, mock_group, mock_job):
+    mongo_service.insert_new_chat(mock_group)
+    jobs = [{**mock_job, "_id": i, "jobname": f"job_{i}"} for i in range(1, 4)]
+    mongo_service.main_collection.insert_many(jobs)
+
+    resp = (200, {"ok": True, "result": {"message_id": 5}})
+    entries = iter([{"_id": i} for i in range(1, 4)])
+    with mock.patch("teleapi.async_endpoints.send_text", return_value=resp) as send:
+        assert await engine.run(mongo_service, entries, "2012-02-11 08:22") == 3
+        assert send.await_count == 3
+
+    assert mongo_service.count_entries({"nextrun_ts": "b"}) == 3
+
+
+@pytest.mark.asyncio
+@mock.patch("config.DISPATCH_CURSOR_BATCH_SIZE", 1)
+@mock.patch("common.utils.calc_next_run", mock.MagicMock(return_value=("a", "b")))
+async def test_run_cleans_up_when_cursor_fails(mongo_service, mock_group, mock_job):
+    mongo_service.insert_new_chat(mock_group)
+    mongo_service.main_collection.insert_one(mock_job)
+
+    def entries():
+        yield {"_id": 1}
+        raise RuntimeError("cursor died")
+
+    flush = mock.patch("database.writeback.BulkWriter.flush", autospec=True)
+    with flush as flushed, pytest.raises(RuntimeError):
+        await engine.run(mongo_service, entries(), "2012-02-11 08:22")
+    flushed.assert_called()
+    # no worker or flusher left behind
+    assert asyncio.all_tasks() == {asyncio.current_task()}
+
+
+@pytest.mark.asyncio
+@mock.patch("common.utils.calc_next_run", mock.MagicMock(return_value=("a", "b")))
+async def test_process_job_paused_while_sending(mongo_service, mock_group, mock_job):
+    mongo_service.insert_new_chat(mock_group)
+    mongo_service.main_collection.insert_one(mock_job)
+
+    async def pause(*args, **kwargs):
+        update = {"paused_ts": "2012-02-11 08:22", "state": "paused"}
+        mongo_service.update_entry({"_id": 1}, update)
+        return 200, {"ok": True, "result": {"message_id": 5}}
+
+    with mock.patch("teleapi.async_endpoints.send_text", side_effect=pause):
+        await engine.run(mongo_service, [mock_job], "2012-02-11 08:22")
+
+    # the completion must not flip the job back to active
+    res = mongo_service.find_one_entry({"_id": 1})
+    assert res["state"] == "paused"
+    assert res["nextrun_ts"] == "2012-02-11 08:22"
+
+
+@pytest.mark.asyncio
+@mock.patch("common.utils.calc_next_run", mock.MagicMock(return_value=("a", "b")))
+async def test_process_job_removed_releases_quota(mongo_service, mock_group, mock_job):
+    mongo_service.insert_new_chat(mock_group)
+    mock_job["errors"] = [{"error": "Error 400: Bad Request", "timestamp": ""}]
+    mock_job["error_count"] = 1
+    mongo_service.main_collection.insert_one(mock_job)
+    dbutils_quota.reset_user_quota(mongo_service, 1, 1, None)
+
+    resp = (400, {"ok": False, "description": "Bad Request"})
+    with mock.patch("teleapi.async_endpoints.send_text", return_value=resp):
+        await engine.run(mongo_service, [mock_job], "2012-02-11 08:22")
+
+    assert mongo_service.find_one_entry({"_id": 1})["state"] == "removed"
+    assert dbutils_quota.find_user_quota(mongo_service, 1)["job_count"] == 0
+
+
+@pytest.mark.asyncio
+@mock.patch("common.utils.calc_next_run", mock.MagicMock(return_value=("a", "b")))
+async def test_process_job_deleted_while_failing(mongo_service, mock_group, mock_job):
+    mongo_service.insert_new_chat(mock_group)
+    mock_job["error_count"] = 1
+    mongo_service.main_collection.insert_one(mock_job)
+    dbutils_quota.reset_user_quota(mongo_service, 1, 0, None)  # /delete released it
+
+    async def delete(*args, **kwargs):
+        update = {"removed_ts": "2012-02-11 08:22", "state": "removed"}
+        mongo_service.update_entry({"_id": 1}, update)
+        return 400, {"ok": False, "description": "Bad Request"}
+
+    with mock.patch("teleapi.async_endpoints.send_text", side_effect=delete):
+        await engine.run(mongo_service, [mock_job], "2012-02-11 08:22")
+
+    # the completion matched nothing, so none of its side effects happen
+    assert dbutils_quota.find_user_quota(mongo_service, 1)["job_count"] == 0
+    assert mongo_service.find_job_errors({"job_id": 1}) == []
+
+
+@pytest.mark.asyncio
+@mock.patch("dispatch.jobs.minute_deadline", mock.MagicMock(return_value=float("inf")))
+@mock.patch("config.BATCH_SIZE", 1)
+@mock.patch("common.utils.calc_next_run", mock.MagicMock(return_value=("a", "b")))
+async def test_throttled_job_frees_worker(mongo_service, mock_group, mock_job):
+    mongo_service.insert_new_chat(mock_group)
+    mongo_service.main_collection.insert_many(
+        [mock_job, {**mock_job, "_id": 2, "chat_id": 2, "jobname": "test_job_2"}]
+    )
+
+    # chat 1 is over its limit, its job waits for the slot off the worker
+    delays = {1: [0.2], 2: [0.0]}
+    reserve = lambda token, chat_id, cost: delays[chat_id].pop(0)
+    sent = []
+
+    async def send(chat_id, *args, **kwargs):
+        sent.append(chat_id)
+        return 200, {"ok": True, "result": {"message_id": 5}}
+
+    with mock.patch("dispatch.ratelimit.limiter.reserve", side_effect=reserve):
+        with mock.patch("teleapi.async_endpoints.send_text", side_effect=send):
+            await engine.run(mongo_service, [mock_job, {"_id": 2}], "2012-02-11 08:22")
+
+    # reserved once, sent after the other chat
+    assert sent == [2, 1]
+    assert mongo_service.count_entries({"nextrun_ts": "b"}) == 2
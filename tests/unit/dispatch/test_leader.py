@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from database.dbutils import dbutils_lock
+from dispatch.leader import LeaderLock
+
+
+def test_acquire_lock(mongo_service):
+    assert dbutils_lock.acquire_lock(mongo_service, "scheduler", "a", 15)
+    # held by a, others are turned away until it expires
+    assert not dbutils_lock.acquire_lock(mongo_service, "scheduler", "b", 15)
+    # the holder can renew
+    assert dbutils_lock.acquire_lock(mongo_service, "scheduler", "a", 15)
+
+    expired = datetime.now(timezone.utc) - timedelta(seconds=1)
+    mongo_service.lock_collection.update_one(
+        {"_id": "scheduler"}, {"$set": {"expires_at": expired}}
+    )
+    assert dbutils_lock.acquire_lock(mongo_service, "scheduler", "b", 15)
+    assert mongo_service.lock_collection.find_one()["owner"] == "b"
+
+
+def test_release_lock(mongo_service):
+    dbutils_lock.acquire_lock(mongo_service, "scheduler", "a", 15)
+    dbutils_lock.release_lock(mongo_service, "scheduler", "b")  # not the owner
+    assert not dbutils_lock.acquire_lock(mongo_service, "scheduler", "b", 15)
+
+    dbutils_lock.release_lock(mongo_service, "scheduler", "a")
+    assert dbutils_lock.acquire_lock(mongo_service, "scheduler", "b", 15)
+
+
+def test_leader_lock_failover(mongo_service):
+    leader = LeaderLock("scheduler", "a")
+    follower = LeaderLock("scheduler", "b")
+
+    assert leader.heartbeat()
+    assert not follower.heartbeat()
+    assert leader.is_leader and not follower.is_leader
+
+    leader.release()
+    assert not leader.is_leader
+    assert follower.heartbeat()
+    assert follower.is_leader
+
+
+def test_leader_lock_heartbeat_error(mongo_service):
+    leader = LeaderLock("scheduler", "a")
+    assert leader.heartbeat()
+
+    # can't prove we still hold the lock, so stop acting as leader
+    with mock.patch("database.dbutils.dbutils.acquire_lock", side_effect=OSError):
+        assert not leader.heartbeat()
+    assert not leader.is_leader
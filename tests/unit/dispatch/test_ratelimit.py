@@ -0,0 +1,47 @@
+from unittest import mock
+import pytest
+
+from dispatch.ratelimit import RateLimiter, TokenBucket
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=1, capacity=2)
+    assert bucket.reserve(bucket.updated) == 0
+    assert bucket.reserve(bucket.updated) == 0
+    assert bucket.reserve(bucket.updated) == 1
+    assert bucket.reserve(bucket.updated) == 2
+    assert bucket.reserve(bucket.updated + 10) == 0
+
+
+@mock.patch("time.monotonic", mock.MagicMock(return_value=100))
+def test_per_chat_limit():
+    limiter = RateLimiter()
+    assert limiter.reserve("token", 1) == 0
+    assert limiter.reserve("token", 1) == 1
+    assert limiter.reserve("token", 2) == 0
+
+
+@mock.patch("time.monotonic", mock.MagicMock(return_value=100))
+@mock.patch("config.RATE_LIMIT_PER_CHAT", 100)
+def test_per_bot_limit():
+    limiter = RateLimiter()
+    delays = [limiter.reserve("token", chat_id) for chat_id in range(31)]
+    assert delays[:30] == [0] * 30
+    assert delays[30] == pytest.approx(1 / 30)
+    assert limiter.reserve("other_token", 100) == 0
+
+
+@mock.patch("time.monotonic", mock.MagicMock(return_value=100))
+@mock.patch("config.RATE_LIMIT_PER_CHAT", 100)
+def test_per_group_limit():
+    limiter = RateLimiter()
+    delays = [limiter.reserve(str(i), -1) for i in range(21)]
+    assert delays[:20] == [0] * 20
+    assert delays[20] == pytest.approx(3)
+
+
+@mock.patch("time.monotonic", mock.MagicMock(return_value=100))
+def test_media_group_cost():
+    limiter = RateLimiter()
+    assert limiter.reserve("token", 1, cost=3) == 0
+    assert limiter.reserve("token", 1) == 3
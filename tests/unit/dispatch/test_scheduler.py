@@ -0,0 +1,100 @@
+import asyncio
+from unittest import mock
+import pytest
+
+from common import utils
+from database.dbutils import dbutils_job
+from dispatch.scheduler import TimerScheduler
+
+
+def epoch(ts):
+    return utils.parse_db_time(ts).timestamp()
+
+
+def test_heap_order():
+    scheduler = TimerScheduler(mock.AsyncMock())
+    scheduler.push(1, "2012-02-11 08:25")
+    scheduler.push(2, "2012-02-11 08:22")
+    scheduler.push(3, "2012-02-11 08:23")
+    assert scheduler.next_due() == epoch("2012-02-11 08:22")
+
+    assert scheduler.pop_due(epoch("2012-02-11 08:23")) == 2
+    assert scheduler.next_due() == epoch("2012-02-11 08:25")
+
+
+def test_heap_edits():
+    scheduler = TimerScheduler(mock.AsyncMock())
+    scheduler.push(1, "2012-02-11 08:22")
+    scheduler.push(2, "2012-02-11 08:23")
+
+    scheduler.push(1, "2012-02-11 08:30")  # rescheduled
+    scheduler.push(2, None)  # paused or removed
+    assert scheduler.next_due() == epoch("2012-02-11 08:30")
+    assert scheduler.pop_due(epoch("2012-02-11 08:29")) == 0
+
+
+def test_load(mongo_service):
+    jobs = [
+        {"_id": 1, "crontab": "* * * * *", "nextrun_ts": "2012-02-11 08:22"},
+        {"_id": 2, "crontab": "* * * * *", "nextrun_ts": "2012-02-11 08:21"},
+        {"_id": 3, "crontab": "", "nextrun_ts": ""},
+        {"_id": 4, "crontab": "* * * * *", "nextrun_ts": "2012-02-11 08:20"},
+        {"_id": 5, "crontab": "* * * * *", "nextrun_ts": "2012-02-11 08:20"},
+    ]
+    for job in jobs:
+        job["removed_ts"] = ""
+    jobs[3]["paused_ts"] = "2012-02-11 08:00"
+    jobs[4]["removed_ts"] = "2012-02-11 08:00"
+    mongo_service.main_collection.insert_many(jobs)
+
+    res = dbutils_job.find_scheduled_nextruns(mongo_service)
+    assert set(entry["_id"] for entry in res) == set([1, 2])
+
+    res = dbutils_job.find_earliest_nextrun(mongo_service)
+    assert res["_id"] == 2
+
+
+@pytest.mark.parametrize(
+    "update, expected",
+    [
+        ({"nextrun_ts": "2012-02-11 08:22"}, [(1, "2012-02-11 08:22")]),
+        ({"paused_ts": "2012-02-11 08:00"}, [(1, None)]),
+        ({"removed_ts": "2012-02-11 08:00"}, [(1, None)]),
+        (
+            {"paused_ts": "", "nextrun_ts": "2012-02-11 08:22"},
+            [(1, "2012-02-11 08:22")],
+        ),
+        ({"pending_ts": "2012-02-11 08:00"}, []),
+    ],
+)
+def test_notify_nextrun(update, expected):
+    calls = []
+    with mock.patch.object(
+        dbutils_job, "nextrun_listeners", [lambda *a: calls.append(a)]
+    ):
+        dbutils_job.notify_nextrun(update, 1)
+    assert calls == expected
+
+
+@pytest.mark.asyncio
+@mock.patch("config.SCHEDULER_RETRY_SECS", 0)
+async def test_run_forever_survives_errors():
+    dispatch = mock.AsyncMock(side_effect=[RuntimeError("mongo down"), None])
+    scheduler = TimerScheduler(dispatch)
+
+    async def load():
+        scheduler.push(1, "2012-02-11 08:22")  # long due
+
+    with mock.patch.object(scheduler, "load", side_effect=load) as loaded:
+        task = asyncio.create_task(scheduler.run_forever())
+        for _ in range(100):
+            if dispatch.await_count == 2:
+                break
+            await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    # reloaded after the failed dispatch and fired the job again
+    assert loaded.await_count == 2
+    assert dispatch.await_count == 2
+    assert scheduler.notify not in dbutils_job.nextrun_listeners
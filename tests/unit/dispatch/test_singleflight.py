@@ -0,0 +1,50 @@
+import asyncio
+from unittest import mock
+import pytest
+
+from common import metrics
+from dispatch import singleflight
+
+
+@pytest.mark.asyncio
+async def test_run_exclusive_skips_overlapping_run():
+    started, release = asyncio.Event(), asyncio.Event()
+    calls = []
+
+    async def slow_run():
+        calls.append(1)
+        started.set()
+        await release.wait()
+
+    first = asyncio.create_task(singleflight.run_exclusive(slow_run))
+    await started.wait()
+    skipped = metrics.dispatch_runs_skipped._value.get()
+
+    assert await singleflight.run_exclusive(slow_run) is False
+    assert metrics.dispatch_runs_skipped._value.get() == skipped + 1
+
+    release.set()
+    assert await first is True
+    assert calls == [1]
+    assert not singleflight.run_lock.locked()
+
+
+@pytest.mark.asyncio
+async def test_run_exclusive_releases_on_error():
+    async def failing_run():
+        raise ValueError
+
+    with pytest.raises(ValueError):
+        await singleflight.run_exclusive(failing_run)
+    assert not singleflight.run_lock.locked()
+
+
+@pytest.mark.asyncio
+@mock.patch("dispatch.jobs.minute_deadline", mock.MagicMock(return_value=0))
+async def test_run_exclusive_counts_overrun():
+    async def run():
+        pass
+
+    overruns = metrics.dispatch_run_overruns._value.get()
+    assert await singleflight.run_exclusive(run) is True
+    assert metrics.dispatch_run_overruns._value.get() == overruns + 1
@@ -0,0 +1,27 @@
+from unittest import mock
+
+from dispatch.stats import RunStats
+
+
+def test_queue_depth():
+    stats = RunStats(2)
+    stats.enqueue(3)
+    stats.dequeue()
+    stats.enqueue()
+    stats.dequeue()
+    assert stats.depth == 2
+    assert stats.max_depth == 3
+
+
+@mock.patch("time.monotonic")
+def test_quantiles(monotonic):
+    monotonic.return_value = 0
+    stats = RunStats(1)
+    for elapsed in range(1, 101):
+        monotonic.return_value = elapsed
+        stats.record(0)
+
+    res = stats.quantiles()
+    assert res[0.5] == 51
+    assert res[0.95] == 96
+    assert res[0.99] == 100
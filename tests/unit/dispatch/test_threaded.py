@@ -0,0 +1,50 @@
+from unittest import mock
+import pytest
+
+from dispatch import threaded
+
+
+@pytest.fixture
+def mock_job():
+    return {
+        "_id": 1,
+        "chat_id": 1,
+        "jobname": "test_job_1",
+        "created_by": 1,
+        "created_ts": 1,
+        "removed_ts": "",
+        "crontab": "0 * * * *",
+        "content": "hello",
+        "content_type": "text",
+        "nextrun_ts": "2012-02-11 08:22",
+        "errors": [],
+    }
+
+
+@mock.patch("config.BATCH_SIZE", 1)
+@mock.patch("dispatch.jobs.minute_deadline", mock.MagicMock(return_value=float("inf")))
+@mock.patch("common.utils.calc_next_run", mock.MagicMock(return_value=("a", "b")))
+def test_throttled_job_frees_worker(mongo_service, mock_group, mock_job):
+    mongo_service.insert_new_chat(mock_group)
+    mongo_service.main_collection.insert_many(
+        [mock_job, {**mock_job, "_id": 2, "chat_id": 2, "jobname": "test_job_2"}]
+    )
+
+    # chat 1 is over its limit, its job waits for the slot off the worker thread
+    delays = {1: [0.2], 2: [0.0]}
+    reserve = lambda token, chat_id, cost: delays[chat_id].pop(0)
+    sent = []
+
+    def send(chat_id, *args, **kwargs):
+        sent.append(chat_id)
+        resp = mock.Mock(status_code=200)
+        resp.json.return_value = {"ok": True, "result": {"message_id": 5}}
+        return resp
+
+    with mock.patch("dispatch.ratelimit.limiter.reserve", side_effect=reserve):
+        with mock.patch("teleapi.endpoints.send_text", side_effect=send):
+            threaded.run(mongo_service, [mock_job, {"_id": 2}], "2012-02-11 08:22")
+
+    # reserved once, sent after the other chat
+    assert sent == [2, 1]
+    assert mongo_service.count_entries({"nextrun_ts": "b"}) == 2